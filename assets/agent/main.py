@@ -6,7 +6,12 @@ from pathlib import Path
 
 current_script_path = os.path.abspath(__file__)
 current_script_dir = os.path.dirname(current_script_path)
-script_root_dir = os.path.dirname(current_script_dir)
+# 以 agent.pyz 執行時 __file__ 位於壓縮檔內，agent 目錄為壓縮檔所在的目錄
+if os.path.isfile(current_script_dir):
+    agent_dir = os.path.dirname(current_script_dir)
+else:
+    agent_dir = current_script_dir
+script_root_dir = os.path.dirname(agent_dir)
 
 if os.getcwd() != script_root_dir:
     os.chdir(script_root_dir)
@@ -18,6 +23,7 @@ VENV_NAME = ".venv"  # 虛擬環境目錄的名稱
 VENV_DIR = Path(script_root_dir) / VENV_NAME
 
 from my_utils import get_logger, get_interface_mode
+from my_state import read_json, write_json
 
 logger = get_logger(__name__)
 
@@ -132,12 +138,10 @@ def read_pip_config() -> dict:
         "backup_mirror": "https://pypi.tuna.tsinghua.edu.cn/simple",
     }
     if not config_path.exists():
-        with open(config_path, "w", encoding="utf-8") as f:
-            json.dump(default_config, f, indent=4, ensure_ascii=False)
+        write_json(config_path, default_config)
         return default_config
     try:
-        with open(config_path, "r", encoding="utf-8") as f:
-            return json.load(f)
+        return read_json(config_path, default_config)
     except Exception:
         logger.exception("讀取 pip 配置失敗，使用默認配置")
         return default_config
@@ -147,8 +151,31 @@ def read_pip_config() -> dict:
 
 
 def find_local_wheels_dir():
-    """查找本地 deps 目錄中的 whl 檔案"""
+    """
+    查找本地 deps 目錄中的 whl 檔案，有 download_deps.py 產生的清單時
+    只檢查清單中的檔案是否完整，不需要列出目錄
+    """
     deps_dir = Path(script_root_dir) / "deps"
+    manifest_path = deps_dir / "manifest.json"
+
+    if manifest_path.exists():
+        try:
+            with open(manifest_path, encoding="utf-8") as f:
+                wheels = json.load(f)["wheels"]
+            missing = [
+                wheel["file"]
+                for wheel in wheels
+                if not (deps_dir / wheel["file"]).is_file()
+                or (deps_dir / wheel["file"]).stat().st_size != wheel["size"]
+            ]
+        except Exception:
+            logger.exception("讀取 deps 清單失敗")
+            return None
+        if missing:
+            logger.warning(f"deps 目錄缺少或損壞 {len(missing)} 個 whl 檔案: {missing}")
+            return None
+        logger.info(f"依清單使用本地 deps 目錄的 {len(wheels)} 個 whl 檔案")
+        return deps_dir
 
     if deps_dir.exists() and any(deps_dir.glob("*.whl")):
         whl_count = len(list(deps_dir.glob("*.whl")))
@@ -159,6 +186,63 @@ def find_local_wheels_dir():
     return None
 
 
+def _installed_version(name: str) -> str | None:
+    from importlib import metadata
+
+    try:
+        return metadata.version(name)
+    except metadata.PackageNotFoundError:
+        return None
+
+
+def _same_version(a: str | None, b: str) -> bool:
+    # 套件版本可能帶有 v 前綴，例如 MaaFw 的 v5.14.3
+    return a is not None and a.lower().lstrip("v") == b.lower().lstrip("v")
+
+
+def install_locked_requirements(deps_dir: Path) -> bool:
+    """
+    依 download_deps.py 產生的鎖定檔安裝，不解析依賴，只使用本地 deps，
+    已安裝的版本與鎖定檔相同時不執行 pip
+    """
+    try:
+        with open(deps_dir / "manifest.json", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except Exception:
+        logger.exception("讀取 deps 清單失敗")
+        return False
+
+    python_version = f"{sys.version_info.major}.{sys.version_info.minor}"
+    if manifest.get("python_version") != python_version:
+        logger.warning(
+            f"deps 是為 Python {manifest.get('python_version')} 準備的，"
+            f"目前為 {python_version}，不使用鎖定檔"
+        )
+        return False
+
+    wheels = manifest["wheels"]
+    if all(_same_version(_installed_version(w["name"]), w["version"]) for w in wheels):
+        logger.info(f"已安裝鎖定的 {len(wheels)} 個依賴，跳過安裝")
+        return True
+
+    cmd = [
+        sys.executable,
+        "-m",
+        "pip",
+        "install",
+        "-r",
+        str(deps_dir / "requirements.lock"),
+        "--no-deps",  # 鎖定檔已包含所有依賴，不需要解析
+        "--require-hashes",
+        "--no-warn-script-location",
+        "--break-system-packages",
+        "--find-links",
+        str(deps_dir),
+        "--no-index",
+    ]
+    return run_pip_command(cmd, "依鎖定檔安裝依賴")
+
+
 def run_pip_command(cmd_args: list[str], operation_name: str) -> bool:
     try:
         logger.info(f"開始 {operation_name}")
@@ -214,6 +298,11 @@ def install_requirements(req_file="requirements.txt", pip_config=None) -> bool:
 
     # 查找本地 deps 目錄
     deps_dir = find_local_wheels_dir()
+    if deps_dir and (deps_dir / "requirements.lock").exists():
+        if install_locked_requirements(deps_dir):
+            return True
+        logger.warning("依鎖定檔安裝失敗，改為解析 requirements.txt")
+
     if deps_dir:
         logger.info(f"使用本地 whl 檔案安裝，目錄: {deps_dir}")
 
@@ -314,6 +403,10 @@ def run_agent():
 
         import my_action
         import my_reco
+        import my_watchdog
+        import my_warmup
+        import my_profiler
+        import my_memory
 
         Toolkit.init_option("./")
 
@@ -1,3 +1,4 @@
+import re
 import json
 import time
 from pathlib import Path
@@ -9,12 +10,64 @@ from maa.custom_action import CustomAction
 from maa.context import Context
 
 from my_utils import is_new_period, get_logger
+from my_hooks import instrument
+from my_postmortem import flush_postmortem
+from my_override import OverrideManager
+from my_state import (
+    RECORD_PATH,
+    read_agent_config,
+    update_json,
+    append_journal,
+    read_journal,
+    clear_journal,
+    read_task_overrides,
+)
 from my_reco import VerifyTime
 
 logger = get_logger(__name__)
 
+SUPPLYOFFICE_JOURNAL_PATH = Path("config/supplyoffice_journal.jsonl")
+# 執行時由 JournalSupplyOfficeStep 先寫入日誌再點擊的節點與對應的步驟
+SUPPLYOFFICE_JOURNAL_STEPS = {
+    "EnterSupplyOfficeItemDetail": "entered",
+    "AutoBuySupplyOfficeProduct": "found",
+    "SupplyOfficeProductObtained": "bought",
+}
+# 中斷在各步驟之後時，繼續採購的節點
+SUPPLYOFFICE_RESUME_NODES = {
+    "entered": "AutoBuySupplyOfficeProduct",
+    "found": "VerifySupplyOfficeProduct",
+}
+# 執行後不需再掃蕩其他記憶風暴關卡的節點
+STORMYMEMORIES_STOP_NODES = {
+    "SkipRaidStormyMemoriesItem": "體力不足",
+    "RecordStormyMemories": "今日掃蕩次數已用完",
+}
+
+
+def read_raid_times(context: Context, image, roi: list[int]) -> int | None:
+    """辨識 roi 內的數字，辨識失敗回傳 None"""
+    detail = context.run_recognition(
+        "MyCustomOCR",
+        image,
+        pipeline_override={"MyCustomOCR": {"roi": roi, "expected": "\\d+"}},
+    )
+    if not detail or not detail.hit:
+        return None
+    digits = re.search(r"\d+", detail.best_result.text)
+    return int(digits.group()) if digits else None
+
+
+def get_supplyoffice_page(item: dict) -> str:
+    """以分頁與子分頁的 expected 作為商品所在頁面的識別"""
+    override = item["pipeline_override"]
+    item_expected = override["EnterSupplyOfficeItem"]["expected"]
+    detail_expected = override["EnterSupplyOfficeItemDetail"]["expected"]
+    return f"{item_expected}/{detail_expected}"
+
 
 @AgentServer.custom_action("BuySupplyOfficeProduct")
+@instrument
 class BuySupplyOfficeProduct(CustomAction):
 
     def run(
@@ -56,77 +109,183 @@ class BuySupplyOfficeProduct(CustomAction):
             logger.error("讀取 maa config 檔案失敗")
             return False
 
-        # 新增 minos_data.json 檔案
-        RECORD_PATH = Path("config/minos_data.json")
-        if not RECORD_PATH.exists():
-            try:
-                RECORD_PATH.parent.mkdir(parents=True, exist_ok=True)
-                with open(RECORD_PATH, "w", encoding="utf-8") as f:
-                    json.dump({}, f, indent=4, ensure_ascii=False)
-            except Exception:
-                logger.exception(f"寫入 {RECORD_PATH} 失敗")
-                return False
-
         # 確保所有商品都已初始化
         try:
-            with open(RECORD_PATH, encoding="utf-8") as f:
-                record_data = json.load(f)
-            if "採購部" not in record_data:
-                record_data["採購部"] = {}
-            for key in SUPPLYOFFICE_PRODUCTS.keys():
-                record_data["採購部"].setdefault(key, {})
-                record_data["採購部"][key].setdefault("last_purchased_time", 0)
-                record_data["採購部"][key]["is_purchasing"] = False
-            with open(RECORD_PATH, "w", encoding="utf-8") as f:
-                json.dump(record_data, f, indent=4, ensure_ascii=False)
+            with update_json(RECORD_PATH) as record_data:
+                record_data.setdefault("採購部", {})
+                for key in SUPPLYOFFICE_PRODUCTS.keys():
+                    record_data["採購部"].setdefault(key, {})
+                    record_data["採購部"][key].setdefault("last_purchased_time", 0)
         except Exception:
             logger.exception("初始化商品失敗")
             return False
 
-        # 執行採購流程
-        for key, item in SUPPLYOFFICE_PRODUCTS.items():
-            last_time = record_data["採購部"][key]["last_purchased_time"]
-            period_type = item["period_type"]
-            if not (supply_options[key] == "Yes" or supply_options[key] == 0):
+        # 重放採購日誌，恢復上次中斷前的進度
+        try:
+            journal = read_journal(SUPPLYOFFICE_JOURNAL_PATH)
+        except Exception:
+            logger.exception(f"讀取 {SUPPLYOFFICE_JOURNAL_PATH} 失敗")
+            journal = []
+        bought_time = {}
+        resume_key = resume_step = None
+        for entry in journal:
+            key = entry.get("key")
+            if key not in SUPPLYOFFICE_PRODUCTS:
                 continue
-            if not is_new_period(last_time, period_type):
-                logger.info(f"跳過採購材料：{key}")
+            # 只採用本週期內的紀錄
+            if is_new_period(entry["ts"], SUPPLYOFFICE_PRODUCTS[key]["period_type"]):
                 continue
-            record_data["採購部"][key]["is_purchasing"] = True
-            logger.info(f"正在採購材料：{key}")
+            if entry["step"] in ("bought", "verified"):
+                bought_time[key] = entry["ts"]
+                if resume_key == key:
+                    resume_key = resume_step = None
+            elif key not in bought_time:
+                resume_key, resume_step = key, entry["step"]
+        if bought_time:
             try:
-                with open(RECORD_PATH, "w", encoding="utf-8") as f:
-                    json.dump(record_data, f, indent=4, ensure_ascii=False)
+                with update_json(RECORD_PATH) as record_data:
+                    for key, ts in bought_time.items():
+                        record = record_data["採購部"][key]
+                        if record["last_purchased_time"] < ts:
+                            logger.info(f"從採購日誌恢復已購買材料：{key}")
+                            record["last_purchased_time"] = ts
             except Exception:
                 logger.exception(f"寫入 {RECORD_PATH} 失敗")
                 return False
-            context.override_pipeline(item["pipeline_override"])
-            result = context.run_task("SupplyOfficeTemplate")
-            # 驗證是否執行到 CompletedSupplyOffice 節點
-            if (
-                result.nodes
-                and result.nodes[-1].name == "CompletedSupplyOffice"
-                and result.nodes[-1].completed
-            ):
-                purchase_success = True
-            else:
-                purchase_success = False
-            # 紀錄採購時間
-            if purchase_success:
-                record_data["採購部"][key]["last_purchased_time"] = int(
-                    time.time() * 1000
+
+        # 上次中斷的商品及同頁面商品優先，避免重新導航
+        products = list(SUPPLYOFFICE_PRODUCTS.items())
+        if resume_key:
+            resume_page = get_supplyoffice_page(SUPPLYOFFICE_PRODUCTS[resume_key])
+            logger.info(f"從上次中斷處繼續採購：{resume_key}")
+            products.sort(
+                key=lambda kv: (
+                    kv[0] != resume_key,
+                    get_supplyoffice_page(kv[1]) != resume_page,
+                )
+            )
+
+        # 執行採購流程
+        all_completed = True
+        # 同頁面的商品只需送出不同的欄位，結束後還原
+        overrides = OverrideManager(context)
+        with overrides.scope():
+            for key, item in products:
+                last_time = record_data["採購部"][key]["last_purchased_time"]
+                period_type = item["period_type"]
+                if not (supply_options[key] == "Yes" or supply_options[key] == 0):
+                    continue
+                if not is_new_period(last_time, period_type):
+                    logger.info(f"跳過採購材料：{key}")
+                    continue
+                logger.info(f"正在採購材料：{key}")
+                page = get_supplyoffice_page(item)
+                # 商品的 override 與日誌參數可能寫在同一個節點，逐一合併
+                pipeline_override = {
+                    node: dict(fields)
+                    for node, fields in item["pipeline_override"].items()
+                }
+                for node, step in SUPPLYOFFICE_JOURNAL_STEPS.items():
+                    pipeline_override.setdefault(node, {})["custom_action_param"] = {
+                        "key": key,
+                        "page": page,
+                        "step": step,
+                    }
+                pipeline_override["AutoBuySupplyOfficeProduct"][
+                    "custom_recognition_param"
+                ] = {"key": key}
+                overrides.apply(pipeline_override)
+
+                # 上次中斷的商品先從中斷的步驟繼續，畫面不符時才重新導航
+                result = None
+                if key == resume_key and resume_step in SUPPLYOFFICE_RESUME_NODES:
+                    resume_node = SUPPLYOFFICE_RESUME_NODES[resume_step]
+                    overrides.apply({"SupplyOfficeResume": {"next": [resume_node]}})
+                    result = context.run_task("SupplyOfficeResume")
+                    if not result or result.status.failed:
+                        logger.info(f"無法從 {resume_node} 繼續採購，重新導航")
+                        result = None
+                if result is None:
+                    result = context.run_task("SupplyOfficeTemplate")
+                nodes = result.nodes if result else []
+                completed = {node.name for node in nodes if node and node.completed}
+                # 購買成功即可視為完成，後續關閉視窗失敗不需重新購買
+                purchase_success = "SupplyOfficeProductObtained" in completed
+                if "CompletedSupplyOffice" in completed:
+                    try:
+                        append_journal(
+                            SUPPLYOFFICE_JOURNAL_PATH,
+                            {
+                                "ts": int(time.time() * 1000),
+                                "key": key,
+                                "page": page,
+                                "step": "verified",
+                            },
+                        )
+                    except Exception:
+                        logger.exception(f"寫入 {SUPPLYOFFICE_JOURNAL_PATH} 失敗")
+                # 紀錄採購時間
+                if purchase_success:
+                    try:
+                        with update_json(RECORD_PATH) as record_data:
+                            record_data["採購部"][key]["last_purchased_time"] = int(
+                                time.time() * 1000
+                            )
+                    except Exception:
+                        logger.exception(f"寫入 {RECORD_PATH} 失敗")
+                        return False
+                else:
+                    all_completed = False
+                    flush_postmortem(context, key, f"採購 {key} 未完成")
+        logger.debug(f"採購部 override：{overrides.summary()}")
+
+        # 全部完成後清空日誌，下次從頭開始
+        if all_completed:
+            try:
+                clear_journal(SUPPLYOFFICE_JOURNAL_PATH)
+            except Exception:
+                logger.exception(f"清除 {SUPPLYOFFICE_JOURNAL_PATH} 失敗")
+        return True
+
+
+@AgentServer.custom_action("JournalSupplyOfficeStep")
+@instrument
+class JournalSupplyOfficeStep(CustomAction):
+    """
+    先追加採購日誌再點擊，agent 在採購途中中斷時也能保留已完成的步驟
+
+    key 與 page 由 BuySupplyOfficeProduct 傳入，沒有 key 時只點擊
+    """
+
+    def run(
+        self,
+        context: Context,
+        argv: CustomAction.RunArg,
+    ) -> bool:
+
+        param = json.loads(argv.custom_action_param)
+        if param.get("key"):
+            try:
+                append_journal(
+                    SUPPLYOFFICE_JOURNAL_PATH,
+                    {
+                        "ts": int(time.time() * 1000),
+                        "key": param["key"],
+                        "page": param.get("page"),
+                        "step": param["step"],
+                    },
                 )
-                record_data["採購部"][key]["is_purchasing"] = False
-                try:
-                    with open(RECORD_PATH, "w", encoding="utf-8") as f:
-                        json.dump(record_data, f, indent=4, ensure_ascii=False)
-                except Exception:
-                    logger.exception(f"寫入 {RECORD_PATH} 失敗")
-                    return False
+            except Exception:
+                logger.exception(f"寫入 {SUPPLYOFFICE_JOURNAL_PATH} 失敗")
+
+        # box 已套用節點的 target
+        x, y, w, h = argv.box
+        context.tasker.controller.post_click(x + w // 2, y + h // 2).wait()
         return True
 
 
 @AgentServer.custom_action("RaidStormyMemories")
+@instrument
 class RaidStormyMemories(CustomAction):
 
     def run(
@@ -183,30 +342,155 @@ class RaidStormyMemories(CustomAction):
             now = now - timedelta(days=1)
         week_day = now.strftime("%a")
 
-        # 執行掃蕩流程
+        # 讀取最大掃蕩次數
+        try:
+            cases = read_task_overrides()["option"]["使用全部體力"]["cases"]
+            Max_raid_times = cases["Yes"]["SetRaidTimes"]
+        except Exception:
+            logger.exception("讀取 使用全部體力 選項失敗")
+            return False
+
+        # 先決定今天要掃蕩的關卡與 override
+        levels = []
         for key, item in STORMYMEMORIES_LEVELS.items():
             if week_day not in item["week_days"]:
                 continue
+            pipeline_override = dict(item["pipeline_override"])
             if week_day != "Sun":
-                # 讀取最大掃蕩次數
-                try:
-                    with open("./interface.json", encoding="utf-8") as f:
-                        interface_data = json.load(f)
-                    option = interface_data["option"]["使用全部體力"]["cases"][0]
-                    Max_raid_times = option["pipeline_override"]["InitRaidTimes"]
-                except Exception:
-                    logger.exception("讀取 interface.json 失敗")
-                item["pipeline_override"]["InitRaidTimes"] = Max_raid_times
+                pipeline_override["SetRaidTimes"] = Max_raid_times
             elif not (stormy_options[key] == "Yes" or stormy_options[key] == 0):
                 continue
-            logger.info(f"正在掃蕩關卡：{key}")
-            context.override_pipeline(item["pipeline_override"])
-            context.run_task("StormyMemoriesTemplate")
+            levels.append((key, pipeline_override))
+
+        # 執行掃蕩流程，只在第一個關卡導航進入記憶風暴，
+        # 之後直接在關卡列表切換，失敗時才重新導航
+        overrides = OverrideManager(context)
+        with overrides.scope():
+            entry = "StormyMemoriesTemplate"
+            for key, pipeline_override in levels:
+                logger.info(f"正在掃蕩關卡：{key}")
+                overrides.apply(pipeline_override)
+                result = context.run_task(entry)
+                if entry != "StormyMemoriesTemplate" and (
+                    not result or result.status.failed
+                ):
+                    logger.info(f"無法在關卡列表切換到 {key}，重新導航")
+                    result = context.run_task("StormyMemoriesTemplate")
+                if not result or result.status.failed:
+                    flush_postmortem(context, key, f"掃蕩 {key} 失敗")
+                    entry = "StormyMemoriesTemplate"
+                    continue
+                entry = "StormyMemoriesItem"
+
+                # 體力或次數用完時其他關卡也無法掃蕩
+                stop = [
+                    STORMYMEMORIES_STOP_NODES[node.name]
+                    for node in result.nodes
+                    if node and node.name in STORMYMEMORIES_STOP_NODES
+                ]
+                if stop:
+                    logger.info(f"{stop[0]}，結束記憶風暴掃蕩")
+                    break
+        logger.debug(f"記憶風暴 override：{overrides.summary()}")
 
         return True
 
 
+@AgentServer.custom_action("SetRaidTimes")
+@instrument
+class SetRaidTimes(CustomAction):
+
+    def run(
+        self,
+        context: Context,
+        argv: CustomAction.RunArg,
+    ) -> bool:
+
+        param = json.loads(argv.custom_action_param)
+        # 目標次數由 interface.json 選項覆蓋 attach 欄位
+        node_data = context.get_node_data(argv.node_name) or {}
+        attach = node_data.get("attach", {})
+        target = int(attach.get("target", 1))
+        use_max = attach.get("use_max", False)
+
+        # 辨識目前次數與最大次數
+        controller = context.tasker.controller
+        image = controller.post_screencap().wait().get()
+        current = read_raid_times(context, image, param["count_roi"])
+        maximum = read_raid_times(context, image, param["max_roi"])
+        if current is None or maximum is None:
+            logger.error(f"無法辨識掃蕩次數，目前：{current}，最大：{maximum}")
+            return False
+
+        desired = maximum if use_max else min(target, maximum)
+        logger.info(f"掃蕩次數 {current} -> {desired}（最大 {maximum}）")
+
+        interval = param.get("interval", 300) / 1000
+
+        # 依目前次數計算需要的點擊，一次送出後只辨識一次
+        if current != desired:
+            if desired == maximum:
+                # 點擊滑桿右端直接設為最大值
+                points = [param["maximum"]]
+            else:
+                if current > desired:
+                    # 點擊滑桿左端回到最小值，再計算需要增加的次數
+                    image, current = self._click_and_read(
+                        context, [param["minimum"]], param, interval
+                    )
+                increments = desired - current if current is not None else 0
+                points = [param["increase"]] * max(increments, 0)
+            if points:
+                image, current = self._click_and_read(context, points, param, interval)
+
+        # 批次點擊後次數不符時，改為每次點擊後等待並重新辨識，
+        # 漏掉或合併的點擊由下一輪補上，最多從最小值逐次增加到目標次數再加上重試次數
+        attempts = desired + param.get("retries", 3)
+        if current != desired:
+            logger.info(f"批次點擊後次數為 {current}，改為逐次設定")
+        while current != desired and attempts > 0:
+            attempts -= 1
+            points = []
+            if current is not None:
+                if desired == maximum:
+                    points = [param["maximum"]]
+                elif current < desired:
+                    points = [param["increase"]]
+                else:
+                    points = [param["minimum"]]
+            image, current = self._click_and_read(context, points, param, interval)
+
+        if current == desired:
+            return True
+        if desired == maximum:
+            max_detail = context.run_recognition("MaxRaidTimes", image)
+            if max_detail and max_detail.hit:
+                return True
+        logger.error(f"設定掃蕩次數失敗，目前：{current}，目標：{desired}")
+        return False
+
+    @staticmethod
+    def _click_and_read(
+        context: Context, points: list[list[int]], param: dict, interval: float
+    ) -> tuple:
+        """
+        連續送出所有點擊，不在點擊之間等待，全部完成後等待畫面更新再辨識次數
+
+        :return: 截圖與辨識到的次數
+        """
+
+        controller = context.tasker.controller
+        jobs = [controller.post_click(x, y) for x, y in points]
+        for job in jobs:
+            job.wait()
+        if jobs:
+            time.sleep(interval)
+        image = controller.post_screencap().wait().get()
+        return image, read_raid_times(context, image, param["count_roi"])
+
+
 @AgentServer.custom_action("RecordTime")
+@instrument
 class RecordTime(CustomAction):
     def run(
         self,
@@ -220,31 +504,11 @@ class RecordTime(CustomAction):
             logger.error("未提供 key 參數")
             return False
 
-        # 新增 minos_data.json 檔案
-        RECORD_PATH = Path("config/minos_data.json")
-        if not RECORD_PATH.exists():
-            try:
-                RECORD_PATH.parent.mkdir(parents=True, exist_ok=True)
-                with open(RECORD_PATH, "w", encoding="utf-8") as f:
-                    json.dump({}, f, indent=4, ensure_ascii=False)
-            except Exception:
-                logger.exception(f"寫入 {RECORD_PATH} 失敗")
-                return False
-
-        try:
-            with open(RECORD_PATH, encoding="utf-8") as f:
-                record_data = json.load(f)
-        except Exception:
-            logger.exception(f"讀取 {RECORD_PATH} 失敗")
-            return False
-
         # 紀錄任務完成時間
-        record_data.setdefault(key, {})
-        record_data[key]["last_purchased_time"] = int(time.time() * 1000)
-
         try:
-            with open(RECORD_PATH, "w", encoding="utf-8") as f:
-                json.dump(record_data, f, indent=4, ensure_ascii=False)
+            with update_json(RECORD_PATH) as record_data:
+                record_data.setdefault(key, {})
+                record_data[key]["last_purchased_time"] = int(time.time() * 1000)
         except Exception:
             logger.exception(f"寫入 {RECORD_PATH} 失敗")
             return False
@@ -0,0 +1,291 @@
+import os
+import mmap
+import zlib
+import queue
+import struct
+import threading
+import time
+from pathlib import Path
+
+import numpy
+
+# 目錄結構：
+#   frames.bin  依序追加的幀資料，每幀一段，各自選擇編碼
+#   frames.idx  檔頭 + 固定長度的索引，記錄每幀的位置、大小、尺寸、編碼與時間
+DATA_NAME = "frames.bin"
+INDEX_NAME = "frames.idx"
+INDEX_MAGIC = b"MFS\x01"
+INDEX_HEADER_SIZE = 8
+# offset, size, height, width, channels, codec, timestamp
+INDEX_ENTRY = struct.Struct("<QIHHBB2xd")
+
+CODEC_RAW = 0
+CODEC_ZLIB = 1
+CODECS = {"raw": CODEC_RAW, "zlib": CODEC_ZLIB}
+ZLIB_LEVEL = 1  # 截圖以速度為主，壓縮等級 1 已能去掉大部分冗餘
+AUTO_RATIO = 0.9  # auto 模式下壓縮後需小於原始大小的比例才採用
+
+
+class FrameStore:
+    """
+    以 mmap 隨機讀取的追加式幀檔案，單一寫入者、多個讀取者
+
+    :param path: 幀檔案目錄
+    :param writable: 是否開啟寫入
+    :param codec: "raw" | "zlib" | "auto"，append 未指定時使用
+    """
+
+    def __init__(self, path: Path, writable: bool = False, codec: str = "auto"):
+        self.path = Path(path)
+        self.writable = writable
+        self.codec = codec
+        self.data_path = self.path / DATA_NAME
+        self.index_path = self.path / INDEX_NAME
+        self._data_map = None
+        self._entries = []
+        self._data_file = None
+        self._index_file = None
+
+        if writable:
+            self.path.mkdir(parents=True, exist_ok=True)
+            self._open_for_append()
+        elif not self.index_path.exists():
+            raise FileNotFoundError(f"找不到幀索引: {self.index_path}")
+        self.refresh()
+
+    def _open_for_append(self):
+        if not self.index_path.exists():
+            with open(self.index_path, "wb") as f:
+                f.write(INDEX_MAGIC.ljust(INDEX_HEADER_SIZE, b"\0"))
+        self._data_file = open(self.data_path, "ab")
+        self._index_file = open(self.index_path, "r+b")
+
+        # 上次寫入中斷時，丟棄不完整的索引與沒有索引的資料
+        entries = self._read_entries()
+        end = entries[-1][0] + entries[-1][1] if entries else 0
+        data_size = self.data_path.stat().st_size
+        while entries and end > data_size:
+            entries.pop()
+            end = entries[-1][0] + entries[-1][1] if entries else 0
+        self._index_file.truncate(INDEX_HEADER_SIZE + len(entries) * INDEX_ENTRY.size)
+        self._index_file.seek(0, os.SEEK_END)
+        self._data_file.truncate(end)
+        self._data_file.seek(end)
+
+    def _read_entries(self) -> list[tuple]:
+        with open(self.index_path, "rb") as f:
+            raw = f.read()
+        if raw[: len(INDEX_MAGIC)] != INDEX_MAGIC:
+            raise ValueError(f"不是有效的幀索引: {self.index_path}")
+        count = (len(raw) - INDEX_HEADER_SIZE) // INDEX_ENTRY.size
+        return [
+            INDEX_ENTRY.unpack_from(raw, INDEX_HEADER_SIZE + i * INDEX_ENTRY.size)
+            for i in range(count)
+        ]
+
+    def refresh(self):
+        """重新讀取索引並重新映射資料檔，讀取其他進程正在寫入的檔案時使用"""
+        self._entries = self._read_entries()
+        if self._data_map is not None:
+            self._data_map.close()
+            self._data_map = None
+        if self.data_path.exists() and self.data_path.stat().st_size > 0:
+            with open(self.data_path, "rb") as f:
+                self._data_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._data_map is not None:
+            self._data_map.close()
+            self._data_map = None
+        for f in (self._data_file, self._index_file):
+            if f:
+                f.flush()
+                os.fsync(f.fileno())
+                f.close()
+        self._data_file = None
+        self._index_file = None
+
+    ### 寫入 ###
+
+    def _encode(self, raw: bytes, codec: str) -> tuple[int, bytes]:
+        if codec == "raw":
+            return CODEC_RAW, raw
+        compressed = zlib.compress(raw, ZLIB_LEVEL)
+        if codec == "zlib" or len(compressed) < len(raw) * AUTO_RATIO:
+            return CODEC_ZLIB, compressed
+        return CODEC_RAW, raw
+
+    def append(self, image: numpy.ndarray, ts: float = None, codec: str = None) -> int:
+        """
+        :param image: uint8 的 HxW 或 HxWxC 影像
+        :param ts: 時間戳記，預設為目前時間
+        :param codec: 覆蓋預設編碼
+        :return: 幀編號
+        """
+
+        if not self.writable:
+            raise PermissionError("FrameStore 以唯讀模式開啟")
+        if image.dtype != numpy.uint8:
+            raise TypeError(f"僅支援 uint8 影像，收到 {image.dtype}")
+        codec = codec or self.codec
+        if codec not in CODECS and codec != "auto":
+            raise ValueError(f"未知的編碼: {codec}")
+
+        height, width = image.shape[:2]
+        channels = image.shape[2] if image.ndim == 3 else 1
+        codec_id, payload = self._encode(
+            numpy.ascontiguousarray(image).tobytes(), codec
+        )
+
+        offset = self._data_file.tell()
+        self._data_file.write(payload)
+        self._data_file.flush()
+        entry = (
+            offset,
+            len(payload),
+            height,
+            width,
+            channels,
+            codec_id,
+            time.time() if ts is None else ts,
+        )
+        # 資料寫入後才寫索引，中斷時只會留下沒有索引的資料
+        self._index_file.write(INDEX_ENTRY.pack(*entry))
+        self._index_file.flush()
+        self._entries.append(entry)
+        return len(self._entries) - 1
+
+    ### 讀取 ###
+
+    def _payload(self, index: int) -> tuple[tuple, memoryview]:
+        entry = self._entries[index]
+        offset, size = entry[0], entry[1]
+        if self._data_map is None or offset + size > len(self._data_map):
+            self.refresh()
+        return entry, memoryview(self._data_map)[offset : offset + size]
+
+    @staticmethod
+    def _shape(entry: tuple) -> tuple:
+        _, _, height, width, channels, _, _ = entry
+        return (height, width) if channels == 1 else (height, width, channels)
+
+    def timestamp(self, index: int) -> float:
+        return self._entries[index][6]
+
+    def shape(self, index: int) -> tuple:
+        return self._shape(self._entries[index])
+
+    def read(self, index: int) -> numpy.ndarray:
+        """讀取整張幀，回傳的陣列可自由修改"""
+        entry, payload = self._payload(index)
+        if entry[5] == CODEC_RAW:
+            data = bytes(payload)
+        else:
+            data = zlib.decompress(payload)
+        return numpy.frombuffer(data, numpy.uint8).reshape(self._shape(entry)).copy()
+
+    def read_roi(self, index: int, roi: list[int]) -> numpy.ndarray:
+        """
+        只讀取 roi 範圍，raw 幀直接從映射切片，zlib 幀只解壓到 roi 的最後一列
+
+        :param roi: [x, y, w, h]
+        """
+
+        entry, payload = self._payload(index)
+        height, width, channels = entry[2], entry[3], entry[4]
+        x, y, w, h = roi
+        x, y = max(x, 0), max(y, 0)
+        w, h = min(w, width - x), min(h, height - y)
+        row = width * channels
+        end = (y + h) * row
+
+        if entry[5] == CODEC_RAW:
+            data = payload[:end]
+        else:
+            data = zlib.decompressobj().decompress(payload, end)
+        rows = numpy.frombuffer(data, numpy.uint8, count=h * row, offset=y * row)
+        rows = rows.reshape((h, width, channels) if channels > 1 else (h, width))
+        return rows[:, x : x + w].copy()
+
+
+class FrameWriter:
+    """
+    在背景執行緒寫入 FrameStore，put 不會阻塞呼叫端，
+    佇列滿時丟棄該幀並計數
+
+    put 回傳的編號是預先推算的，寫入失敗一次後不再寫入任何幀，
+    之後的 put 與 close 拋出錯誤，避免之後的幀編號與實際位置錯開
+
+    :param store: 可寫入的 FrameStore
+    :param max_queue: 佇列上限
+    """
+
+    def __init__(self, store: FrameStore, max_queue: int = 64):
+        self.store = store
+        self.queued = len(store)
+        self.dropped = 0
+        self.errors = 0
+        # 第一次寫入失敗的錯誤
+        self.error = None
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def put(
+        self, image: numpy.ndarray, ts: float = None, block: bool = False
+    ) -> int | None:
+        """
+        :param block: 佇列滿時是否等待，錄製等不能掉幀的場合使用
+        :return: 寫入後的幀編號，被丟棄時回傳 None
+        :raise RuntimeError: 先前的幀寫入失敗
+        """
+
+        if self.error is not None:
+            raise RuntimeError("先前的幀寫入失敗，已停止寫入") from self.error
+        try:
+            self._queue.put((image, time.time() if ts is None else ts), block=block)
+        except queue.Full:
+            self.dropped += 1
+            return None
+        self.queued += 1
+        return self.queued - 1
+
+    def _run(self):
+        expected = len(self.store)
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            if self.error is not None:
+                self.errors += 1
+                continue
+            try:
+                index = self.store.append(*item)
+                if index != expected:
+                    raise RuntimeError(f"幀編號 {index} 與預期的 {expected} 不同")
+                expected += 1
+            except Exception as e:
+                self.error = e
+                self.errors += 1
+
+    def close(self):
+        """
+        寫完佇列中剩餘的幀後關閉檔案
+
+        :raise RuntimeError: 有幀寫入失敗
+        """
+
+        self._queue.put(None)
+        self._thread.join()
+        self.store.close()
+        if self.error is not None:
+            raise RuntimeError(f"{self.errors} 張幀未寫入") from self.error
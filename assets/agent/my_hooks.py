@@ -0,0 +1,91 @@
+import time
+import functools
+
+from maa.custom_action import CustomAction
+from maa.custom_recognition import CustomRecognition
+
+from my_utils import get_logger
+
+logger = get_logger(__name__)
+
+_hooks = []
+
+
+class Hook:
+    """
+    自定義動作與辨識的掛鉤，覆寫需要的方法即可
+
+    kind 為 "action" 或 "recognition"，name 為類別名稱
+    """
+
+    def before(self, kind: str, name: str, context, argv):
+        pass
+
+    def after(
+        self,
+        kind: str,
+        name: str,
+        context,
+        argv,
+        result,
+        elapsed: float,
+        error: Exception = None,
+    ):
+        pass
+
+
+def register_hook(hook: Hook):
+    _hooks.append(hook)
+
+
+def unregister_hook(hook: Hook):
+    if hook in _hooks:
+        _hooks.remove(hook)
+
+
+def _call_hooks(method: str, *args):
+    for hook in _hooks:
+        try:
+            getattr(hook, method)(*args)
+        except Exception:
+            # 掛鉤出錯不影響任務流程
+            logger.exception(f"{type(hook).__name__}.{method} 發生錯誤")
+
+
+def instrument(cls):
+    """
+    包裝 CustomAction.run 或 CustomRecognition.analyze，呼叫前後執行已註冊的掛鉤，
+    需放在 AgentServer 裝飾器之下
+    """
+
+    if issubclass(cls, CustomRecognition):
+        kind, method_name = "recognition", "analyze"
+    elif issubclass(cls, CustomAction):
+        kind, method_name = "action", "run"
+    else:
+        raise TypeError(f"{cls.__name__} 不是 CustomAction 或 CustomRecognition")
+
+    original = getattr(cls, method_name)
+    name = cls.__name__
+
+    @functools.wraps(original)
+    def wrapper(self, context, argv):
+        if not _hooks:
+            return original(self, context, argv)
+
+        _call_hooks("before", kind, name, context, argv)
+        start = time.perf_counter()
+        result = None
+        error = None
+        try:
+            result = original(self, context, argv)
+            return result
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            _call_hooks("after", kind, name, context, argv, result, elapsed, error)
+
+    setattr(cls, method_name, wrapper)
+    return cls
@@ -0,0 +1,175 @@
+import os
+import sys
+import ctypes
+import threading
+import tracemalloc
+
+from maa.agent.agent_server import AgentServer
+from maa.event_sink import NotificationType
+from maa.tasker import Tasker, TaskerEventSink
+
+from my_utils import get_logger
+from my_state import read_agent_config
+from my_hooks import Hook, register_hook
+
+logger = get_logger(__name__)
+
+MB = 1024 * 1024
+
+
+### 行程資源 ###
+
+
+if sys.platform == "win32":
+    from ctypes import wintypes
+
+    class _ProcessMemoryCounters(ctypes.Structure):
+        _fields_ = [
+            ("cb", wintypes.DWORD),
+            ("PageFaultCount", wintypes.DWORD),
+            ("PeakWorkingSetSize", ctypes.c_size_t),
+            ("WorkingSetSize", ctypes.c_size_t),
+            ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+            ("PagefileUsage", ctypes.c_size_t),
+            ("PeakPagefileUsage", ctypes.c_size_t),
+        ]
+
+
+def read_rss() -> int | None:
+    """:return: 目前行程使用的實體記憶體 (bytes)，無法取得時回傳 None"""
+    try:
+        if sys.platform == "win32":
+            counters = _ProcessMemoryCounters()
+            counters.cb = ctypes.sizeof(counters)
+            process = ctypes.windll.kernel32.GetCurrentProcess()
+            if not ctypes.windll.psapi.GetProcessMemoryInfo(
+                process, ctypes.byref(counters), counters.cb
+            ):
+                return None
+            return counters.WorkingSetSize
+        if sys.platform.startswith("linux"):
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        # macOS 沒有 /proc，以最高使用量代替
+        import resource
+
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    except Exception:
+        return None
+
+
+def count_fds() -> int | None:
+    """:return: 目前行程開啟的 fd 數量，Windows 為 handle 數量"""
+    try:
+        if sys.platform == "win32":
+            count = wintypes.DWORD()
+            process = ctypes.windll.kernel32.GetCurrentProcess()
+            if not ctypes.windll.kernel32.GetProcessHandleCount(
+                process, ctypes.byref(count)
+            ):
+                return None
+            return count.value
+        fd_dir = "/proc/self/fd" if os.path.isdir("/proc/self/fd") else "/dev/fd"
+        return len(os.listdir(fd_dir))
+    except Exception:
+        return None
+
+
+### 監控 ###
+
+
+class MemoryMonitor(Hook, TaskerEventSink):
+    """
+    定期檢查 RSS 與 fd 數量，超過上限時警告，或在目前任務結束後關閉 agent，
+    由 MFA 或排程器在下次執行時重新啟動
+
+    啟用 tracemalloc 時在每個自定義動作前後比較記憶體配置，輸出成長最多的位置
+
+    :param config: agent_config.json 的 memory 設定
+    """
+
+    def __init__(self, config: dict):
+        self.config = config
+        self.calls = 0
+        self.snapshots = threading.local()
+        self.baseline = (read_rss(), count_fds())
+        self.exceeded = False
+        self.shutting_down = False
+
+    def before(self, kind, name, context, argv):
+        if kind == "action" and tracemalloc.is_tracing():
+            self.snapshots.before = tracemalloc.take_snapshot()
+
+    def after(self, kind, name, context, argv, result, elapsed, error=None):
+        before = getattr(self.snapshots, "before", None)
+        if kind == "action" and before is not None:
+            self.snapshots.before = None
+            self.report_growth(name, before, tracemalloc.take_snapshot())
+
+        self.calls += 1
+        if self.calls % self.config["check_every"] == 0:
+            self.check()
+
+    def report_growth(self, name: str, before, after):
+        stats = after.compare_to(before, "lineno")
+        growth = sum(stat.size_diff for stat in stats)
+        if growth < self.config["growth_kb"] * 1024:
+            return
+        lines = [
+            f"  {stat.size_diff / 1024:+.1f} KiB ({stat.count_diff:+d}) {stat.traceback}"
+            for stat in stats[: self.config["top"]]
+            if stat.size_diff > 0
+        ]
+        logger.warning(
+            f"{name} 執行後記憶體增加 {growth / 1024:.1f} KiB：\n" + "\n".join(lines)
+        )
+
+    def check(self):
+        rss, fds = read_rss(), count_fds()
+        max_rss = self.config["max_rss_mb"] * MB
+        over = []
+        if rss is not None and rss > max_rss:
+            over.append(f"RSS {rss / MB:.0f} MB > {self.config['max_rss_mb']} MB")
+        if fds is not None and fds > self.config["max_fds"]:
+            over.append(f"fd {fds} > {self.config['max_fds']}")
+        if not over:
+            return
+        start_rss, start_fds = self.baseline
+        baseline = f"啟動時 RSS {(start_rss or 0) / MB:.0f} MB，fd {start_fds}"
+        if not self.exceeded:
+            logger.warning(f"agent 資源超過上限：{'，'.join(over)}（{baseline}）")
+        self.exceeded = True
+
+    def on_tasker_task(
+        self,
+        tasker: Tasker,
+        noti_type: NotificationType,
+        detail: TaskerEventSink.TaskerTaskDetail,
+    ):
+        if noti_type == NotificationType.Starting:
+            return
+        self.check()
+        if not (self.exceeded and self.config["restart"]) or self.shutting_down:
+            return
+        self.shutting_down = True
+        logger.warning(f"{detail.entry} 已結束，關閉 agent 以釋放資源")
+        # 不在框架的回呼中關閉，避免等待自己
+        threading.Thread(target=AgentServer.shut_down, daemon=True).start()
+
+
+def _init_memory_monitor() -> MemoryMonitor | None:
+    config = read_agent_config()["memory"]
+    if not config["enabled"]:
+        return None
+    if config["tracemalloc"]:
+        tracemalloc.start(config["frames"])
+    monitor = MemoryMonitor(config)
+    register_hook(monitor)
+    AgentServer.add_tasker_sink(monitor)
+    return monitor
+
+
+memory_monitor = _init_memory_monitor()
@@ -0,0 +1,119 @@
+import json
+from collections import Counter
+from contextlib import contextmanager
+
+from maa.context import Context
+
+from my_utils import get_logger
+
+logger = get_logger(__name__)
+
+# get_node_data 回傳新版格式，舊版的欄位放在 recognition 或 action 的 param 中
+_PARAM_SECTIONS = ("recognition", "action")
+_MISSING = object()
+
+
+def _size(data) -> int:
+    return len(json.dumps(data, ensure_ascii=False).encode("utf-8"))
+
+
+class OverrideManager:
+    """
+    記錄已套用的 pipeline override，只送出與目前狀態不同的欄位，
+    並在 scope 結束時還原 scope 內修改過的欄位
+
+    :param context: 自定義動作的 context
+    """
+
+    def __init__(self, context: Context):
+        self.context = context
+        # {節點: {欄位: 值}}，目前已生效的 override
+        self.applied = {}
+        # 每層 scope 修改前的值
+        self._saved = []
+        self.stats = Counter()
+
+    def _original(self, node: str, field: str):
+        """:return: 節點在 pipeline 中的原始值，找不到時回傳 _MISSING"""
+        data = self.context.get_node_data(node)
+        if not data:
+            return _MISSING
+        if field in data:
+            return data[field]
+        for section in _PARAM_SECTIONS:
+            param = (data.get(section) or {}).get("param") or {}
+            if field in param:
+                return param[field]
+        return _MISSING
+
+    def _send(self, override: dict, save: bool) -> bool:
+        diff = {}
+        for node, fields in override.items():
+            applied = self.applied.get(node, {})
+            for field, value in fields.items():
+                if field in applied and applied[field] == value:
+                    continue
+                if save and self._saved:
+                    saved = self._saved[-1].setdefault(node, {})
+                    if field not in saved:
+                        saved[field] = applied.get(field, _MISSING)
+                        if saved[field] is _MISSING:
+                            saved[field] = self._original(node, field)
+                diff.setdefault(node, {})[field] = value
+
+        full_size = _size(override)
+        if not diff:
+            self.stats["calls_avoided"] += 1
+            self.stats["bytes_avoided"] += full_size
+            return True
+
+        if not self.context.override_pipeline(diff):
+            logger.error(f"覆蓋 pipeline 失敗：{list(diff)}")
+            return False
+        diff_size = _size(diff)
+        self.stats["calls"] += 1
+        self.stats["bytes_sent"] += diff_size
+        self.stats["bytes_avoided"] += full_size - diff_size
+        for node, fields in diff.items():
+            self.applied.setdefault(node, {}).update(fields)
+        return True
+
+    def apply(self, override: dict) -> bool:
+        """
+        套用 override，已生效的欄位不再送出
+
+        :param override: {節點: {欄位: 值}}
+        :return: 是否成功
+        """
+
+        return self._send(override, save=True)
+
+    @contextmanager
+    def scope(self):
+        """離開時將 scope 內修改過的欄位還原為進入前的值"""
+        self._saved.append({})
+        try:
+            yield self
+        finally:
+            saved = self._saved.pop()
+            # 外層尚未修改過的欄位，進入前的值也是外層的原始值
+            if self._saved:
+                for node, fields in saved.items():
+                    outer = self._saved[-1].setdefault(node, {})
+                    for field, value in fields.items():
+                        outer.setdefault(field, value)
+            # 原本不存在的欄位無法移除，保留 override 後的值
+            restore = {}
+            for node, fields in saved.items():
+                for field, value in fields.items():
+                    if value is not _MISSING:
+                        restore.setdefault(node, {})[field] = value
+            if restore:
+                self._send(restore, save=False)
+
+    def summary(self) -> str:
+        return (
+            f"送出 {self.stats['calls']} 次 ({self.stats['bytes_sent']} bytes)，"
+            f"略過 {self.stats['calls_avoided']} 次，"
+            f"節省 {self.stats['bytes_avoided']} bytes"
+        )
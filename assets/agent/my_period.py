@@ -0,0 +1,94 @@
+import time
+
+import numpy
+
+from my_utils import GAME_TIMEZONE, PERIOD_BOUNDARIES
+
+HOUR_MS = 3_600_000
+DAY_MS = 24 * HOUR_MS
+WEEK_MS = 7 * DAY_MS
+# 遊戲時區相對 UTC 的偏移 (ms)
+OFFSET_MS = int(GAME_TIMEZONE.utcoffset(None).total_seconds() * 1000)
+# 1970-01-01 為週四，加上 3 天後以週一為一週的開始
+EPOCH_WEEKDAY = 3
+
+
+def next_boundary_ms(ts, period_type: str) -> numpy.ndarray:
+    """
+    以時間戳陣列計算每個時間點之後的下一次重置時間，不建立 datetime
+
+    :param ts: ms timestamp，可為單一數值或陣列
+    :param period_type: PERIOD_BOUNDARIES 中的週期
+    :return: 晚於 ts 的下一次重置時間 (ms)
+    """
+
+    if period_type not in PERIOD_BOUNDARIES:
+        raise ValueError(f"未知的 period_type: {period_type}")
+    unit, hour = PERIOD_BOUNDARIES[period_type]
+    # 移到以重置時間為 0 點的當地時間
+    local = numpy.asarray(ts, dtype=numpy.int64) + OFFSET_MS - hour * HOUR_MS
+    if unit == "day":
+        start = local // DAY_MS * DAY_MS
+        following = start + DAY_MS
+    elif unit == "week":
+        start = (local // DAY_MS - (local // DAY_MS + EPOCH_WEEKDAY) % 7) * DAY_MS
+        following = start + WEEK_MS
+    else:
+        months = local.astype("datetime64[ms]").astype("datetime64[M]")
+        following = (months + 1).astype("datetime64[ms]").astype(numpy.int64)
+    return following - OFFSET_MS + hour * HOUR_MS
+
+
+class PeriodEngine:
+    """
+    以一次陣列運算判斷所有追蹤的紀錄何時到期
+
+    :param periods: {紀錄: period_type}
+    :param clock: 回傳目前時間 (ms) 的函式，模擬或測試時可替換
+    """
+
+    def __init__(self, periods: dict[str, str], clock=None):
+        self.keys = list(periods)
+        self.index = {key: i for i, key in enumerate(self.keys)}
+        self.clock = clock or (lambda: int(time.time() * 1000))
+        self.last = numpy.zeros(len(self.keys), dtype=numpy.int64)
+        # 同一週期的紀錄一起計算
+        types = numpy.array([periods[key] for key in self.keys])
+        self.groups = {
+            period_type: numpy.flatnonzero(types == period_type)
+            for period_type in dict.fromkeys(periods.values())
+        }
+        self._due = None
+
+    def update(self, last_times: dict[str, int]):
+        """:param last_times: {紀錄: 上次完成的 ms timestamp}，未追蹤的紀錄會被忽略"""
+        for key, ts in last_times.items():
+            i = self.index.get(key)
+            if i is not None:
+                self.last[i] = ts
+        self._due = None
+
+    def next_due_all(self) -> numpy.ndarray:
+        """:return: 每個紀錄的到期時間 (ms)，從未完成的紀錄為 0"""
+        if self._due is None:
+            due = numpy.zeros(len(self.keys), dtype=numpy.int64)
+            for period_type, idx in self.groups.items():
+                due[idx] = next_boundary_ms(self.last[idx], period_type)
+            due[self.last == 0] = 0
+            self._due = due
+        return self._due
+
+    def next_due(self, key: str) -> int:
+        """:return: 紀錄的到期時間 (ms)，早於目前時間代表已到期"""
+        return int(self.next_due_all()[self.index[key]])
+
+    def due_keys(self, now: int = None) -> list[str]:
+        now = self.clock() if now is None else now
+        return [self.keys[i] for i in numpy.flatnonzero(self.next_due_all() <= now)]
+
+    def next_wake(self, now: int = None) -> int | None:
+        """:return: 尚未到期的紀錄中最早的到期時間，全部已到期時回傳 None"""
+        now = self.clock() if now is None else now
+        due = self.next_due_all()
+        pending = due[due > now]
+        return int(pending.min()) if pending.size else None
@@ -0,0 +1,209 @@
+import re
+import json
+import time
+import shutil
+import threading
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+
+from maa.agent.agent_server import AgentServer
+from maa.tasker import TaskerEventSink
+from maa.event_sink import NotificationType
+
+from my_utils import get_logger
+from my_state import read_agent_config
+from my_hooks import Hook, register_hook
+from my_frame_store import FrameStore
+
+logger = get_logger(__name__)
+
+POSTMORTEM_DIR = Path("debug/postmortem")
+
+
+def _summarize(result):
+    """將辨識或動作結果轉成可寫入 JSON 的內容"""
+    if result is None or isinstance(result, (bool, int, float, str)):
+        return result
+    if isinstance(result, (list, tuple)):
+        return list(result)
+    box = getattr(result, "box", None)
+    if box is not None or hasattr(result, "detail"):
+        return {"box": list(box) if box is not None else None}
+    if hasattr(result, "success"):
+        return result.success
+    return str(result)
+
+
+class PostmortemRing(Hook):
+    """
+    在記憶體中保留最近的截圖與辨識結果，只在失敗時寫入磁碟
+
+    :param frames: 保留的紀錄數量
+    :param reco_fail_limit: 同一個辨識連續失敗幾次時輸出
+    :param max_dumps: 保留的輸出數量，超過時刪除最舊的
+    :param reco_fail_watch: 未命中也視為失敗的辨識，其他辨識只在拋出異常時視為失敗
+    :param dump_dir: 輸出目錄
+    """
+
+    def __init__(
+        self,
+        frames: int,
+        reco_fail_limit: int,
+        max_dumps: int,
+        reco_fail_watch: list[str] = (),
+        dump_dir: Path = POSTMORTEM_DIR,
+    ):
+        self.entries = deque(maxlen=frames)
+        self.reco_fail_limit = reco_fail_limit
+        self.reco_fail_watch = set(reco_fail_watch)
+        self.max_dumps = max_dumps
+        self.dump_dir = Path(dump_dir)
+        self.fail_streaks = {}
+        self.lock = threading.Lock()
+
+    def record(self, kind: str, name: str, node: str, image, result):
+        entry = {
+            "ts": time.time(),
+            "kind": kind,
+            "name": name,
+            "node": node,
+            "result": _summarize(result),
+            "image": image,
+        }
+        with self.lock:
+            self.entries.append(entry)
+
+    def after(self, kind, name, context, argv, result, elapsed, error=None):
+        node = getattr(argv, "node_name", "")
+        if kind == "recognition":
+            self.record(kind, name, node, getattr(argv, "image", None), result)
+            # 以節點區分，不同節點各自判斷一次未命中屬於正常流程
+            key = (name, node)
+            failed = error is not None or (
+                result is None and name in self.reco_fail_watch
+            )
+            if not failed:
+                self.fail_streaks.pop(key, None)
+                return
+            streak = self.fail_streaks.get(key, 0) + 1
+            self.fail_streaks[key] = streak
+            # 每段連續失敗只輸出一次
+            if streak == self.reco_fail_limit:
+                self.flush(f"{name} 連續 {streak} 次辨識失敗")
+        else:
+            self.record(kind, name, node, cached_image(context), result)
+            success = getattr(result, "success", result)
+            if error is not None or not success:
+                self.flush(f"{name} 執行失敗")
+
+    def flush(self, reason: str) -> Path | None:
+        """
+        在背景執行緒將目前的紀錄寫入 debug/postmortem
+
+        :param reason: 輸出原因
+        :return: 輸出目錄，沒有紀錄時回傳 None
+        """
+
+        with self.lock:
+            entries = list(self.entries)
+        if not entries:
+            return None
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        safe_reason = re.sub(r"[^\w]+", "_", reason).strip("_")
+        dump_path = self.dump_dir / f"{stamp}_{safe_reason}"
+        logger.warning(f"輸出最近 {len(entries)} 筆紀錄至 {dump_path}：{reason}")
+        threading.Thread(
+            target=self._write, args=(dump_path, reason, entries), daemon=True
+        ).start()
+        return dump_path
+
+    def _write(self, dump_path: Path, reason: str, entries: list[dict]):
+        try:
+            dump_path.mkdir(parents=True, exist_ok=True)
+            frame_ids = {}
+            with FrameStore(dump_path / "frames", writable=True) as store:
+                with open(dump_path / "entries.jsonl", "w", encoding="utf-8") as f:
+                    for entry in entries:
+                        image = entry.pop("image")
+                        frame = None
+                        if image is not None:
+                            # 同一張截圖只寫入一次
+                            if id(image) not in frame_ids:
+                                frame_ids[id(image)] = store.append(image, entry["ts"])
+                            frame = frame_ids[id(image)]
+                        entry["frame"] = frame
+                        f.write(json.dumps(entry, ensure_ascii=False, default=str))
+                        f.write("\n")
+            with open(dump_path / "reason.txt", "w", encoding="utf-8") as f:
+                f.write(reason + "\n")
+        except Exception:
+            logger.exception(f"寫入 {dump_path} 失敗")
+            return
+
+        # 只保留最近的輸出
+        dumps = sorted(p for p in self.dump_dir.iterdir() if p.is_dir())
+        for old in dumps[: -self.max_dumps]:
+            shutil.rmtree(old, ignore_errors=True)
+
+
+def cached_image(context):
+    """取得框架最近一次的截圖，無法取得時回傳 None"""
+    try:
+        return context.tasker.controller.cached_image
+    except Exception:
+        return None
+
+
+class _TaskFailureSink(TaskerEventSink):
+    """頂層任務失敗或逾時時輸出紀錄，pipeline 中的節點沒有機會呼叫 flush_postmortem"""
+
+    def __init__(self, ring: PostmortemRing):
+        self.ring = ring
+
+    def on_tasker_task(
+        self,
+        tasker,
+        noti_type: NotificationType,
+        detail: TaskerEventSink.TaskerTaskDetail,
+    ):
+        if noti_type != NotificationType.Failed:
+            return
+        try:
+            image = tasker.controller.cached_image
+        except Exception:
+            image = None
+        self.ring.record("task", detail.entry, detail.entry, image, False)
+        self.ring.flush(f"任務 {detail.entry} 失敗")
+
+
+def _init_postmortem() -> PostmortemRing | None:
+    config = read_agent_config()["postmortem"]
+    if not config["enabled"]:
+        return None
+    ring = PostmortemRing(
+        config["frames"],
+        config["reco_fail_limit"],
+        config["max_dumps"],
+        config["reco_fail_watch"],
+    )
+    register_hook(ring)
+    AgentServer.add_tasker_sink(_TaskFailureSink(ring))
+    return ring
+
+
+postmortem = _init_postmortem()
+
+
+def flush_postmortem(context, name: str, reason: str):
+    """
+    任務失敗或逾時時由自定義動作呼叫，先記錄當下畫面再輸出
+
+    :param name: 任務或節點名稱
+    :param reason: 輸出原因
+    """
+
+    if postmortem is None:
+        return
+    postmortem.record("task", name, name, cached_image(context), False)
+    postmortem.flush(reason)
@@ -0,0 +1,121 @@
+import os
+import cProfile
+import threading
+from datetime import datetime
+from pathlib import Path
+
+from my_utils import get_logger
+from my_state import read_agent_config
+from my_hooks import Hook, register_hook
+
+logger = get_logger(__name__)
+
+PROFILES_DIR = Path("debug/profiles")
+# 以逗號分隔的類別名稱，all 為全部，設定時優先於 agent_config.json
+PROFILE_ENV = "MAA_PROFILE"
+
+
+class ProfilerHook(Hook):
+    """
+    以 cProfile 記錄指定的自定義動作與辨識，輸出可用 pstats 或 snakeviz 開啟的 .prof
+
+    巢狀呼叫只由最外層記錄，內層的耗時包含在外層的結果中
+
+    :param targets: 要記錄的類別名稱，None 為全部
+    :param aggregate: 同一個類別的所有呼叫累積在同一個檔案
+    :param max_files: 保留的檔案數量，超過時刪除最舊的
+    :param max_mb: 保留的檔案總大小
+    :param profile_dir: 輸出目錄
+    """
+
+    def __init__(
+        self,
+        targets: set[str] | None,
+        aggregate: bool,
+        max_files: int,
+        max_mb: float,
+        profile_dir: Path = PROFILES_DIR,
+    ):
+        self.targets = targets
+        self.aggregate = aggregate
+        self.max_files = max_files
+        self.max_bytes = max_mb * 1024 * 1024
+        self.profile_dir = Path(profile_dir)
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        # aggregate 時每個類別共用的 profiler
+        self.profiles = {}
+
+    def before(self, kind, name, context, argv):
+        if getattr(self.local, "active", None) is not None:
+            self.local.depth += 1
+            return
+        if self.targets is not None and name not in self.targets:
+            return
+        with self.lock:
+            if self.aggregate:
+                profile = self.profiles.setdefault(name, cProfile.Profile())
+            else:
+                profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # 其他 profiler 已在執行
+            return
+        self.local.active = profile
+        self.local.depth = 0
+
+    def after(self, kind, name, context, argv, result, elapsed, error=None):
+        profile = getattr(self.local, "active", None)
+        if profile is None:
+            return
+        if self.local.depth:
+            self.local.depth -= 1
+            return
+        profile.disable()
+        self.local.active = None
+
+        if self.aggregate:
+            path = self.profile_dir / f"{name}.prof"
+        else:
+            stamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+            path = self.profile_dir / f"{stamp}_{int(elapsed * 1000)}ms_{name}.prof"
+        try:
+            self.profile_dir.mkdir(parents=True, exist_ok=True)
+            with self.lock:
+                profile.dump_stats(path)
+                self._trim()
+        except Exception:
+            logger.exception(f"寫入 {path} 失敗")
+            return
+        logger.debug(f"{name} 耗時 {elapsed:.3f} 秒，profile 已寫入 {path}")
+
+    def _trim(self):
+        """超過數量或大小時刪除最舊的檔案"""
+        files = sorted(self.profile_dir.glob("*.prof"), key=lambda p: p.stat().st_mtime)
+        total = sum(p.stat().st_size for p in files)
+        while files and (len(files) > self.max_files or total > self.max_bytes):
+            old = files.pop(0)
+            total -= old.stat().st_size
+            old.unlink(missing_ok=True)
+
+
+def _init_profiler() -> ProfilerHook | None:
+    config = read_agent_config()["profiling"]
+    env = os.environ.get(PROFILE_ENV, "").strip()
+    if env:
+        targets = None if env.lower() == "all" else set(env.split(","))
+    elif config["enabled"]:
+        targets = set(config["targets"]) if config["targets"] else None
+    else:
+        return None
+
+    profiler = ProfilerHook(
+        targets, config["aggregate"], config["max_files"], config["max_mb"]
+    )
+    register_hook(profiler)
+    logger.info(f"已啟用 profile：{', '.join(sorted(targets)) if targets else '全部'}")
+    return profiler
+
+
+profiler = _init_profiler()
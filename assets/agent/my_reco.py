@@ -1,16 +1,18 @@
 import json
-from pathlib import Path
 
 from maa.agent.agent_server import AgentServer
 from maa.custom_recognition import CustomRecognition
 from maa.context import Context
 
 from my_utils import is_new_period, get_logger
+from my_hooks import instrument
+from my_state import RECORD_PATH, read_json, update_json
 
 logger = get_logger(__name__)
 
 
 @AgentServer.custom_recognition("CheckSupplyOfficeProduct")
+@instrument
 class CheckSupplyOfficeProduct(CustomRecognition):
 
     def analyze(
@@ -19,21 +21,11 @@ class CheckSupplyOfficeProduct(CustomRecognition):
         argv: CustomRecognition.AnalyzeArg,
     ) -> CustomRecognition.AnalyzeResult:
 
-        # 讀取 minos_data.json
-        try:
-            with open("config/minos_data.json", encoding="utf-8") as f:
-                record_data = json.load(f)
-        except Exception:
-            logger.exception("讀取 config/minos_data.json 失敗")
-            return None
-        # 找到 is_purchasing 為 True 的商品 key
-        product_key = None
-        for key, item in record_data["採購部"].items():
-            if item["is_purchasing"] is True:
-                product_key = key
-                break
+        # 由 BuySupplyOfficeProduct 傳入目前採購的商品 key
+        param = json.loads(argv.custom_recognition_param)
+        product_key = param.get("key")
         if not product_key:
-            logger.error("找不到 is_purchasing 為 True 的商品")
+            logger.error("未提供 key 參數")
             return None
 
         # 讀取 supplyoffice_products.json
@@ -67,7 +59,7 @@ class CheckSupplyOfficeProduct(CustomRecognition):
                         "MyCustomOCR": {"roi": roi, "expected": expected}
                     },
                 )
-                if product_detail is not None:
+                if product_detail and product_detail.hit:
                     # 若該商品有折扣，需同時辨識到折扣
                     if is_discounted:
                         discount_roi = [roi[0] - 100, roi[1], roi[2] - 50, roi[3]]
@@ -78,7 +70,7 @@ class CheckSupplyOfficeProduct(CustomRecognition):
                                 "MyCustomOCR": {"roi": discount_roi, "expected": "50"}
                             },
                         )
-                        if discount_detail is not None:
+                        if discount_detail and discount_detail.hit:
                             return product_detail.box
                     else:
                         return product_detail.box
@@ -90,6 +82,7 @@ class CheckSupplyOfficeProduct(CustomRecognition):
 
 
 @AgentServer.custom_recognition("VerifyTime")
+@instrument
 class VerifyTime(CustomRecognition):
     def analyze(
         self,
@@ -104,26 +97,13 @@ class VerifyTime(CustomRecognition):
             logger.error("未提供 key 或 period_type 參數")
             return None
 
-        # 新增 minos_data.json 檔案
-        RECORD_PATH = Path("config/minos_data.json")
-        if not RECORD_PATH.exists():
-            try:
-                RECORD_PATH.parent.mkdir(parents=True, exist_ok=True)
-                with open(RECORD_PATH, "w", encoding="utf-8") as f:
-                    json.dump({}, f, indent=4, ensure_ascii=False)
-            except Exception:
-                logger.exception(f"寫入 {RECORD_PATH} 失敗")
-                return None
-
         # 讀取任務完成時間
         try:
-            with open(RECORD_PATH, encoding="utf-8") as f:
-                record_data = json.load(f)
+            record_data = read_json(RECORD_PATH)
             if key not in record_data:
-                record_data.setdefault(key, {})
-                record_data[key].setdefault("last_purchased_time", 0)
-            with open(RECORD_PATH, "w", encoding="utf-8") as f:
-                json.dump(record_data, f, indent=4, ensure_ascii=False)
+                with update_json(RECORD_PATH) as record_data:
+                    record_data.setdefault(key, {})
+                    record_data[key].setdefault("last_purchased_time", 0)
         except Exception:
             logger.exception("讀取任務完成時間失敗")
             return None
@@ -0,0 +1,350 @@
+import os
+import sys
+import copy
+import glob
+import json
+import time
+from pathlib import Path
+from contextlib import contextmanager
+
+from my_utils import get_logger, build_task_overrides
+
+if sys.platform.startswith("win"):
+    import msvcrt
+else:
+    import fcntl
+
+logger = get_logger(__name__)
+
+RECORD_PATH = Path("config/minos_data.json")
+AGENT_CONFIG_PATH = Path("config/agent_config.json")
+TASK_OVERRIDES_PATH = Path("agent/task_overrides.json")
+LOCK_TIMEOUT = 30  # 等待檔案鎖的秒數
+
+DEFAULT_AGENT_CONFIG = {
+    "postmortem": {
+        "enabled": True,
+        "frames": 10,  # 記憶體中保留的最近截圖數量
+        "reco_fail_limit": 5,  # 同一個辨識連續失敗幾次時輸出
+        # 未命中時也計入連續失敗的辨識，其他辨識只計入拋出的異常，
+        # VerifyTime 等以未命中表示正常分支的辨識不應列入
+        "reco_fail_watch": ["CheckSupplyOfficeProduct"],
+        "max_dumps": 20,  # debug/postmortem 中保留的輸出數量
+    },
+    "warmup": {
+        "enabled": True,
+        "nodes": ["HomeFlag", "ResourcesObtained"],  # 預先執行一次辨識的節點
+        # 執行完動作後開始預熱的節點，預熱與等待遊戲載入同時進行，節點需設定 focus
+        "after": ["Start5732", "StartGame"],
+    },
+    "watchdog": {
+        "enabled": True,
+        # 每個任務中節點可執行的次數與秒數，超過時改為執行 recovery，null 為結束目前的流程
+        # 框架只對設定 focus 的節點發送事件，節點需在 pipeline 中加上 "focus": {}
+        "budgets": {
+            "ReturnHome": {"max_runs": 30, "max_seconds": 120, "recovery": None},
+            "ResourcesObtained": {
+                "max_runs": 15,
+                "max_seconds": 60,
+                "recovery": "ReturnHome",
+            },
+            "EnterStormyMemoriesItem": {
+                "max_runs": 15,
+                "max_seconds": 90,
+                "recovery": "ReturnHome",
+            },
+            "ClaimEmotionCheck": {
+                "max_runs": 15,
+                "max_seconds": 60,
+                "recovery": "ReturnHome",
+            },
+        },
+    },
+    "profiling": {
+        "enabled": False,
+        "targets": [],  # 要記錄的自定義動作或辨識，空白為全部
+        "aggregate": False,  # 同一個類別累積在同一個檔案
+        "max_files": 50,  # debug/profiles 中保留的檔案數量
+        "max_mb": 200,  # debug/profiles 的大小上限
+    },
+    "memory": {
+        "enabled": False,
+        "check_every": 20,  # 每幾次自定義動作或辨識檢查一次 RSS 與 fd
+        "max_rss_mb": 1024,
+        "max_fds": 512,
+        "restart": False,  # 超過上限時在任務結束後關閉 agent
+        "tracemalloc": False,  # 比較每個自定義動作前後的記憶體配置
+        "frames": 5,  # tracemalloc 保留的呼叫堆疊深度
+        "growth_kb": 1024,  # 動作後記憶體增加超過此值時輸出
+        "top": 10,  # 輸出成長最多的位置數量
+    },
+}
+
+
+def _lock_path(path: Path) -> Path:
+    return path.with_name(path.name + ".lock")
+
+
+def _backup_path(path: Path) -> Path:
+    return path.with_name(path.name + ".bak")
+
+
+def _try_lock(fd: int, shared: bool):
+    if sys.platform.startswith("win"):
+        # Windows 不支援共享鎖，一律使用獨佔鎖
+        msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+    else:
+        fcntl.flock(fd, (fcntl.LOCK_SH if shared else fcntl.LOCK_EX) | fcntl.LOCK_NB)
+
+
+def _unlock(fd: int):
+    if sys.platform.startswith("win"):
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+    else:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+
+
+@contextmanager
+def file_lock(path: Path, shared: bool = False, timeout: float = LOCK_TIMEOUT):
+    """
+    跨進程建議鎖，鎖定 <path>.lock 而非資料檔本身，避免與原子替換衝突
+
+    :param path: 要保護的檔案路徑
+    :param shared: 是否為共享鎖（僅讀取時使用）
+    :param timeout: 等待鎖的秒數，逾時拋出 TimeoutError
+    """
+
+    lock_path = _lock_path(Path(path))
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                _try_lock(fd, shared)
+                break
+            except OSError:
+                if time.monotonic() >= deadline:
+                    raise TimeoutError(f"等待檔案鎖逾時: {lock_path}")
+                time.sleep(0.01)
+        try:
+            yield
+        finally:
+            _unlock(fd)
+    finally:
+        os.close(fd)
+
+
+def _read_file(path: Path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _is_valid(path: Path) -> bool:
+    try:
+        _read_file(path)
+        return True
+    except Exception:
+        return False
+
+
+def _fsync_dir(dir_path: Path):
+    # Windows 無法對目錄 fsync
+    if sys.platform.startswith("win"):
+        return
+    fd = os.open(dir_path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _load(path: Path, default):
+    """依序讀取目前版本與上一個版本，回傳第一個可解析的內容"""
+    found = False
+    for candidate in (path, _backup_path(path)):
+        try:
+            data = _read_file(candidate)
+        except FileNotFoundError:
+            continue
+        except Exception:
+            found = True
+            logger.warning(f"{candidate} 已損壞，嘗試上一個版本")
+            continue
+        if candidate != path:
+            logger.warning(f"已從 {candidate} 恢復資料")
+        return data
+    if found:
+        logger.error(f"{path} 沒有可用的版本，使用預設值")
+    return copy.deepcopy(default)
+
+
+def _remove_stale_tmp(path: Path):
+    """
+    寫入途中被終止的程序不會執行 finally，暫存檔會留在目錄中；
+    呼叫時需持有獨佔鎖，此時其他程序不會在寫入，同名的暫存檔都已失效
+    """
+
+    for tmp_path in path.parent.glob(f"{glob.escape(path.name)}.*.tmp"):
+        try:
+            tmp_path.unlink()
+        except OSError as e:
+            logger.warning(f"無法刪除殘留的暫存檔 {tmp_path}: {e}")
+
+
+def _write(path: Path, data):
+    """寫入暫存檔並 fsync，再原子替換；替換前保留上一個完好的版本"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    _remove_stale_tmp(path)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=4, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        if path.exists() and _is_valid(path):
+            os.replace(path, _backup_path(path))
+        os.replace(tmp_path, path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+    _fsync_dir(path.parent)
+
+
+def read_json(path: Path, default=None):
+    """
+    :param path: JSON 檔案路徑
+    :param default: 檔案不存在或無法恢復時的回傳值，預設為 {}
+    :return: 檔案內容
+    """
+
+    path = Path(path)
+    if default is None:
+        default = {}
+    with file_lock(path, shared=True):
+        return _load(path, default)
+
+
+def write_json(path: Path, data):
+    """
+    :param path: JSON 檔案路徑
+    :param data: 要寫入的內容
+    """
+
+    path = Path(path)
+    with file_lock(path):
+        _write(path, data)
+
+
+@contextmanager
+def update_json(path: Path, default=None):
+    """
+    在獨佔鎖內讀取、修改並寫回 JSON 檔案，區塊內拋出異常時不寫入
+
+    :param path: JSON 檔案路徑
+    :param default: 檔案不存在或無法恢復時的初始內容，預設為 {}
+    """
+
+    path = Path(path)
+    if default is None:
+        default = {}
+    with file_lock(path):
+        data = _load(path, default)
+        yield data
+        _write(path, data)
+
+
+def append_journal(path: Path, entry: dict):
+    """
+    以 JSON Lines 追加一筆紀錄並 fsync，不會改寫既有內容
+
+    :param path: journal 檔案路徑
+    :param entry: 要追加的紀錄
+    """
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    line = (json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8")
+    with file_lock(path):
+        with open(path, "a+b") as f:
+            # 上次寫入若中斷在行中，先補上換行，避免與新紀錄黏在一起
+            if f.seek(0, os.SEEK_END) > 0:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    line = b"\n" + line
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def read_journal(path: Path) -> list[dict]:
+    """
+    :param path: journal 檔案路徑
+    :return: 所有可解析的紀錄，寫入中斷造成的殘缺行會被略過
+    """
+
+    path = Path(path)
+    entries = []
+    with file_lock(path, shared=True):
+        try:
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entries.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        logger.warning(f"略過 {path} 中無法解析的紀錄")
+        except FileNotFoundError:
+            pass
+    return entries
+
+
+def clear_journal(path: Path):
+    """
+    :param path: journal 檔案路徑
+    """
+
+    path = Path(path)
+    with file_lock(path):
+        if path.exists():
+            path.unlink()
+
+
+def read_agent_config() -> dict:
+    """
+    讀取 config/agent_config.json，缺少的欄位使用預設值，檔案不存在時建立
+
+    :return: agent 設定
+    """
+
+    config = copy.deepcopy(DEFAULT_AGENT_CONFIG)
+    try:
+        if not AGENT_CONFIG_PATH.exists():
+            write_json(AGENT_CONFIG_PATH, config)
+            return config
+        user_config = read_json(AGENT_CONFIG_PATH, config)
+    except Exception:
+        logger.exception("讀取 agent 配置失敗，使用默認配置")
+        return config
+
+    for section, values in user_config.items():
+        if isinstance(values, dict) and isinstance(config.get(section), dict):
+            config[section].update(values)
+        else:
+            config[section] = values
+    return config
+
+
+def read_task_overrides() -> dict:
+    """
+    讀取安裝時預先展開的 agent/task_overrides.json，
+    開發環境沒有該檔案時直接從 interface.json 展開
+
+    :return: build_task_overrides 的結果
+    """
+
+    if TASK_OVERRIDES_PATH.exists():
+        with open(TASK_OVERRIDES_PATH, encoding="utf-8") as f:
+            return json.load(f)
+    with open("interface.json", encoding="utf-8") as f:
+        return build_task_overrides(json.load(f))
@@ -2,49 +2,150 @@ import logging
 from pathlib import Path
 from datetime import datetime, timedelta, timezone
 
+# 遊戲以 UTC+8 計算重置時間
+GAME_TIMEZONE = timezone(timedelta(hours=8))
+# 週期的重置時間點：(單位, 小時)，單位為 "day" 每日、"week" 每週一、"month" 每月1日
+PERIOD_BOUNDARIES = {
+    "day": ("day", 5),
+    "noon": ("day", 11),
+    "night": ("day", 17),
+    "week": ("week", 0),
+    "month": ("month", 0),
+}
+
+
+def _boundary(period_type: str) -> tuple[str, int]:
+    if period_type not in PERIOD_BOUNDARIES:
+        raise ValueError(f"未知的 period_type: {period_type}")
+    return PERIOD_BOUNDARIES[period_type]
+
 
-def is_new_period(last_ts: int, period_type: str) -> bool:
+def period_start(period_type: str, now: datetime = None) -> datetime:
+    """
+    :param period_type: PERIOD_BOUNDARIES 中的週期
+    :param now: 預設為目前時間
+    :return: 不晚於 now 的最近一次重置時間
+    """
+
+    now = (now or datetime.now(GAME_TIMEZONE)).astimezone(GAME_TIMEZONE)
+    unit, hour = _boundary(period_type)
+    start = now.replace(hour=hour, minute=0, second=0, microsecond=0)
+    if unit == "week":
+        start -= timedelta(days=now.weekday())
+    elif unit == "month":
+        start = start.replace(day=1)
+    if start <= now:
+        return start
+    # 尚未到今日的重置時間，往前一個週期
+    if unit == "day":
+        return start - timedelta(days=1)
+    if unit == "week":
+        return start - timedelta(weeks=1)
+    return (start - timedelta(days=1)).replace(day=1)
+
+
+def next_period_start(period_type: str, now: datetime = None) -> datetime:
+    """:return: 晚於 now 的下一次重置時間"""
+    start = period_start(period_type, now)
+    unit, _ = _boundary(period_type)
+    if unit == "day":
+        return start + timedelta(days=1)
+    if unit == "week":
+        return start + timedelta(weeks=1)
+    return (start + timedelta(days=32)).replace(day=1)
+
+
+def is_new_period(last_ts: int, period_type: str, now: datetime = None) -> bool:
     """
     :param last_ts: ms timestamp
-    :param period_type: "day" | "week" | "month"
+    :param period_type: "day" | "noon" | "night" | "week" | "month"
+    :param now: 預設為目前時間
     :return: 是否為新的 period
     """
 
     if last_ts == 0:
         return True
 
-    now = datetime.now(timezone(timedelta(hours=8)))
-    last = datetime.fromtimestamp(last_ts / 1000, tz=now.tzinfo)
-
-    if period_type == "day":
-        # 今日5點
-        day_start = now.replace(hour=5, minute=0, second=0, microsecond=0)
-        if now.hour < 5:
-            day_start -= timedelta(days=1)
-        return last < day_start
-    elif period_type == "week":
-        # 本週週一0點
-        week_start = now - timedelta(days=now.weekday())
-        week_start = week_start.replace(hour=0, minute=0, second=0, microsecond=0)
-        return last < week_start
-    elif period_type == "month":
-        # 本月1日0點
-        month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        return last < month_start
-    elif period_type == "noon":
-        # 今日11點
-        noon_start = now.replace(hour=11, minute=0, second=0, microsecond=0)
-        if now.hour < 11:
-            noon_start -= timedelta(days=1)
-        return last < noon_start
-    elif period_type == "night":
-        # 今日17點
-        night_start = now.replace(hour=17, minute=0, second=0, microsecond=0)
-        if now.hour < 17:
-            night_start -= timedelta(days=1)
-        return last < night_start
-    else:
-        raise ValueError(f"未知的 period_type: {period_type}")
+    start = period_start(period_type, now)
+    last = datetime.fromtimestamp(last_ts / 1000, tz=GAME_TIMEZONE)
+    return last < start
+
+
+def build_task_overrides(interface: dict) -> dict:
+    """
+    展開 interface.json 中任務與選項的 pipeline_override，只保留執行時需要的欄位
+
+    :param interface: interface.json 內容
+    :return: {"task": {任務: {"entry", "pipeline_override", "option"}},
+        "option": {選項: {"default_case", "cases": {case: pipeline_override}}}}
+    """
+
+    tasks = {}
+    for task in interface.get("task", []):
+        tasks[task["name"]] = {
+            "entry": task["entry"],
+            "pipeline_override": task.get("pipeline_override", {}),
+            "option": task.get("option", []),
+        }
+
+    options = {}
+    for name, option in interface.get("option", {}).items():
+        cases = {
+            case["name"]: case.get("pipeline_override", {})
+            for case in option.get("cases", [])
+        }
+        options[name] = {
+            "default_case": option.get("default_case", next(iter(cases), None)),
+            "cases": cases,
+        }
+    return {"task": tasks, "option": options}
+
+
+def resolve_task_override(
+    overrides: dict, name: str, selected: dict
+) -> tuple[str, dict]:
+    """
+    依選擇的選項組出任務的 entry 與合併後的 pipeline_override，合併方式與 MaaFramework 相同
+
+    :param overrides: build_task_overrides 的結果
+    :param name: 任務名稱
+    :param selected: {選項: case 名稱或索引}，未選擇的選項使用 default_case
+    """
+
+    task = overrides["task"].get(name)
+    if task is None:
+        raise KeyError(f"interface.json 中沒有任務: {name}")
+
+    override = {}
+
+    def merge(source: dict):
+        for node, fields in source.items():
+            override.setdefault(node, {}).update(fields)
+
+    merge(task["pipeline_override"])
+    for option_name in task["option"]:
+        option = overrides["option"][option_name]
+        cases = option["cases"]
+        value = selected.get(option_name, option["default_case"])
+        if isinstance(value, int):
+            value = list(cases)[value]
+        elif value not in cases:
+            value = next(iter(cases))
+        merge(cases[value])
+    return task["entry"], override
+
+
+def nodes_without_focus(nodes, get_node_data) -> list[str]:
+    """
+    框架只對設定 focus 的節點發送 Node 事件 (除錯模式除外)，
+    沒有 focus 或不存在的節點不會觸發 ContextEventSink
+
+    :param nodes: 節點名稱
+    :param get_node_data: Context 或 Resource 的 get_node_data
+    :return: 不會產生事件的節點
+    """
+
+    return [node for node in nodes if (get_node_data(node) or {}).get("focus") is None]
 
 
 def get_interface_mode() -> str:
@@ -70,9 +171,10 @@ def get_logger(name: str, level: int = None) -> logging.Logger:
     logger = logging.getLogger(name)
     logger.setLevel(logging.DEBUG)
 
-    # 清除舊 handler，避免重複
-    if logger.hasHandlers():
-        logger.handlers.clear()
+    # 關閉並移除舊 handler，避免重複輸出及 log 檔的 fd 持續累積
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        handler.close()
 
     # 設定 stderr handler 的等級
     if level is None:
@@ -0,0 +1,126 @@
+import time
+import threading
+
+import numpy
+
+from maa.agent.agent_server import AgentServer
+from maa.context import Context, ContextEventSink
+from maa.tasker import Tasker, TaskerEventSink
+from maa.event_sink import NotificationType
+
+from my_utils import get_logger, nodes_without_focus
+from my_state import read_agent_config
+
+logger = get_logger(__name__)
+
+# 模擬器預設解析度的空白畫面
+BLANK_FRAME_SHAPE = (720, 1280, 3)
+
+
+def warm_up_recognition(context: Context, nodes: list[str]):
+    """
+    以空白畫面執行一次辨識，讓 OCR 模型在遊戲載入期間完成載入，不使用控制器
+
+    :param nodes: 要預熱的節點
+    """
+
+    image = numpy.zeros(BLANK_FRAME_SHAPE, dtype=numpy.uint8)
+    start = time.perf_counter()
+    for node in nodes:
+        try:
+            context.run_recognition(node, image)
+        except Exception:
+            logger.exception(f"預熱 {node} 失敗")
+    logger.info(f"辨識預熱完成，耗時 {time.perf_counter() - start:.2f} 秒")
+
+
+class RecognitionWarmUp(ContextEventSink):
+    """
+    啟動遊戲的節點執行完動作後在背景預熱辨識，與等待遊戲載入的時間重疊，
+    每次啟動 agent 只預熱一次。預熱使用的 context 屬於目前的任務，任務結束時等待預熱完成
+
+    框架只對設定 focus 的節點發送事件，after 中的節點需在 pipeline 中加上 "focus": {}
+
+    :param nodes: 要預熱的節點
+    :param after: 執行完動作後開始預熱的節點
+    """
+
+    def __init__(self, nodes: list[str], after: list[str]):
+        self.nodes = nodes
+        self.after = set(after)
+        self.started = False
+        self.thread = None
+        self.verified = False
+
+    def on_node_pipeline_node(
+        self,
+        context: Context,
+        noti_type: NotificationType,
+        detail: ContextEventSink.NodePipelineNodeDetail,
+    ):
+        if self.verified:
+            return
+        self.verified = True
+        missing = nodes_without_focus(self.after, context.get_node_data)
+        if missing:
+            logger.warning(
+                f"節點 {', '.join(missing)} 沒有設定 focus 或不存在，無法預熱"
+            )
+
+    def on_node_action(
+        self,
+        context: Context,
+        noti_type: NotificationType,
+        detail: ContextEventSink.NodeActionDetail,
+    ):
+        if noti_type != NotificationType.Succeeded or detail.name not in self.after:
+            return
+        if self.started:
+            return
+        self.started = True
+        logger.info(f"{detail.name} 執行完成，在背景預熱辨識")
+        self.thread = threading.Thread(
+            target=warm_up_recognition,
+            args=(context.clone(), self.nodes),
+            name="RecognitionWarmUp",
+            daemon=True,
+        )
+        self.thread.start()
+
+    def join(self):
+        """等待預熱結束，任務結束後預熱使用的 context 便不再有效"""
+        if self.thread is None:
+            return
+        start = time.perf_counter()
+        self.thread.join()
+        self.thread = None
+        waited = time.perf_counter() - start
+        if waited > 0.01:
+            logger.info(f"任務結束時等待辨識預熱 {waited:.2f} 秒")
+
+
+class _TaskEndSink(TaskerEventSink):
+    def __init__(self, warmup: RecognitionWarmUp):
+        self.warmup = warmup
+
+    def on_tasker_task(
+        self,
+        tasker: Tasker,
+        noti_type: NotificationType,
+        detail: TaskerEventSink.TaskerTaskDetail,
+    ):
+        if noti_type in (NotificationType.Succeeded, NotificationType.Failed):
+            self.warmup.join()
+
+
+def _init_warmup() -> RecognitionWarmUp | None:
+    config = read_agent_config()["warmup"]
+    if not config["enabled"]:
+        return None
+    warmup = RecognitionWarmUp(config["nodes"], config["after"])
+    AgentServer.add_context_sink(warmup)
+    AgentServer.add_tasker_sink(_TaskEndSink(warmup))
+    return warmup
+
+
+warmup = _init_warmup()
@@ -0,0 +1,185 @@
+import time
+from collections import Counter, defaultdict
+
+from maa.agent.agent_server import AgentServer
+from maa.context import Context, ContextEventSink
+from maa.event_sink import NotificationType
+
+from my_utils import get_logger, nodes_without_focus
+from my_state import read_agent_config
+from my_hooks import Hook, register_hook
+from my_postmortem import flush_postmortem
+
+logger = get_logger(__name__)
+
+
+class NodeWatchdog(ContextEventSink, Hook):
+    """
+    記錄目前任務中每個節點執行的次數與時間，超過預算時中斷迴圈
+
+    節點的時間包含自己的動作與等待 next 辨識的時間。框架只對設定 focus 的節點發送事件，
+    無法得知其他節點何時執行，因此只在確定框架仍停留在該節點時計時：
+    動作從 Action 開始到結束，等待 next 從 PipelineNode 開始到 NextList 結束，
+    之後命中的節點執行動作時已不屬於該節點，無法判斷位置時停止計時。
+    第一次超過預算時將節點的 next 改為 recovery 指定的節點，
+    recovery 為 None 或再次超過預算時清空 next 結束目前的流程
+
+    第一次執行自定義動作或辨識時檢查預算中的節點是否都會產生事件
+
+    :param budgets: {節點: {"max_runs": 次數, "max_seconds": 秒數, "recovery": 節點}}
+    """
+
+    def __init__(self, budgets: dict[str, dict]):
+        self.budgets = budgets
+        self.task_id = None
+        self.runs = Counter()
+        self.elapsed = defaultdict(float)
+        self.violations = Counter()
+        # 目前執行中的節點與開始時間
+        self.current = None
+        self.started = 0.0
+        # 被改寫 next 的節點與原本的 next
+        self.redirected = {}
+        self.verified = False
+
+    def before(self, kind, name, context, argv):
+        if self.verified:
+            return
+        self.verified = True
+        missing = nodes_without_focus(self.budgets, context.get_node_data)
+        if missing:
+            logger.warning(
+                f"節點 {', '.join(missing)} 沒有設定 focus 或不存在，看門狗無法監控"
+            )
+
+    def _reset(self, task_id: int):
+        self.task_id = task_id
+        self.runs.clear()
+        self.elapsed.clear()
+        self.violations.clear()
+        self.current = None
+
+    def _start(self, name: str):
+        # 沒有收到上一個節點結束的事件時無法得知時間花在哪裡，不計入
+        self.current, self.started = name, time.perf_counter()
+
+    def _stop(self, name: str = None):
+        """
+        將目前節點的時間計入，並停止計時
+
+        :param name: 指定時只在目前節點為此節點時停止
+        """
+
+        if self.current is None or (name is not None and name != self.current):
+            return
+        self.elapsed[self.current] += time.perf_counter() - self.started
+        self.current = None
+
+    def on_node_pipeline_node(
+        self,
+        context: Context,
+        noti_type: NotificationType,
+        detail: ContextEventSink.NodePipelineNodeDetail,
+    ):
+        if noti_type != NotificationType.Starting:
+            # PipelineNode 結束時命中的節點已執行完動作
+            self._stop(detail.name)
+            return
+
+        # 已進入恢復流程或下一個任務，還原節點原本的 next，
+        # 節點再次執行自己時改寫還沒生效，等到離開時再還原
+        if detail.name not in self.redirected:
+            for node, next_list in self.redirected.items():
+                context.override_next(node, next_list)
+            self.redirected.clear()
+        if detail.task_id != self.task_id:
+            self._reset(detail.task_id)
+
+        self._start(detail.name)
+        if detail.name in self.budgets:
+            self.runs[detail.name] += 1
+            self._check(context, detail.name, self.started)
+
+    def on_node_next_list(
+        self,
+        context: Context,
+        noti_type: NotificationType,
+        detail: ContextEventSink.NodeNextListDetail,
+    ):
+        # next 辨識結束後執行的是命中節點的動作，無法得知是哪個節點
+        if noti_type != NotificationType.Starting:
+            self._stop(detail.name)
+
+    def on_node_action(
+        self,
+        context: Context,
+        noti_type: NotificationType,
+        detail: ContextEventSink.NodeActionDetail,
+    ):
+        if detail.task_id != self.task_id:
+            self._stop()
+            return
+        if noti_type == NotificationType.Starting:
+            self._start(detail.name)
+        else:
+            self._stop(detail.name)
+
+    def on_node_recognition(
+        self,
+        context: Context,
+        noti_type: NotificationType,
+        detail: ContextEventSink.NodeRecognitionDetail,
+    ):
+        # 等待 next 辨識時也檢查目前節點的時間
+        if noti_type != NotificationType.Starting:
+            return
+        if detail.task_id == self.task_id and self.current in self.budgets:
+            self._check(context, self.current, time.perf_counter())
+
+    def _check(self, context: Context, node: str, now: float):
+        budget = self.budgets[node]
+        runs = self.runs[node]
+        seconds = self.elapsed[node] + now - self.started
+        max_runs = budget.get("max_runs")
+        max_seconds = budget.get("max_seconds")
+        if max_runs is not None and runs > max_runs:
+            reason = f"{node} 執行 {runs} 次，超過 {max_runs} 次"
+        elif max_seconds is not None and seconds > max_seconds:
+            reason = f"{node} 執行 {seconds:.0f} 秒，超過 {max_seconds} 秒"
+        else:
+            return
+        self._recover(context, node, reason)
+
+    def _recover(self, context: Context, node: str, reason: str):
+        self.violations[node] += 1
+        recovery = self.budgets[node].get("recovery")
+        if self.violations[node] > 1:
+            recovery = None
+
+        if recovery:
+            logger.warning(f"{reason}，改為執行 {recovery}")
+        else:
+            logger.warning(f"{reason}，結束目前的流程")
+        flush_postmortem(context, node, reason)
+
+        if node not in self.redirected:
+            node_data = context.get_node_data(node) or {}
+            self.redirected[node] = node_data.get("next", [])
+        context.override_next(node, [recovery] if recovery else [])
+        # 恢復後重新計算預算
+        self.runs[node] = 0
+        self.elapsed[node] = 0.0
+        self.started = time.perf_counter()
+
+
+def _init_watchdog() -> NodeWatchdog | None:
+    config = read_agent_config()["watchdog"]
+    if not config["enabled"]:
+        return None
+    watchdog = NodeWatchdog(config["budgets"])
+    AgentServer.add_context_sink(watchdog)
+    register_hook(watchdog)
+    return watchdog
+
+
+watchdog = _init_watchdog()
@@ -0,0 +1,472 @@
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import platform
+import statistics
+import tempfile
+from pathlib import Path
+from collections import Counter
+from contextlib import contextmanager
+
+bench_dir = Path(__file__).parent.resolve()
+assets_dir = bench_dir.parent.parent / "assets"
+agent_dir = assets_dir / "agent"
+BASELINE_PATH = bench_dir / "baseline.json"
+# 耗時主要來自 fsync 的項目，受磁碟影響、無法以校準換算，只報告不判斷退步，
+# 改以呼叫次數判斷
+IO_BOUND = {"BuySupplyOfficeProduct"}
+
+# maa 替身需在真正的 maa 之前被找到
+for path in (agent_dir, bench_dir):
+    if str(path) not in sys.path:
+        sys.path.insert(0, str(path))
+
+from maa.context import Context
+from maa.define import (
+    TaskDetail,
+    NodeDetail,
+    Status,
+    recognition_hit,
+    recognition_miss,
+)
+from maa.custom_recognition import CustomRecognition
+from maa.custom_action import CustomAction
+from maa.agent.agent_server import AgentServer
+
+sys.stdout.reconfigure(encoding="utf-8")
+
+# CheckSupplyOfficeProduct 依序辨識的六個商品區域
+PRODUCT_ROIS = [
+    [330, 100, 280, 230],
+    [330, 365, 280, 230],
+    [650, 100, 280, 230],
+    [650, 365, 280, 230],
+    [980, 100, 280, 230],
+    [980, 365, 280, 230],
+]
+# 採購成功時 SupplyOfficeTemplate 會完成的節點
+PURCHASE_NODES = [
+    "EnterSupplyOfficeItemDetail",
+    "AutoBuySupplyOfficeProduct",
+    "VerifySupplyOfficeProduct",
+    "BuySupplyOfficeProduct",
+    "SupplyOfficeProductObtained",
+    "CloseSupplyOfficeItem",
+    "CompletedSupplyOffice",
+]
+
+
+### 工作目錄 ###
+
+
+def prepare_workdir(workdir: Path, products: dict):
+    """建立與安裝後相同的目錄結構，採購部選項全部開啟"""
+    (workdir / "agent").mkdir(parents=True)
+    (workdir / "config").mkdir()
+    shutil.copy2(assets_dir / "interface.json", workdir)
+    for path in agent_dir.glob("*.json"):
+        shutil.copy2(path, workdir / "agent")
+
+    config = {
+        "task": [
+            {
+                "name": "採購部",
+                "option": [{"name": key, "value": "Yes"} for key in products],
+            }
+        ]
+    }
+    with open(workdir / "config" / "maa_pi_config.json", "w", encoding="utf-8") as f:
+        json.dump(config, f, ensure_ascii=False)
+    # 反覆呼叫同一個辨識會觸發失敗輸出，基準測試不需要
+    with open(workdir / "config" / "agent_config.json", "w", encoding="utf-8") as f:
+        json.dump({"postmortem": {"enabled": False}}, f)
+
+
+def reset_state(workdir: Path):
+    for path in (workdir / "config").glob("minos_data.json*"):
+        path.unlink()
+    for path in (workdir / "config").glob("supplyoffice_journal.jsonl*"):
+        path.unlink()
+
+
+def load_pipeline() -> dict:
+    pipeline = {}
+    for path in sorted((assets_dir / "resource" / "base" / "pipeline").rglob("*.json")):
+        with open(path, encoding="utf-8") as f:
+            pipeline.update(json.load(f))
+    return pipeline
+
+
+def quiet_agent_loggers():
+    """agent 的 log 仍寫入檔案，但不輸出到終端"""
+    for name in list(logging.root.manager.loggerDict):
+        if not name.startswith("my_"):
+            continue
+        for handler in logging.getLogger(name).handlers:
+            if type(handler) is logging.StreamHandler:
+                handler.setLevel(logging.WARNING)
+
+
+### 模擬畫面 ###
+
+
+class Screen:
+    """以 roi 對應文字模擬 OCR 結果"""
+
+    def __init__(self):
+        self.texts = {}
+
+    def place_product(self, product: dict, slot: int):
+        self.texts.clear()
+        roi = PRODUCT_ROIS[slot]
+        expected = product["expected"]
+        self.texts[tuple(roi)] = expected if isinstance(expected, str) else expected[0]
+        if product["is_discounted"]:
+            discount_roi = [roi[0] - 100, roi[1], roi[2] - 50, roi[3]]
+            self.texts[tuple(discount_roi)] = "-50%"
+
+    def recognize(self, context, entry, image, node):
+        text = self.texts.get(tuple(node.get("roi", [])))
+        expected = node.get("expected", "")
+        if isinstance(expected, str):
+            expected = [expected]
+        if text is not None and any(re.search(e, text) for e in expected):
+            return recognition_hit(entry, node["roi"], text)
+        return recognition_miss(entry)
+
+
+def supplyoffice_task_runner(products: dict, screen: Screen):
+    """
+    模擬 SupplyOfficeTemplate，在 AutoBuySupplyOfficeProduct 呼叫真正的自定義辨識，
+    並在寫入日誌的節點呼叫真正的 JournalSupplyOfficeStep
+    """
+    recognition = AgentServer._custom_recognition_holder["CheckSupplyOfficeProduct"]
+    journal = AgentServer._custom_action_holder["JournalSupplyOfficeStep"]
+    slots = {key: i % len(PRODUCT_ROIS) for i, key in enumerate(products)}
+
+    def run(context, entry, pipeline):
+        param = pipeline["AutoBuySupplyOfficeProduct"]["custom_recognition_param"]
+        key = param["key"]
+        screen.place_product(products[key], slots[key])
+        box = recognition.analyze(
+            context,
+            CustomRecognition.AnalyzeArg(
+                node_name="AutoBuySupplyOfficeProduct",
+                custom_recognition_param=json.dumps(param, ensure_ascii=False),
+                image=context.tasker.controller.post_screencap().wait().get(),
+            ),
+        )
+        names = PURCHASE_NODES if box else PURCHASE_NODES[:1]
+        for name in names:
+            param = pipeline.get(name, {}).get("custom_action_param")
+            if param is None:
+                continue
+            journal.run(
+                context,
+                CustomAction.RunArg(
+                    node_name=name,
+                    custom_action_param=json.dumps(param, ensure_ascii=False),
+                    box=box or [0, 0, 1, 1],
+                ),
+            )
+        nodes = [
+            NodeDetail(
+                node_id=i, name=name, recognition=None, action=None, completed=True
+            )
+            for i, name in enumerate(names)
+        ]
+        return TaskDetail(task_id=0, entry=entry, nodes=nodes, status=Status(True))
+
+    return run
+
+
+### 計時 ###
+
+
+def measure(fn, setup=None, number: int = 1, rounds: int = 7) -> float:
+    """:return: 每次呼叫耗時的中位數 (ms)"""
+    if setup:
+        setup()
+    fn()  # 預熱
+    samples = []
+    for _ in range(rounds):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter() - start) / number * 1000)
+    return statistics.median(samples)
+
+
+def calibrate(rounds: int) -> float:
+    """
+    固定的純 Python 工作量，用來換算不同機器上的耗時，
+    基準在開發機產生、在 CI 比較時才有意義
+
+    :return: 最短耗時 (ms)
+    """
+
+    data = {f"key{i}": [i, str(i), {"n": i}] for i in range(2000)}
+
+    def work():
+        text = json.dumps(data)
+        sorted(json.loads(text).items(), key=lambda item: item[1][1])
+
+    # 取最小值，受背景負載的影響比中位數小
+    work()
+    samples = []
+    for _ in range(rounds * 3):
+        start = time.perf_counter()
+        work()
+        samples.append((time.perf_counter() - start) * 1000)
+    return min(samples)
+
+
+@contextmanager
+def count_writes():
+    """計算區塊內原子寫入 JSON 與追加 journal 的次數"""
+    import my_state
+    import my_action
+
+    counter = Counter()
+    write, append = my_state._write, my_action.append_journal
+
+    def counted_write(*args, **kwargs):
+        counter["json_write"] += 1
+        return write(*args, **kwargs)
+
+    def counted_append(*args, **kwargs):
+        counter["journal_append"] += 1
+        return append(*args, **kwargs)
+
+    my_state._write, my_action.append_journal = counted_write, counted_append
+    try:
+        yield counter
+    finally:
+        my_state._write, my_action.append_journal = write, append
+
+
+def run_benchmarks(workdir: Path, rounds: int) -> tuple[dict, dict]:
+    """:return: 每項測試的耗時 (ms) 與 I/O 項目的呼叫次數"""
+    from my_utils import is_new_period
+    from my_state import read_json, RECORD_PATH
+    from my_reco import VerifyTime, CheckSupplyOfficeProduct
+    from my_action import BuySupplyOfficeProduct
+
+    quiet_agent_loggers()
+
+    with open("agent/supplyoffice_products.json", encoding="utf-8") as f:
+        products = json.load(f)
+    pipeline = load_pipeline()
+    screen = Screen()
+    results = {}
+
+    # is_new_period
+    now_ms = int(time.time() * 1000)
+    cases = [
+        (ts, period)
+        for ts in (0, now_ms, now_ms - 86_400_000, now_ms - 40 * 86_400_000)
+        for period in ("day", "week", "month", "noon", "night")
+    ]
+
+    def bench_period():
+        for ts, period in cases:
+            is_new_period(ts, period)
+
+    results["is_new_period"] = measure(bench_period, number=200, rounds=rounds) / len(
+        cases
+    )
+
+    # 設定與商品目錄讀取
+    def bench_loading():
+        for path in (
+            "agent/supplyoffice_products.json",
+            "agent/stormymemories_level.json",
+            "config/maa_pi_config.json",
+            "interface.json",
+        ):
+            with open(path, encoding="utf-8") as f:
+                json.load(f)
+        read_json(RECORD_PATH)
+
+    results["config_loading"] = measure(bench_loading, number=20, rounds=rounds)
+
+    # VerifyTime，紀錄已存在時只讀不寫
+    verify_arg = CustomRecognition.AnalyzeArg(
+        custom_recognition_param=json.dumps({"key": "記憶風暴", "period_type": "day"})
+    )
+    verify_context = Context(pipeline)
+    VerifyTime().analyze(verify_context, verify_arg)
+    results["VerifyTime"] = measure(
+        lambda: VerifyTime().analyze(verify_context, verify_arg),
+        number=50,
+        rounds=rounds,
+    )
+
+    # CheckSupplyOfficeProduct，最壞情況：折扣商品位於最後一個區域
+    discounted = next(key for key, item in products.items() if item["is_discounted"])
+    check_context = Context(pipeline, recognizer=screen.recognize)
+    check_arg = CustomRecognition.AnalyzeArg(
+        custom_recognition_param=json.dumps({"key": discounted}, ensure_ascii=False),
+        image=check_context.tasker.controller.post_screencap().wait().get(),
+    )
+
+    def bench_check():
+        screen.place_product(products[discounted], len(PRODUCT_ROIS) - 1)
+        if not CheckSupplyOfficeProduct().analyze(check_context, check_arg):
+            raise RuntimeError("CheckSupplyOfficeProduct 未辨識到商品")
+
+    results["CheckSupplyOfficeProduct"] = measure(bench_check, number=20, rounds=rounds)
+
+    # BuySupplyOfficeProduct，全部 20 項商品都需要採購
+    def bench_buy():
+        context = Context(
+            pipeline,
+            recognizer=screen.recognize,
+            task_runner=supplyoffice_task_runner(products, screen),
+        )
+        if not BuySupplyOfficeProduct().run(context, CustomAction.RunArg()):
+            raise RuntimeError("BuySupplyOfficeProduct 執行失敗")
+        if context.calls["run_task"] != len(products):
+            raise RuntimeError(f"只採購了 {context.calls['run_task']} 項商品")
+        return context
+
+    results["BuySupplyOfficeProduct"] = measure(
+        bench_buy, setup=lambda: reset_state(Path.cwd()), rounds=rounds
+    )
+
+    # 呼叫次數不受機器影響，可以精確比較
+    reset_state(Path.cwd())
+    with count_writes() as writes:
+        context = bench_buy()
+    counts = {
+        f"BuySupplyOfficeProduct.{name}": count
+        for name, count in sorted({**context.calls, **writes}.items())
+    }
+    return results, counts
+
+
+### 比較 ###
+
+
+def compare(
+    results: dict, baseline: dict, scale: float, threshold: float, min_delta: float
+) -> bool:
+    """
+    :param scale: 本機與產生基準的機器的速度比，基準耗時乘上此值後再比較
+    """
+
+    ok = True
+    print(f"{'項目':<28}{'目前 (ms)':>12}{'基準 (ms)':>12}{'變化':>10}")
+    for name, value in results.items():
+        base = baseline.get(name)
+        if base is None:
+            # 新增的測試項目需要一併更新基準
+            print(f"{name:<28}{value:>12.4f}{'-':>12}{'-':>10}  <-- 基準缺少此項")
+            ok = False
+            continue
+        base *= scale
+        change = (value - base) / base if base else 0.0
+        if name in IO_BOUND:
+            print(f"{name:<28}{value:>12.4f}{base:>12.4f}{change:>+10.1%}  (僅報告)")
+            continue
+        regressed = change > threshold and value - base > min_delta
+        mark = "  <-- 退步" if regressed else ""
+        print(f"{name:<28}{value:>12.4f}{base:>12.4f}{change:>+10.1%}{mark}")
+        ok = ok and not regressed
+    return ok
+
+
+def compare_counts(counts: dict, baseline: dict) -> bool:
+    """呼叫次數比基準多即視為退步"""
+    ok = True
+    print(f"{'呼叫次數':<44}{'目前':>8}{'基準':>8}")
+    for name, value in counts.items():
+        base = baseline.get(name)
+        if base is None:
+            print(f"{name:<44}{value:>8}{'-':>8}  <-- 基準缺少此項")
+            ok = False
+            continue
+        mark = "  <-- 退步" if value > base else ""
+        print(f"{name:<44}{value:>8}{base:>8}{mark}")
+        ok = ok and value <= base
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="agent 模組微基準測試")
+    parser.add_argument("--rounds", type=int, default=7, help="每項測試的輪數")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument(
+        "--save-baseline", action="store_true", help="將本次結果存為基準"
+    )
+    parser.add_argument(
+        "--threshold", type=float, default=0.25, help="超過基準多少比例視為退步"
+    )
+    parser.add_argument(
+        "--min-delta", type=float, default=0.05, help="低於此毫秒數的差異不視為退步"
+    )
+    args = parser.parse_args()
+    args.baseline = args.baseline.resolve()
+
+    with open(agent_dir / "supplyoffice_products.json", encoding="utf-8") as f:
+        products = json.load(f)
+
+    cwd = Path.cwd()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        workdir = Path(tmp_dir)
+        prepare_workdir(workdir, products)
+        # agent 模組以工作目錄的相對路徑讀寫檔案
+        os.chdir(workdir)
+        try:
+            calibration = calibrate(args.rounds)
+            results, counts = run_benchmarks(workdir, args.rounds)
+        finally:
+            logging.shutdown()
+            os.chdir(cwd)
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "python": platform.python_version(),
+                    "platform": platform.platform(),
+                    "calibration": calibration,
+                    "results": results,
+                    "counts": counts,
+                },
+                f,
+                indent=4,
+            )
+        print(f"已儲存基準至 {args.baseline}")
+        print("==== 基準測試通過 ====")
+        sys.exit(0)
+
+    # 基準隨 repo 提交，修改測試項目後需以 --save-baseline 重新產生
+    if not args.baseline.exists():
+        print(f"找不到基準 {args.baseline}，請以 --save-baseline 產生並提交")
+        print("==== 基準測試失敗 ====")
+        sys.exit(1)
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    scale = calibration / baseline["calibration"]
+    print(f"校準 {calibration:.4f} ms，基準 {baseline['calibration']:.4f} ms")
+    timings_ok = compare(
+        results, baseline["results"], scale, args.threshold, args.min_delta
+    )
+    if compare_counts(counts, baseline.get("counts", {})) and timings_ok:
+        print("==== 基準測試通過 ====")
+        sys.exit(0)
+    else:
+        print("==== 基準測試退步 ====")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
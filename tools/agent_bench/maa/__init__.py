@@ -0,0 +1 @@
+# 供 agent_bench 使用的 maa 替身，只實作 agent 模組用到的部分，不依賴 MaaFramework 二進位檔
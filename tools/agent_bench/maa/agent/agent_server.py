@@ -0,0 +1,58 @@
+class AgentServer:
+    """只保留註冊表，不建立跨進程連線"""
+
+    _custom_recognition_holder = {}
+    _custom_action_holder = {}
+    _sinks = []
+
+    @staticmethod
+    def custom_recognition(name: str):
+
+        def wrapper_recognition(recognition):
+            AgentServer.register_custom_recognition(name, recognition())
+            return recognition
+
+        return wrapper_recognition
+
+    @staticmethod
+    def register_custom_recognition(name: str, recognition) -> bool:
+        AgentServer._custom_recognition_holder[name] = recognition
+        return True
+
+    @staticmethod
+    def custom_action(name: str):
+
+        def wrapper_action(action):
+            AgentServer.register_custom_action(name, action())
+            return action
+
+        return wrapper_action
+
+    @staticmethod
+    def register_custom_action(name: str, action) -> bool:
+        AgentServer._custom_action_holder[name] = action
+        return True
+
+    @staticmethod
+    def start_up(identifier: str) -> bool:
+        return True
+
+    @staticmethod
+    def shut_down() -> None:
+        pass
+
+    @staticmethod
+    def join() -> None:
+        pass
+
+    @staticmethod
+    def detach() -> None:
+        pass
+
+    @staticmethod
+    def add_tasker_sink(sink) -> None:
+        AgentServer._sinks.append(sink)
+
+    @staticmethod
+    def add_context_sink(sink) -> None:
+        AgentServer._sinks.append(sink)
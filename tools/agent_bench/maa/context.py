@@ -0,0 +1,153 @@
+import copy
+from collections import Counter
+from typing import Callable, Dict, List, Optional
+
+import numpy
+
+from .define import RecognitionDetail, TaskDetail, Status, recognition_miss
+
+SCREEN_SHAPE = (720, 1280, 3)
+
+
+class Job:
+    def __init__(self, result=None, succeeded: bool = True):
+        self._result = result
+        self.succeeded = succeeded
+        self.failed = not succeeded
+        self.done = True
+
+    def wait(self) -> "Job":
+        return self
+
+    def get(self):
+        return self._result
+
+
+class Controller:
+    """
+    以 numpy 陣列代替截圖的控制器
+
+    :param frames: 依序回傳的截圖，用完後重複最後一張，預設為全黑畫面
+    """
+
+    def __init__(self, frames: Optional[List[numpy.ndarray]] = None):
+        self.frames = frames or [numpy.zeros(SCREEN_SHAPE, numpy.uint8)]
+        self.frame_index = 0
+        self.actions = []
+
+    def post_screencap(self) -> Job:
+        frame = self.frames[min(self.frame_index, len(self.frames) - 1)]
+        self.frame_index += 1
+        return Job(frame)
+
+    @property
+    def cached_image(self) -> numpy.ndarray:
+        return self.frames[min(max(self.frame_index - 1, 0), len(self.frames) - 1)]
+
+    def post_click(self, x: int, y: int) -> Job:
+        self.actions.append(("click", x, y))
+        return Job()
+
+    def post_swipe(self, x1: int, y1: int, x2: int, y2: int, duration: int) -> Job:
+        self.actions.append(("swipe", x1, y1, x2, y2, duration))
+        return Job()
+
+
+class Tasker:
+    def __init__(self, controller: Controller):
+        self.controller = controller
+        self.stopping = False
+
+    def post_stop(self) -> Job:
+        self.stopping = True
+        return Job()
+
+
+class Context:
+    """
+    可腳本化的 Context 替身
+
+    :param pipeline: 節點資料，供 get_node_data 使用
+    :param recognizer: (context, entry, image, node) -> RecognitionDetail | None，
+        node 為套用 pipeline_override 後的節點資料，預設一律未命中
+    :param task_runner: (context, entry, pipeline) -> TaskDetail | None，
+        pipeline 為套用 pipeline_override 後的完整覆蓋內容，預設回傳沒有節點的成功結果
+    :param controller: 預設為全黑畫面的 Controller
+    """
+
+    def __init__(
+        self,
+        pipeline: Optional[Dict] = None,
+        recognizer: Optional[Callable] = None,
+        task_runner: Optional[Callable] = None,
+        controller: Optional[Controller] = None,
+    ):
+        self.pipeline = copy.deepcopy(pipeline or {})
+        self.overrides = {}
+        self.recognizer = recognizer
+        self.task_runner = task_runner
+        self.tasker = Tasker(controller or Controller())
+        self.calls = Counter()
+
+    @staticmethod
+    def _merge(target: Dict, override: Dict):
+        for name, fields in override.items():
+            node = target.setdefault(name, {})
+            for key, value in fields.items():
+                # attach 與 MaaFramework 相同，覆蓋時合併而非取代
+                if key == "attach" and isinstance(node.get(key), dict):
+                    node[key] = {**node[key], **value}
+                else:
+                    node[key] = value
+
+    def _resolved(self, pipeline_override: Dict) -> Dict:
+        resolved = copy.deepcopy(self.overrides)
+        self._merge(resolved, pipeline_override)
+        return resolved
+
+    def get_node_data(self, name: str) -> Optional[Dict]:
+        self.calls["get_node_data"] += 1
+        node = copy.deepcopy(self.pipeline.get(name, {}))
+        self._merge({name: node}, {name: self.overrides.get(name, {})})
+        return node or None
+
+    def override_pipeline(self, pipeline_override: Dict) -> bool:
+        self.calls["override_pipeline"] += 1
+        self._merge(self.overrides, pipeline_override)
+        return True
+
+    def override_next(self, name: str, next_list: List[str]) -> bool:
+        self.calls["override_next"] += 1
+        self._merge(self.overrides, {name: {"next": next_list}})
+        return True
+
+    def run_task(
+        self, entry: str, pipeline_override: Dict = {}
+    ) -> Optional[TaskDetail]:
+        self.calls["run_task"] += 1
+        if self.task_runner is None:
+            return TaskDetail(task_id=0, entry=entry, nodes=[], status=Status(True))
+        return self.task_runner(self, entry, self._resolved(pipeline_override))
+
+    def run_recognition(
+        self,
+        entry: str,
+        image: numpy.ndarray,
+        pipeline_override: Dict = {},
+    ) -> Optional[RecognitionDetail]:
+        self.calls["run_recognition"] += 1
+        if self.recognizer is None:
+            return recognition_miss(entry)
+        node = {
+            **self.pipeline.get(entry, {}),
+            **self._resolved(pipeline_override).get(entry, {}),
+        }
+        return self.recognizer(self, entry, image, node)
+
+    def clone(self) -> "Context":
+        cloned = Context(
+            self.pipeline, self.recognizer, self.task_runner, self.tasker.controller
+        )
+        cloned.overrides = copy.deepcopy(self.overrides)
+        cloned.calls = self.calls
+        return cloned
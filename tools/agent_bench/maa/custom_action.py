@@ -0,0 +1,25 @@
+from abc import abstractmethod
+from dataclasses import dataclass
+from typing import Optional
+
+from .define import Rect, RecognitionDetail, TaskDetail
+
+
+class CustomAction:
+
+    @dataclass
+    class RunArg:
+        task_detail: Optional[TaskDetail] = None
+        node_name: str = ""
+        custom_action_name: str = ""
+        custom_action_param: str = "{}"
+        reco_detail: Optional[RecognitionDetail] = None
+        box: Optional[Rect] = None
+
+    @dataclass
+    class RunResult:
+        success: bool
+
+    @abstractmethod
+    def run(self, context, argv: RunArg):
+        raise NotImplementedError
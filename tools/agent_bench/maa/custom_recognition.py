@@ -0,0 +1,28 @@
+from abc import abstractmethod
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy
+
+from .define import Rect, TaskDetail
+
+
+class CustomRecognition:
+
+    @dataclass
+    class AnalyzeArg:
+        task_detail: Optional[TaskDetail] = None
+        node_name: str = ""
+        custom_recognition_name: str = ""
+        custom_recognition_param: str = "{}"
+        image: Optional[numpy.ndarray] = None
+        roi: Optional[Rect] = None
+
+    @dataclass
+    class AnalyzeResult:
+        box: Optional[Rect]
+        detail: dict
+
+    @abstractmethod
+    def analyze(self, context, argv: AnalyzeArg):
+        raise NotImplementedError
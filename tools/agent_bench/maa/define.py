@@ -0,0 +1,81 @@
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+import numpy
+
+Rect = List[int]
+
+
+@dataclass
+class OCRResult:
+    box: Rect
+    score: float
+    text: str
+
+
+@dataclass
+class RecognitionDetail:
+    reco_id: int
+    name: str
+    algorithm: str
+    hit: bool
+    box: Optional[Rect]
+    all_results: list = field(default_factory=list)
+    filtered_results: list = field(default_factory=list)
+    best_result: Optional[OCRResult] = None
+    raw_detail: dict = field(default_factory=dict)
+    raw_image: Optional[numpy.ndarray] = None
+    draw_images: list = field(default_factory=list)
+
+
+@dataclass
+class ActionDetail:
+    action_id: int
+    name: str
+    action: str
+    box: Rect
+    success: bool
+    detail: dict = field(default_factory=dict)
+
+
+@dataclass
+class NodeDetail:
+    node_id: int
+    name: str
+    recognition: Optional[RecognitionDetail]
+    action: Optional[ActionDetail]
+    completed: bool
+
+
+class Status:
+    def __init__(self, succeeded: bool):
+        self.succeeded = succeeded
+        self.failed = not succeeded
+        self.done = True
+
+
+@dataclass
+class TaskDetail:
+    task_id: int
+    entry: str
+    nodes: List[NodeDetail]
+    status: Status
+
+
+def recognition_hit(name: str, box: Rect, text: str = "") -> RecognitionDetail:
+    result = OCRResult(box=box, score=1.0, text=text)
+    return RecognitionDetail(
+        reco_id=0,
+        name=name,
+        algorithm="OCR",
+        hit=True,
+        box=box,
+        all_results=[result],
+        filtered_results=[result],
+        best_result=result,
+    )
+
+
+def recognition_miss(name: str) -> RecognitionDetail:
+    # 與 MaaFramework 5 相同，未命中時仍回傳 detail，hit 為 False
+    return RecognitionDetail(reco_id=0, name=name, algorithm="OCR", hit=False, box=None)
@@ -0,0 +1,12 @@
+from enum import IntEnum
+
+
+class NotificationType(IntEnum):
+    Unknown = 0
+    Starting = 1
+    Succeeded = 2
+    Failed = 3
+
+
+class EventSink:
+    pass
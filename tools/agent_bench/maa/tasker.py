@@ -0,0 +1,19 @@
+from dataclasses import dataclass
+
+from .context import Tasker
+from .event_sink import EventSink, NotificationType
+
+
+class TaskerEventSink(EventSink):
+
+    @dataclass
+    class TaskerTaskDetail:
+        task_id: int
+        entry: str
+        uuid: str
+        hash: str
+
+    def on_tasker_task(
+        self, tasker: Tasker, noti_type: NotificationType, detail: TaskerTaskDetail
+    ):
+        pass
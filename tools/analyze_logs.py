@@ -0,0 +1,287 @@
+import re
+import sys
+import csv
+import json
+import argparse
+from array import array
+from collections import Counter, defaultdict
+from datetime import datetime
+from pathlib import Path
+
+assets_dir = Path(__file__).resolve().parent.parent / "assets"
+
+sys.stdout.reconfigure(encoding="utf-8")
+
+# 框架 debug/maa.log
+FRAMEWORK_LINE = re.compile(
+    r"^\[(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d\.\d+)\]\[\w+\]\[Px\d+\]\[Tx(\d+)\]"
+)
+NODE_DONE = re.compile(
+    r"PipelineTask node done \[result=(\{.*?\})\] \[task_id_=(\d+)\]"
+)
+TASK_EVENT = re.compile(
+    r"\[msg=Tasker\.Task\.(Starting|Succeeded|Failed)\] \[details=(.*)"
+)
+# agent 的 debug/custom/<date>.log
+AGENT_LINE = re.compile(
+    r"^(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d) \| (\w+) \| ([\w.]+):(\w+):\d+ \| "
+)
+
+
+### 統計 ###
+
+
+class Series:
+    """以 array 保存數值，GB 等級的 log 也不會佔用過多記憶體"""
+
+    def __init__(self):
+        self.values = array("d")
+        self.failed = 0
+
+    def add(self, value: float, failed: bool = False):
+        self.values.append(value)
+        self.failed += failed
+
+    def summary(self) -> dict:
+        values = sorted(self.values)
+        count = len(values)
+        if not count:
+            return {"count": 0, "failed": self.failed}
+
+        def percentile(p: float) -> float:
+            return values[min(count - 1, int(p * count))]
+
+        return {
+            "count": count,
+            "failed": self.failed,
+            "fail_rate": self.failed / count,
+            "p50_ms": percentile(0.5),
+            "p95_ms": percentile(0.95),
+            "max_ms": values[-1],
+        }
+
+
+class LogStats:
+    """
+    串流讀取 log 並將節點與任務的開始、結束事件配對
+
+    節點的時間為同一個任務中上一個節點結束 (或任務開始) 到此節點結束，
+    包含等待辨識與執行動作。同一個節點連續執行視為一次迴圈
+    """
+
+    def __init__(self):
+        self.nodes = defaultdict(Series)
+        self.tasks = defaultdict(Series)
+        self.loops = defaultdict(Series)
+        self.agent = Counter()
+        # {task_id: 上一個事件的時間}
+        self.last_event = {}
+        # {task_id: (節點, 連續次數)}
+        self.streaks = {}
+        # {task_id: (entry, 開始時間)}
+        self.running = {}
+        # 讀取中的多行 details: (thread, 事件, 時間, 已讀內容)
+        self.pending = {}
+
+    def _end_streak(self, task_id: str):
+        streak = self.streaks.pop(task_id, None)
+        if streak and streak[1] > 1:
+            self.loops[streak[0]].add(streak[1])
+
+    def node_done(self, ts: datetime, result: dict, task_id: str):
+        name = result["name"]
+        start = self.last_event.get(task_id)
+        self.last_event[task_id] = ts
+        if start is not None:
+            elapsed = (ts - start).total_seconds() * 1000
+            self.nodes[name].add(elapsed, not result.get("completed", True))
+
+        streak = self.streaks.get(task_id)
+        if streak and streak[0] == name:
+            self.streaks[task_id] = (name, streak[1] + 1)
+        else:
+            self._end_streak(task_id)
+            self.streaks[task_id] = (name, 1)
+
+    def task_event(self, ts: datetime, event: str, details: dict):
+        task_id = str(details.get("task_id"))
+        if event == "Starting":
+            self.running[task_id] = (details.get("entry", "?"), ts)
+            self.last_event[task_id] = ts
+            return
+        entry, start = self.running.pop(task_id, (details.get("entry", "?"), None))
+        if start is not None:
+            elapsed = (ts - start).total_seconds() * 1000
+            self.tasks[entry].add(elapsed, event == "Failed")
+        self.last_event.pop(task_id, None)
+        self._end_streak(task_id)
+
+    def feed_framework(self, line: str):
+        match = FRAMEWORK_LINE.match(line)
+        thread = match.group(2) if match else None
+
+        # 事件的 details 為多行 JSON，讀到結尾才解析
+        if thread is None:
+            for key, (event, ts, buffer) in self.pending.items():
+                buffer.append(line)
+                if line.startswith("}]"):
+                    del self.pending[key]
+                    self._finish_event(event, ts, buffer)
+                break
+            return
+
+        if "PipelineTask node done" in line:
+            done = NODE_DONE.search(line)
+            if done:
+                ts = datetime.fromisoformat(match.group(1))
+                self.node_done(ts, json.loads(done.group(1)), done.group(2))
+        elif "Tasker.Task." in line:
+            event = TASK_EVENT.search(line)
+            if event:
+                ts = datetime.fromisoformat(match.group(1))
+                buffer = [event.group(2)]
+                if event.group(2).rstrip().endswith("| enter"):
+                    self._finish_event(event.group(1), ts, buffer)
+                else:
+                    self.pending[thread] = (event.group(1), ts, buffer)
+
+    def _finish_event(self, event: str, ts: datetime, buffer: list[str]):
+        text = "".join(buffer)
+        text = text[: text.rfind("}") + 1]
+        try:
+            details = json.loads(text)
+        except json.JSONDecodeError:
+            return
+        self.task_event(ts, event, details)
+
+    def feed_agent(self, line: str):
+        match = AGENT_LINE.match(line)
+        if match:
+            level, module, func = match.group(2), match.group(3), match.group(4)
+            self.agent[(module, func, level)] += 1
+
+    def finish(self):
+        for task_id in list(self.streaks):
+            self._end_streak(task_id)
+
+
+def find_logs(paths: list[Path]) -> list[Path]:
+    """目錄中尋找所有 .log，依修改時間排序，讓輪替的舊檔先讀"""
+    logs = []
+    for path in paths:
+        if path.is_dir():
+            logs += [p for p in path.rglob("*.log") if p.is_file()]
+        elif path.is_file():
+            logs.append(path)
+    return sorted(set(logs), key=lambda p: p.stat().st_mtime)
+
+
+def analyze(paths: list[Path]) -> LogStats:
+    stats = LogStats()
+    for log in find_logs(paths):
+        with open(log, encoding="utf-8", errors="replace") as f:
+            first = f.readline()
+            f.seek(0)
+            feed = stats.feed_framework if first.startswith("[") else stats.feed_agent
+            for line in f:
+                feed(line)
+    stats.finish()
+    return stats
+
+
+### 輸出 ###
+
+
+def build_report(stats: LogStats) -> dict:
+    report = {"nodes": {}, "tasks": {}, "agent": []}
+    for name, series in stats.nodes.items():
+        report["nodes"][name] = series.summary()
+        loops = stats.loops.get(name)
+        if loops is not None:
+            report["nodes"][name]["loops"] = len(loops.values)
+            report["nodes"][name]["max_iterations"] = int(max(loops.values))
+    for entry, series in stats.tasks.items():
+        report["tasks"][entry] = series.summary()
+    for (module, func, level), count in sorted(stats.agent.items()):
+        report["agent"].append(
+            {"module": module, "function": func, "level": level, "count": count}
+        )
+    return report
+
+
+def print_table(title: str, rows: dict, baseline: dict = None, limit: int = None):
+    print(f"\n{title}")
+    print(
+        f"{'名稱':<36}{'次數':>8}{'失敗率':>8}{'p50':>10}{'p95':>10}{'max':>10}"
+        f"{'迴圈':>6}{'最多':>6}"
+    )
+    ordered = sorted(rows.items(), key=lambda item: -item[1].get("p95_ms", 0))
+    for name, row in ordered[:limit]:
+        if not row["count"]:
+            continue
+        line = (
+            f"{name:<36}{row['count']:>8}{row['fail_rate']:>8.1%}"
+            f"{row['p50_ms']:>10.0f}{row['p95_ms']:>10.0f}{row['max_ms']:>10.0f}"
+            f"{row.get('loops', 0):>6}{row.get('max_iterations', ''):>6}"
+        )
+        old = (baseline or {}).get(name)
+        if old and old.get("count"):
+            line += f"  p95 {row['p95_ms'] - old['p95_ms']:+.0f} ms"
+        print(line)
+
+
+def write_csv(report: dict, path: Path):
+    fields = ["kind", "name", "count", "failed", "fail_rate", "p50_ms", "p95_ms"]
+    fields += ["max_ms", "loops", "max_iterations"]
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fields)
+        writer.writeheader()
+        for kind in ("tasks", "nodes"):
+            for name, row in report[kind].items():
+                writer.writerow({"kind": kind[:-1], "name": name, **row})
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="統計框架與 agent 的 log，輸出每個節點與任務的耗時及失敗率"
+    )
+    parser.add_argument(
+        "paths",
+        nargs="*",
+        type=Path,
+        help="log 檔或目錄，預設為 assets/debug",
+    )
+    parser.add_argument("--csv", type=Path, help="輸出 CSV")
+    parser.add_argument("--json", type=Path, help="輸出 JSON")
+    parser.add_argument(
+        "--compare", type=Path, help="與先前輸出的 JSON 比較 p95 的差異"
+    )
+    parser.add_argument("--top", type=int, default=30, help="節點表格顯示的數量")
+    args = parser.parse_args()
+
+    paths = args.paths or [assets_dir / "debug"]
+    report = build_report(analyze(paths))
+    baseline = {}
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    print_table("任務", report["tasks"], baseline.get("tasks"))
+    print_table("節點 (依 p95 排序)", report["nodes"], baseline.get("nodes"), args.top)
+    warnings = [row for row in report["agent"] if row["level"] in ("WARNING", "ERROR")]
+    if warnings:
+        print("\nagent 警告與錯誤")
+        for row in sorted(warnings, key=lambda row: -row["count"]):
+            print(
+                f"{row['module']}:{row['function']:<30}{row['level']:<8}{row['count']:>6}"
+            )
+
+    if args.csv:
+        write_csv(report, args.csv)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
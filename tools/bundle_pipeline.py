@@ -0,0 +1,234 @@
+import re
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+from pathlib import Path
+
+assets_dir = Path(__file__).parent.parent.resolve() / "assets"
+agent_dir = assets_dir / "agent"
+
+if str(agent_dir) not in sys.path:
+    sys.path.insert(0, str(agent_dir))
+
+from my_utils import build_task_overrides
+
+BUNDLE_NAME = "pipeline.json"
+TASK_OVERRIDES_NAME = "task_overrides.json"
+# 會引用其他節點名稱的欄位
+REFERENCE_FIELDS = ("next", "interrupt", "on_error")
+# next 中的節點名稱可以加上 [JumpBack] 之類的前綴
+NODE_PREFIX = re.compile(r"^(\[\w+\])+")
+
+
+def load_split_pipeline(pipeline_dir: Path) -> tuple[dict, list[str]]:
+    """
+    依 MaaFramework 的順序讀取所有 pipeline 檔案
+
+    :return: (合併後的節點, 錯誤訊息)
+    """
+
+    nodes, sources, errors = {}, {}, []
+    for path in sorted(pipeline_dir.rglob("*.json")):
+        rel = path.relative_to(pipeline_dir).as_posix()
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        for name, node in data.items():
+            if name in sources:
+                errors.append(f"{rel}: 節點 {name} 與 {sources[name]} 重複")
+            sources[name] = rel
+            nodes[name] = node
+    return nodes, errors
+
+
+def _names(value) -> list[str]:
+    values = value if isinstance(value, list) else [value]
+    return [NODE_PREFIX.sub("", v) for v in values if isinstance(v, str)]
+
+
+def validate_pipeline(nodes: dict, interface: dict, resource_dir: Path) -> list[str]:
+    """檢查節點引用、模板圖片與 interface.json 覆蓋的節點是否存在"""
+    errors = []
+    overrides = build_task_overrides(interface)
+
+    # interface.json 覆蓋中完整定義的節點也可以被引用
+    override_sets = [task["pipeline_override"] for task in overrides["task"].values()]
+    for option in overrides["option"].values():
+        override_sets.extend(option["cases"].values())
+    known = set(nodes)
+    for override in override_sets:
+        known.update(override)
+
+    def check_node(where: str, name: str, node: dict):
+        for field in REFERENCE_FIELDS:
+            for ref in _names(node.get(field, [])):
+                if ref not in known:
+                    errors.append(f"{where}: {name}.{field} 引用不存在的節點 {ref}")
+        if isinstance(node.get("roi"), str) and node["roi"] not in known:
+            errors.append(f"{where}: {name}.roi 引用不存在的節點 {node['roi']}")
+        for template in _names(node.get("template", [])):
+            if not (resource_dir / "image" / template).exists():
+                errors.append(f"{where}: {name} 的模板 {template} 不存在")
+
+    for name, node in nodes.items():
+        check_node("pipeline", name, node)
+
+    for task_name, task in overrides["task"].items():
+        if task["entry"] not in known:
+            errors.append(f"interface.json: 任務 {task_name} 的 entry 不存在")
+        for option_name in task["option"]:
+            if option_name not in overrides["option"]:
+                errors.append(
+                    f"interface.json: 任務 {task_name} 的選項 {option_name} 不存在"
+                )
+    for option_name, option in overrides["option"].items():
+        if option["default_case"] not in option["cases"]:
+            errors.append(f"interface.json: 選項 {option_name} 的 default_case 不存在")
+    for override in override_sets:
+        for name, fields in override.items():
+            check_node("interface.json", name, fields)
+    return errors
+
+
+def dump_minified(data: dict) -> str:
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+
+def write_if_changed(path: Path, content: str) -> bool:
+    """內容相同時不改寫，保留修改時間"""
+    if path.exists() and path.read_text(encoding="utf-8") == content:
+        return False
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(content, encoding="utf-8")
+    tmp.replace(path)
+    return True
+
+
+def build_bundle(resource_dir: Path, interface: dict) -> tuple[str, str]:
+    """
+    :return: (合併後的 pipeline, 展開後的任務覆蓋)，皆為最小化的 JSON
+    :raise ValueError: 檢查未通過
+    """
+
+    nodes, errors = load_split_pipeline(resource_dir / "pipeline")
+    errors += validate_pipeline(nodes, interface, resource_dir)
+    if errors:
+        raise ValueError("pipeline 檢查未通過：\n" + "\n".join(errors))
+    return dump_minified(nodes), dump_minified(build_task_overrides(interface))
+
+
+def write_bundle(
+    resource_dir: Path, interface: dict, pipeline_dir: Path, agent_out: Path
+):
+    """將合併後的 pipeline 寫入 pipeline_dir，任務覆蓋寫入 agent_out"""
+    pipeline, task_overrides = build_bundle(resource_dir, interface)
+    write_if_changed(pipeline_dir / BUNDLE_NAME, pipeline)
+    write_if_changed(agent_out / TASK_OVERRIDES_NAME, task_overrides)
+
+
+### 比較 ###
+
+
+def measure(fn, rounds: int) -> float:
+    """:return: 中位數 (ms)"""
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def parse_files(paths: list[Path]):
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            json.load(f)
+
+
+def framework_load_time(bundle_dir: Path, rounds: int) -> float | None:
+    """以 MaaFramework 載入資源包的時間，沒有安裝 maafw 時回傳 None"""
+    try:
+        from maa.resource import Resource
+        from maa.tasker import Tasker, LoggingLevelEnum
+    except ImportError:
+        return None
+
+    Tasker.set_stdout_level(LoggingLevelEnum.Error)
+
+    def load():
+        if not Resource().post_bundle(bundle_dir).wait().succeeded:
+            raise RuntimeError(f"載入資源失敗: {bundle_dir}")
+
+    return measure(load, rounds)
+
+
+def report(resource_dir: Path, interface: dict, rounds: int):
+    pipeline, _ = build_bundle(resource_dir, interface)
+    split_paths = sorted((resource_dir / "pipeline").rglob("*.json"))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # 兩種版本都使用相同的圖片，只有 pipeline 不同
+        split_dir = Path(tmp_dir) / "split"
+        bundle_dir = Path(tmp_dir) / "bundle"
+        for path in (split_dir, bundle_dir):
+            path.mkdir()
+            shutil.copytree(resource_dir / "image", path / "image")
+        shutil.copytree(resource_dir / "pipeline", split_dir / "pipeline")
+        write_if_changed(bundle_dir / "pipeline" / BUNDLE_NAME, pipeline)
+        bundle_paths = [bundle_dir / "pipeline" / BUNDLE_NAME]
+
+        rows = []
+        for label, paths, bundle in (
+            ("分散", split_paths, split_dir),
+            ("合併", bundle_paths, bundle_dir),
+        ):
+            rows.append(
+                (
+                    label,
+                    len(paths),
+                    sum(p.stat().st_size for p in paths),
+                    measure(lambda: parse_files(paths), rounds),
+                    framework_load_time(bundle, rounds),
+                )
+            )
+
+    print(
+        f"{'版本':<6}{'檔案數':>8}{'大小 (bytes)':>14}{'JSON 解析 (ms)':>16}{'資源載入 (ms)':>16}"
+    )
+    for label, count, size, parse_ms, load_ms in rows:
+        load = f"{load_ms:.2f}" if load_ms is not None else "-"
+        print(f"{label:<6}{count:>8}{size:>14}{parse_ms:>16.3f}{load:>16}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="合併 pipeline 為單一檔案並展開 interface.json 的任務覆蓋"
+    )
+    parser.add_argument(
+        "--resource", type=Path, default=assets_dir / "resource" / "base"
+    )
+    parser.add_argument("--output", type=Path, help="輸出目錄，未指定時只檢查並比較")
+    parser.add_argument("--rounds", type=int, default=7)
+    args = parser.parse_args()
+
+    sys.stdout.reconfigure(encoding="utf-8")
+    with open(assets_dir / "interface.json", encoding="utf-8") as f:
+        interface = json.load(f)
+
+    try:
+        if args.output:
+            write_bundle(args.resource, interface, args.output, args.output)
+            print(f"已輸出至 {args.output}")
+        else:
+            report(args.resource, interface, args.rounds)
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+import io
+import os
+import re
+import sys
+import hashlib
+import tarfile
+import tempfile
+import threading
+from pathlib import Path
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+current_script_dir = os.path.dirname(__file__)
+if current_script_dir not in sys.path:
+    sys.path.insert(0, current_script_dir)
+
+import setup_embed_python
+from setup_embed_python import download_file, extract_tar, PBS_EXCLUDE
+
+sys.stdout.reconfigure(encoding="utf-8")
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    """
+    提供 server.files 中的檔案，支援 Range，
+    server.drop_after 中的檔案在第一次請求時只送出部分內容就中斷連線
+    """
+
+    def do_GET(self):
+        self.server.requests.append((self.path, self.headers.get("Range")))
+        data = self.server.files.get(self.path)
+        if data is None:
+            self.send_error(404)
+            return
+
+        start = 0
+        match = re.fullmatch(r"bytes=(\d+)-", self.headers.get("Range") or "")
+        if match:
+            start = int(match.group(1))
+            if start >= len(data):
+                self.send_error(416)
+                return
+            self.send_response(206)
+            self.send_header(
+                "Content-Range", f"bytes {start}-{len(data) - 1}/{len(data)}"
+            )
+        else:
+            self.send_response(200)
+        self.send_header("Content-Length", str(len(data) - start))
+        self.end_headers()
+
+        drop_after = self.server.drop_after.pop(self.path, None)
+        if drop_after is not None:
+            self.wfile.write(data[start:drop_after])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        self.wfile.write(data[start:])
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(files: dict[str, bytes]) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FixtureHandler)
+    server.files = files
+    server.drop_after = {}
+    server.requests = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def build_tar() -> bytes:
+    """與 python-build-standalone 相同，所有檔案都在 python/ 之下"""
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as tar:
+        for name, content in (
+            ("python/bin/python3", b"#!/bin/sh\n"),
+            ("python/lib/python3.13/os.py", b"# os\n"),
+            ("python/lib/python3.13/test/test_os.py", b"# test\n"),
+            ("python/lib/python3.13/idlelib/idle.py", b"# idle\n"),
+            ("other/readme.txt", b"outside\n"),
+        ):
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            info.mode = 0o755
+            tar.addfile(info, io.BytesIO(content))
+        link = tarfile.TarInfo("python/bin/python")
+        link.type = tarfile.SYMTYPE
+        link.linkname = "python3"
+        tar.addfile(link)
+    return buffer.getvalue()
+
+
+def check(name: str, ok: bool) -> bool:
+    print(f"{'通過' if ok else '失敗'}: {name}")
+    return ok
+
+
+def main():
+    # 測試時不等待重試間隔
+    setup_embed_python.time.sleep = lambda seconds: None
+    archive = build_tar()
+    payload = os.urandom(3 << 20)
+    server = start_server(
+        {"/python.tar.gz": archive, "/payload.bin": payload, "/bad.bin": b"x" * 100}
+    )
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    payload_sha256 = hashlib.sha256(payload).hexdigest()
+    results = []
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cache_dir = os.path.join(tmp_dir, "cache")
+
+        server.drop_after["/payload.bin"] = 1 << 20
+        path = download_file(f"{base}/payload.bin", payload_sha256, cache_dir)
+        ranges = [r for p, r in server.requests if p == "/payload.bin"]
+        results.append(
+            check(
+                "中斷後以 Range 繼續下載",
+                Path(path).read_bytes() == payload
+                and ranges == [None, f"bytes={1 << 20}-"],
+            )
+        )
+
+        server.requests.clear()
+        again = download_file(f"{base}/payload.bin", payload_sha256, cache_dir)
+        results.append(
+            check("快取命中時不發出請求", again == path and not server.requests)
+        )
+
+        Path(path).write_bytes(b"corrupted")
+        download_file(f"{base}/payload.bin", payload_sha256, cache_dir)
+        results.append(check("快取損壞時重新下載", Path(path).read_bytes() == payload))
+
+        try:
+            download_file(f"{base}/bad.bin", "0" * 64, cache_dir)
+            rejected = False
+        except ValueError:
+            rejected = True
+        results.append(check("雜湊不符時拒絕", rejected))
+
+        try:
+            download_file(f"{base}/missing.bin", None, cache_dir)
+            failed = False
+        except Exception:
+            failed = True
+        missing = [p for p, _ in server.requests if p == "/missing.bin"]
+        results.append(check("404 不重試", failed and len(missing) == 1))
+
+        dest = Path(tmp_dir) / "python"
+        tar_path = download_file(f"{base}/python.tar.gz", None, cache_dir)
+        extract_tar(tar_path, dest, "python/", PBS_EXCLUDE)
+        extracted = sorted(
+            p.relative_to(dest).as_posix() for p in dest.rglob("*") if not p.is_dir()
+        )
+        results.append(
+            check(
+                "串流解壓時移除前綴並略過不需要的成員",
+                extracted == ["bin/python", "bin/python3", "lib/python3.13/os.py"]
+                and os.access(dest / "bin" / "python3", os.X_OK),
+            )
+        )
+
+    server.shutdown()
+    if not all(results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,4 @@
+import os
 import sys
 
 from typing import List
@@ -6,6 +7,14 @@ from pathlib import Path
 from maa.resource import Resource
 from maa.tasker import Tasker, LoggingLevelEnum
 
+assets_dir = Path(__file__).resolve().parent.parent / "assets"
+agent_dir = assets_dir / "agent"
+
+if str(agent_dir) not in sys.path:
+    sys.path.insert(0, str(agent_dir))
+
+from my_utils import nodes_without_focus
+
 
 def check(dirs: List[Path]) -> bool:
     resource = Resource()
@@ -20,7 +29,32 @@ def check(dirs: List[Path]) -> bool:
             return False
 
     print("All directories checked.")
-    return True
+    return check_focus(resource)
+
+
+def check_focus(resource: Resource) -> bool:
+    """看門狗與辨識預熱依賴節點事件，框架只對設定 focus 的節點發送事件"""
+    # my_state 的 logger 需要在 assets 目錄讀取 interface.json
+    cwd = Path.cwd()
+    os.chdir(assets_dir)
+    try:
+        from my_state import DEFAULT_AGENT_CONFIG
+    finally:
+        os.chdir(cwd)
+
+    nodes = {
+        "Watchdog": DEFAULT_AGENT_CONFIG["watchdog"]["budgets"],
+        "Warm-up": DEFAULT_AGENT_CONFIG["warmup"]["after"],
+    }
+    ok = True
+    for kind, names in nodes.items():
+        missing = nodes_without_focus(names, resource.get_node_data)
+        if missing:
+            print(f"{kind} nodes without focus: {', '.join(missing)}")
+            ok = False
+        else:
+            print(f"All {len(names)} {kind.lower()} nodes have focus.")
+    return ok
 
 
 def main():
@@ -0,0 +1,311 @@
+import sys
+import zlib
+import struct
+import argparse
+from pathlib import Path
+
+import numpy
+
+from tighten_roi import load_pipeline, load_variants, as_list
+from record_replay import assets_dir
+
+sys.stdout.reconfigure(encoding="utf-8")
+
+image_dir = assets_dir / "resource" / "base" / "image"
+
+SCREEN_ROI = [0, 0, 1280, 720]
+# roi 比模板大不到這麼多像素時，畫面稍微偏移就會找不到
+MIN_SLACK = 4
+# 與框架相同，green_mask 時純綠色的像素不參與比對
+GREEN = (0, 255, 0)
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+CHANNELS = {0: 1, 2: 3, 4: 2, 6: 4}
+
+
+### PNG ###
+
+
+def read_png(path: Path) -> numpy.ndarray:
+    return decode_png(path.read_bytes(), path)
+
+
+def decode_png(data: bytes, path: Path = None) -> numpy.ndarray:
+    """解碼 8 bit、非交錯的 PNG，回傳 (h, w, channels) 的 RGB(A) 陣列"""
+    if not data.startswith(PNG_SIGNATURE):
+        raise ValueError(f"{path} 不是 PNG")
+    pos, idat = len(PNG_SIGNATURE), []
+    while pos < len(data):
+        (length,) = struct.unpack(">I", data[pos : pos + 4])
+        kind = data[pos + 4 : pos + 8]
+        body = data[pos + 8 : pos + 8 + length]
+        if kind == b"IHDR":
+            width, height, depth, color, _, _, interlace = struct.unpack(
+                ">IIBBBBB", body
+            )
+        elif kind == b"IDAT":
+            idat.append(body)
+        pos += 12 + length
+    if depth != 8 or interlace or color not in CHANNELS:
+        raise ValueError(f"{path} 不是 8 bit 非交錯的 PNG")
+
+    channels = CHANNELS[color]
+    stride = width * channels
+    raw = zlib.decompress(b"".join(idat))
+    out = numpy.zeros((height, stride), dtype=numpy.uint8)
+    prev = numpy.zeros(stride, dtype=numpy.int32)
+    for y in range(height):
+        kind = raw[y * (stride + 1)]
+        line = numpy.frombuffer(raw, numpy.uint8, stride, y * (stride + 1) + 1).astype(
+            numpy.int32
+        )
+        if kind == 0:
+            row = line
+        elif kind == 2:
+            row = (line + prev) & 0xFF
+        else:
+            # Sub、Average、Paeth 需要左邊已還原的像素，逐一計算
+            row = line.copy()
+            for x in range(stride):
+                left = row[x - channels] if x >= channels else 0
+                if kind == 1:
+                    predict = left
+                elif kind == 3:
+                    predict = (left + prev[x]) >> 1
+                else:
+                    upper_left = prev[x - channels] if x >= channels else 0
+                    predict = paeth(left, prev[x], upper_left)
+                row[x] = (row[x] + predict) & 0xFF
+        out[y] = row
+        prev = row
+    return out.reshape(height, width, channels)
+
+
+def paeth(a: int, b: int, c: int) -> int:
+    p = a + b - c
+    pa, pb, pc = abs(p - a), abs(p - b), abs(p - c)
+    if pa <= pb and pa <= pc:
+        return a
+    return b if pb <= pc else c
+
+
+def filter_rows(image: numpy.ndarray) -> bytes:
+    """每一列選擇絕對值總和最小的過濾方式，與 libpng 的啟發式相同"""
+    height, width, channels = image.shape
+    rows = image.reshape(height, width * channels).astype(numpy.int32)
+    out = []
+    prev = numpy.zeros(rows.shape[1], dtype=numpy.int32)
+    for row in rows:
+        left = numpy.concatenate([numpy.zeros(channels, numpy.int32), row[:-channels]])
+        upper_left = numpy.concatenate(
+            [numpy.zeros(channels, numpy.int32), prev[:-channels]]
+        )
+        p = left + prev - upper_left
+        pa, pb, pc = abs(p - left), abs(p - prev), abs(p - upper_left)
+        predict = numpy.where(
+            (pa <= pb) & (pa <= pc), left, numpy.where(pb <= pc, prev, upper_left)
+        )
+        candidates = [
+            row,
+            row - left,
+            row - prev,
+            row - ((left + prev) >> 1),
+            row - predict,
+        ]
+        filtered = [(c & 0xFF).astype(numpy.uint8) for c in candidates]
+        cost = [
+            numpy.abs(f.astype(numpy.int8).astype(numpy.int32)).sum() for f in filtered
+        ]
+        best = int(numpy.argmin(cost))
+        out.append(bytes([best]) + filtered[best].tobytes())
+        prev = row
+    return b"".join(out)
+
+
+def encode_png(image: numpy.ndarray) -> bytes:
+    """只寫入必要的 chunk，框架以 OpenCV 讀取時不使用 gAMA、pHYs 等資訊"""
+    height, width, channels = image.shape
+    color = {1: 0, 2: 4, 3: 2, 4: 6}[channels]
+
+    def chunk(kind: bytes, body: bytes) -> bytes:
+        crc = zlib.crc32(kind + body) & 0xFFFFFFFF
+        return struct.pack(">I", len(body)) + kind + body + struct.pack(">I", crc)
+
+    header = struct.pack(">IIBBBBB", width, height, 8, color, 0, 0, 0)
+    body = zlib.compress(filter_rows(image), 9)
+    return (
+        PNG_SIGNATURE
+        + chunk(b"IHDR", header)
+        + chunk(b"IDAT", body)
+        + chunk(b"IEND", b"")
+    )
+
+
+def optimize_png(image: numpy.ndarray) -> numpy.ndarray:
+    """alpha 全為不透明時移除 alpha，框架讀取時本來就會忽略"""
+    if image.shape[2] == 4 and (image[:, :, 3] == 255).all():
+        return image[:, :, :3]
+    return image
+
+
+def green_border(image: numpy.ndarray) -> tuple[int, int, int, int]:
+    """:return: 上下左右全為遮罩綠色的列數與行數"""
+    masked = (image[:, :, :3] == GREEN).all(axis=2)
+    rows = numpy.flatnonzero(~masked.all(axis=1))
+    cols = numpy.flatnonzero(~masked.all(axis=0))
+    if not rows.size:
+        return 0, 0, 0, 0
+    height, width = masked.shape
+    return (
+        int(rows[0]),
+        int(height - 1 - rows[-1]),
+        int(cols[0]),
+        int(width - 1 - cols[-1]),
+    )
+
+
+### 檢查 ###
+
+
+def template_files(template) -> list[Path]:
+    """template 可為檔案或目錄，目錄時使用其中所有圖片"""
+    files = []
+    for name in as_list(template):
+        path = image_dir / name
+        files += sorted(path.rglob("*.png")) if path.is_dir() else [path]
+    return files
+
+
+def match_cost(roi: list[int], size: tuple[int, int], channels: int = 3) -> int:
+    """:return: 以空間域 matchTemplate 估計的乘加次數"""
+    width, height = size
+    positions = max(0, roi[2] - width + 1) * max(0, roi[3] - height + 1)
+    return positions * width * height * channels
+
+
+def check_nodes(pipeline: dict, variants: dict) -> tuple[list[dict], set[Path]]:
+    """:return: (每個節點與模板的檢查結果, 被使用的模板)"""
+    reports, used = [], set()
+    for name, (_, node) in pipeline.items():
+        if node.get("recognition") != "TemplateMatch":
+            continue
+        roi = node.get("roi", SCREEN_ROI)
+        if isinstance(roi, str):
+            reports.append({"node": name, "issue": f"roi 參照節點 {roi}，略過"})
+            continue
+        templates = [node.get("template")] + variants.get(name, {}).get("template", [])
+        for path in dict.fromkeys(f for t in templates for f in template_files(t)):
+            used.add(path)
+            report = {"node": name, "template": path.relative_to(image_dir), "roi": roi}
+            if not path.exists():
+                reports.append({**report, "issue": "找不到模板", "fatal": True})
+                continue
+            height, width = read_png(path).shape[:2]
+            report["size"] = (width, height)
+            report["cost"] = match_cost(roi, (width, height))
+            slack = min(roi[2] - width, roi[3] - height)
+            if slack < 0:
+                report["issue"] = "模板比 roi 大，永遠無法命中"
+                report["fatal"] = True
+            elif slack < MIN_SLACK:
+                report["issue"] = f"roi 只比模板大 {slack} px"
+            reports.append(report)
+    return reports, used
+
+
+def print_reports(reports: list[dict], total_cost: int):
+    print(f"{'節點':<40}{'模板':<44}{'大小':>9}  {'roi':<22}{'成本':>8}  問題")
+    for report in sorted(reports, key=lambda r: -r.get("cost", 0)):
+        size = "x".join(map(str, report.get("size", ()))) or "-"
+        share = report.get("cost", 0) / total_cost if total_cost else 0
+        print(
+            f"{report['node']:<40}{str(report.get('template', '-')):<44}{size:>9}  "
+            f"{str(report.get('roi', '-')):<22}{share:>8.1%}  {report.get('issue', '')}"
+        )
+
+
+def optimize_images(write: bool, crop: bool, green_templates: set[Path]) -> int:
+    """
+    無損重新壓縮所有模板，green_mask 的模板可一併裁掉全為綠色的邊框
+
+    :return: 節省的 bytes
+    """
+
+    saved = 0
+    for path in sorted(image_dir.rglob("*.png")):
+        original = path.read_bytes()
+        image = read_png(path)
+        note = ""
+        if crop and path in green_templates:
+            top, bottom, left, right = green_border(image)
+            if top or bottom or left or right:
+                height, width = image.shape[:2]
+                image = image[top : height - bottom, left : width - right]
+                # 命中框改變，點擊位置會移動半個裁掉的寬度
+                note = f"，裁掉邊框 上{top} 下{bottom} 左{left} 右{right}"
+
+        encoded = encode_png(optimize_png(image))
+        decoded = decode_png(encoded)
+        if not numpy.array_equal(decoded[:, :, :3], image[:, :, :3]):
+            print(f"{path.relative_to(image_dir)} 重新編碼後內容不同，略過")
+            continue
+        if len(encoded) >= len(original) and not note:
+            continue
+        saved += len(original) - len(encoded)
+        print(
+            f"{str(path.relative_to(image_dir)):<44}"
+            f"{len(original):>8} -> {len(encoded):>8} bytes{note}"
+        )
+        if write:
+            path.write_bytes(encoded)
+    return saved
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="檢查 TemplateMatch 的模板與 roi 是否相符、估計比對成本並最佳化模板圖片"
+    )
+    parser.add_argument(
+        "--optimize",
+        action="store_true",
+        help="無損重新壓縮 resource/base/image 的 PNG",
+    )
+    parser.add_argument(
+        "--crop",
+        action="store_true",
+        help="最佳化時裁掉 green_mask 模板中全為綠色的邊框，命中框會跟著改變",
+    )
+    parser.add_argument("--write", action="store_true", help="寫回圖片，預設只顯示結果")
+    args = parser.parse_args()
+
+    pipeline = load_pipeline()
+    variants, _ = load_variants()
+    reports, used = check_nodes(pipeline, variants)
+    total_cost = sum(report.get("cost", 0) for report in reports)
+    print_reports(reports, total_cost)
+
+    unused = sorted(set(image_dir.rglob("*.png")) - used)
+    if unused:
+        print("\n沒有節點使用的模板:")
+        for path in unused:
+            print(f"  {path.relative_to(image_dir)}")
+
+    if args.optimize:
+        # 只裁切所有使用的節點都有 green_mask 的模板
+        masked, unmasked = set(), set()
+        for _, node in pipeline.values():
+            if node.get("recognition") == "TemplateMatch":
+                target = masked if node.get("green_mask") else unmasked
+                target.update(template_files(node.get("template")))
+        green_templates = masked - unmasked
+        print()
+        saved = optimize_images(args.write, args.crop, green_templates)
+        print(
+            f"共節省 {saved} bytes{'' if args.write else '（未寫入，加上 --write 寫回）'}"
+        )
+
+    if any(report.get("fatal") for report in reports):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
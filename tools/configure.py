@@ -1,28 +1,340 @@
 from pathlib import Path
 
+import sys
+import json
 import shutil
+import argparse
+import tempfile
 
 assets_dir = Path(__file__).parent.parent.resolve() / "assets"
+ocr_assets_dir = assets_dir / "MaaCommonAssets" / "OCR"
+ocr_dir = assets_dir / "resource" / "base" / "model" / "ocr"
+samples_dir = Path(__file__).parent.parent.resolve() / "debug" / "ocr_samples"
 
+# 模型組合以 MaaCommonAssets/OCR 下的相對路徑表示，
+# "A+B" 代表使用 A 的偵測模型與 B 的識別模型
+DEFAULT_PROFILE = "ppocr_v5/zh_cn"
+MODEL_FILES = {"det": ["det.onnx"], "rec": ["rec.onnx", "keys.txt"]}
+BENCHMARK_NODE = "OCRBenchmark"
 
-def configure_ocr_model():
-    assets_ocr_dir = assets_dir / "MaaCommonAssets" / "OCR"
-    if not assets_ocr_dir.exists():
-        print(f"File Not Found: {assets_ocr_dir}")
+
+def list_ocr_profiles() -> list[str]:
+    """列出同時包含偵測與識別模型的目錄"""
+    files = MODEL_FILES["det"] + MODEL_FILES["rec"]
+    return sorted(
+        path.parent.relative_to(ocr_assets_dir).as_posix()
+        for path in ocr_assets_dir.rglob(files[0])
+        if all((path.parent / file).exists() for file in files)
+    )
+
+
+def resolve_ocr_profile(profile: str) -> dict[str, Path]:
+    det_name, _, rec_name = profile.partition("+")
+    files = {}
+    for name, part in ((det_name, "det"), (rec_name or det_name, "rec")):
+        for file in MODEL_FILES[part]:
+            path = ocr_assets_dir / name / file
+            if not path.exists():
+                raise FileNotFoundError(f"File Not Found: {path}")
+            files[file] = path
+    return files
+
+
+def install_ocr_profile(profile: str, target: Path = ocr_dir):
+    if "+" in profile:
+        target.mkdir(parents=True, exist_ok=True)
+        for file, path in resolve_ocr_profile(profile).items():
+            shutil.copy2(path, target / file)
+    else:
+        resolve_ocr_profile(profile)
+        shutil.copytree(ocr_assets_dir / profile, target, dirs_exist_ok=True)
+
+
+def configure_ocr_model(profile: str = None):
+    """
+    :param profile: 指定時覆蓋現有的模型，否則只在尚未安裝時複製預設模型
+    """
+
+    if not ocr_assets_dir.exists():
+        print(f"File Not Found: {ocr_assets_dir}")
         exit(1)
 
-    ocr_dir = assets_dir / "resource" / "base" / "model" / "ocr"
-    if not ocr_dir.exists():  # copy default OCR model only if dir does not exist
-        shutil.copytree(
-            assets_dir / "MaaCommonAssets" / "OCR" / "ppocr_v5" / "zh_cn",
-            ocr_dir,
-            dirs_exist_ok=True,
+    if profile is None:
+        if ocr_dir.exists():
+            print("Found existing OCR directory, skipping default OCR model import.")
+            return
+        profile = DEFAULT_PROFILE
+    elif ocr_dir.exists():
+        shutil.rmtree(ocr_dir)
+
+    install_ocr_profile(profile)
+    print(f"Installed OCR profile: {profile}")
+
+
+### 基準測試 ###
+
+
+def load_ocr_resource(profile: str, tmp_dir: Path):
+    """載入 base 資源後，再疊加只有 OCR 模型的資源包"""
+    from maa.resource import Resource
+
+    bundle = tmp_dir / profile.replace("/", "_").replace("+", "__")
+    install_ocr_profile(profile, bundle / "model" / "ocr")
+    resource = Resource()
+    for path in (assets_dir / "resource" / "base", bundle):
+        if not resource.post_bundle(path).wait().succeeded:
+            raise RuntimeError(f"Failed to load resource: {path}")
+    return resource
+
+
+def ocr_nodes() -> dict[str, tuple[list[int], list[str]]]:
+    """:return: 可使用固定 roi 的 OCR 節點與合併所有任務後的 expected"""
+    from tighten_roi import (
+        load_pipeline,
+        load_variants,
+        select_nodes,
+        probe_override,
+        as_list,
+    )
+
+    pipeline = load_pipeline()
+    variants, roi_overridden = load_variants()
+    names, _ = select_nodes(pipeline, None, roi_overridden)
+    nodes = {}
+    for name in names:
+        node = pipeline[name][1]
+        if node["recognition"] != "OCR" or not node.get("expected"):
+            continue
+        override = probe_override(node, variants.get(name, {}))
+        nodes[name] = (node["roi"], override.get("expected", as_list(node["expected"])))
+    return nodes
+
+
+def read_text(detail) -> str:
+    """依序串接所有辨識結果並去除空白，作為與標籤比較的文字"""
+    if not detail:
+        return ""
+    return "".join(result.text for result in detail.all_results).replace(" ", "")
+
+
+def load_labels(samples: Path) -> list[dict]:
+    with open(samples / "labels.jsonl", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def build_ocr_samples(
+    sources: list[Path], profiles: list[str], output: Path, max_frames: int
+) -> int:
+    """
+    以 OCR 節點的 roi 從截圖中裁切樣本，任一組模型讀到文字的區域才保留。
+    讀到的文字只是標籤草稿，需要對照 crops/ 中的圖片修正 text 後將 verified 設為 true，
+    基準測試只使用人工確認過的標籤，避免以受測模型自己的輸出作為答案
+
+    :return: 樣本數
+    """
+
+    import numpy
+
+    from tighten_roi import load_frames, run_in_context
+    from check_templates import encode_png
+    from my_frame_store import FrameStore
+
+    frames = load_frames(sources, max_frames)
+    nodes = ocr_nodes()
+    print(f"Scanning {len(frames)} frames for {len(nodes)} OCR nodes...")
+
+    drafts = {}
+
+    def scan(context):
+        for i, image in enumerate(frames):
+            for name, (roi, _) in nodes.items():
+                if (i, name) in drafts:
+                    continue
+                detail = context.run_recognition(
+                    BENCHMARK_NODE,
+                    image,
+                    {BENCHMARK_NODE: {"recognition": "OCR", "roi": roi}},
+                )
+                text = read_text(detail)
+                if text:
+                    drafts[(i, name)] = text
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for profile in profiles:
+            run_in_context(load_ocr_resource(profile, Path(tmp_dir)), scan)
+
+    if output.exists():
+        shutil.rmtree(output)
+    (output / "crops").mkdir(parents=True)
+    with FrameStore(output, writable=True) as store:
+        with open(output / "labels.jsonl", "w", encoding="utf-8") as f:
+            for (i, name), text in sorted(drafts.items()):
+                x, y, w, h = nodes[name][0]
+                crop = frames[i][y : y + h, x : x + w]
+                index = store.append(crop)
+                # 截圖為 BGR，PNG 為 RGB
+                png = encode_png(numpy.ascontiguousarray(crop[:, :, ::-1]))
+                (output / "crops" / f"{index:04d}_{name}.png").write_bytes(png)
+                label = {
+                    "node": name,
+                    "expected": nodes[name][1],
+                    "text": text,
+                    "verified": False,
+                }
+                f.write(json.dumps(label, ensure_ascii=False) + "\n")
+    return len(drafts)
+
+
+def benchmark_ocr_profiles(profiles: list[str], samples: Path) -> list[dict]:
+    """
+    以人工確認過的標籤評分，辨識結果的文字需與標籤完全相同才算正確，
+    text 為空字串的樣本代表該區域不應讀到任何文字
+
+    :return: 每組模型的正確率與每次辨識耗時
+    """
+    import time
+    import statistics
+
+    from tighten_roi import run_in_context
+    from my_frame_store import FrameStore
+
+    store = FrameStore(samples)
+    samples = [
+        (store.read(i), label["text"].replace(" ", ""))
+        for i, label in enumerate(load_labels(samples))
+        if label.get("verified")
+    ]
+    store.close()
+
+    reports = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for profile in profiles:
+            report = {"profile": profile, "hits": 0, "samples": len(samples)}
+            reports.append(report)
+
+            def run(context):
+                timings = []
+                for i, (crop, text) in enumerate(samples):
+                    override = {
+                        BENCHMARK_NODE: {
+                            "recognition": "OCR",
+                            "roi": [0, 0, crop.shape[1], crop.shape[0]],
+                        }
+                    }
+                    start = time.perf_counter()
+                    detail = context.run_recognition(BENCHMARK_NODE, crop, override)
+                    # 第一次辨識包含載入模型的時間，不計入
+                    if i > 0:
+                        timings.append((time.perf_counter() - start) * 1000)
+                    report["hits"] += read_text(detail) == text
+                report["median_ms"] = statistics.median(timings) if timings else 0.0
+                report["total_ms"] = sum(timings)
+
+            run_in_context(load_ocr_resource(profile, Path(tmp_dir)), run)
+            report["accuracy"] = report["hits"] / len(samples) if samples else 0.0
+    return reports
+
+
+def print_benchmark(reports: list[dict], min_accuracy: float):
+    print(f"{'Profile':<40}{'Accuracy':>10}{'Median ms':>12}{'Total ms':>12}")
+    for r in reports:
+        mark = "" if r["accuracy"] >= min_accuracy else "  (below floor)"
+        print(
+            f"{r['profile']:<40}{r['accuracy']:>10.1%}"
+            f"{r['median_ms']:>12.2f}{r['total_ms']:>12.1f}{mark}"
         )
-    else:
-        print("Found existing OCR directory, skipping default OCR model import.")
 
 
-if __name__ == "__main__":
-    configure_ocr_model()
+def select_ocr_profile(reports: list[dict], min_accuracy: float) -> str | None:
+    """達到正確率下限的模型中最快的一組"""
+    passed = [r for r in reports if r["accuracy"] >= min_accuracy]
+    if not passed:
+        return None
+    return min(passed, key=lambda r: r["median_ms"])["profile"]
+
 
-    print("OCR model configured.")
+def main():
+    parser = argparse.ArgumentParser(description="Configure the OCR model.")
+    parser.add_argument(
+        "--profile",
+        help=f"install a profile, e.g. {DEFAULT_PROFILE} or det_dir+rec_dir",
+    )
+    parser.add_argument("--list", action="store_true", help="list available profiles")
+    parser.add_argument(
+        "--benchmark",
+        action="store_true",
+        help="benchmark profiles and install the fastest one above --min-accuracy",
+    )
+    parser.add_argument(
+        "--candidates", nargs="+", help="profiles to benchmark (default: all)"
+    )
+    parser.add_argument(
+        "--frames",
+        nargs="+",
+        type=Path,
+        help="recorded frames to build draft samples from for hand labelling",
+    )
+    parser.add_argument("--samples", type=Path, default=samples_dir)
+    parser.add_argument("--max-frames", type=int, default=100)
+    parser.add_argument("--min-accuracy", type=float, default=0.98)
+    parser.add_argument(
+        "--no-install", action="store_true", help="only print the benchmark"
+    )
+    args = parser.parse_args()
+
+    if args.list:
+        for profile in list_ocr_profiles():
+            print(profile)
+        return
+
+    if not args.benchmark:
+        configure_ocr_model(args.profile)
+        print("OCR model configured.")
+        return
+
+    sys.stdout.reconfigure(encoding="utf-8")
+    from maa.tasker import Tasker, LoggingLevelEnum
+
+    Tasker.set_stdout_level(LoggingLevelEnum.Error)
+
+    candidates = args.candidates or list_ocr_profiles()
+    if not candidates:
+        print(f"No OCR profiles found in {ocr_assets_dir}")
+        exit(1)
+    labels_path = args.samples / "labels.jsonl"
+    if args.frames:
+        # 重建會覆蓋人工確認過的標籤
+        if labels_path.exists() and any(
+            label.get("verified") for label in load_labels(args.samples)
+        ):
+            print(f"{args.samples} has verified labels, move it away to rebuild.")
+            exit(1)
+        count = build_ocr_samples(
+            args.frames, candidates, args.samples, args.max_frames
+        )
+        print(f"Saved {count} draft samples to {args.samples}")
+        print(
+            "Check each text against crops/, fix it and set verified to true, "
+            "then run --benchmark again."
+        )
+        return
+    if not labels_path.exists():
+        print(f"No samples in {args.samples}, use --frames to build them.")
+        exit(1)
+    if not any(label.get("verified") for label in load_labels(args.samples)):
+        print(f"No verified labels in {labels_path}, review the drafts first.")
+        exit(1)
+
+    reports = benchmark_ocr_profiles(candidates, args.samples)
+    print_benchmark(reports, args.min_accuracy)
+    profile = select_ocr_profile(reports, args.min_accuracy)
+    if profile is None:
+        print(f"No profile reaches {args.min_accuracy:.0%} accuracy.")
+        exit(1)
+    print(f"Fastest profile above the floor: {profile}")
+    if not args.no_install:
+        configure_ocr_model(profile)
+
+
+if __name__ == "__main__":
+    main()
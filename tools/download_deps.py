@@ -1,15 +1,58 @@
 import os
 import sys
+import json
+import shutil
+import hashlib
+import tempfile
+import threading
 import subprocess
 import argparse
 import platform
 from pathlib import Path
+from urllib.parse import unquote, urlsplit
+from concurrent.futures import ThreadPoolExecutor
 
 sys.stdout.reconfigure(encoding="utf-8")
 
+working_dir = Path(__file__).parent.parent.resolve()
+requirements_file = working_dir / "assets" / "requirements.txt"
+lock_file = working_dir / "assets" / "requirements.lock.json"
+default_cache_dir = working_dir / ".cache" / "wheels"
+
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+LOCK_VERSION = 1
+PIP_LOCK_NAME = "requirements.lock"
+# 平台名稱對應的 pip --platform 標籤
+# pip 不會將 linux_* 展開成 manylinux，需要明確列出
+# macOS 會由指定的版本往下相容，所以指定較新的版本
+PLATFORMS = {
+    "linux_x86_64": [
+        "manylinux_2_28_x86_64",
+        "manylinux2014_x86_64",
+        "linux_x86_64",
+    ],
+    "linux_aarch64": [
+        "manylinux_2_28_aarch64",
+        "manylinux2014_aarch64",
+        "linux_aarch64",
+    ],
+    "win_amd64": ["win_amd64"],
+    "win_arm64": ["win_arm64"],
+    "macosx_x86_64": ["macosx_14_0_x86_64"],
+    "macosx_arm64": ["macosx_14_0_arm64"],
+}
+
+print_lock = threading.Lock()
+
+
+def log(message: str):
+    with print_lock:
+        print(message, flush=True)
+
 
 def get_platform_tag():
-    """自動檢測當前平台並返回對應的平台標籤"""
+    """自動檢測當前平台並返回對應的平台名稱"""
     os_type = platform.system()
     os_arch = platform.machine()
 
@@ -37,11 +80,11 @@ def get_platform_tag():
     elif os_type == "Darwin":  # macOS
         # 映射 platform.machine() 到 pip 的平台標籤
         arch_mapping = {
-            "x86_64": "macosx_10_9_x86_64",
-            "arm64": "macosx_11_0_arm64",
-            "aarch64": "macosx_11_0_arm64",
+            "x86_64": "macosx_x86_64",
+            "arm64": "macosx_arm64",
+            "aarch64": "macosx_arm64",
         }
-        platform_tag = arch_mapping.get(os_arch, f"macosx_10_9_{os_arch}")
+        platform_tag = arch_mapping.get(os_arch, f"macosx_{os_arch}")
 
     elif os_type == "Linux":
         # 映射 platform.machine() 到 pip 的平台標籤
@@ -59,107 +102,371 @@ def get_platform_tag():
     return platform_tag
 
 
-def download_dependencies(deps_dir, platform_tag):
-    """下載依賴到指定目錄"""
-    # 建立 deps 目錄
-    deps_path = Path(deps_dir)
-    deps_path.mkdir(parents=True, exist_ok=True)
-
-    print(f"開始下載平台 {platform_tag} 的依賴到 {deps_dir}")
-
-    # 從 requirements.txt 讀取依賴
-    requirements_file = Path("assets/requirements.txt")
-    if not requirements_file.exists():
-        print("錯誤: requirements.txt 檔案不存在")
-        return False
-
-    # 首先嘗試下載平台專屬的 wheel 檔案
-    try:
+### 快取 ###
+
+
+def file_hash(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class WheelCache:
+    """以 sha256 為檔名的 wheel 快取，多個平台與多次執行共用"""
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+
+    def path(self, sha256: str) -> Path:
+        return self.root / "sha256" / sha256[:2] / sha256
+
+    def has(self, sha256: str) -> bool:
+        return self.path(sha256).exists()
+
+    def fetch(self, wheel: dict, platform_tag: str, python_version: str):
+        """
+        以 pip 下載鎖定的 wheel，沿用 pip 的索引與鏡像設定，
+        雜湊相符才放入快取
+        """
+
+        target = self.path(wheel["sha256"])
+        target.parent.mkdir(parents=True, exist_ok=True)
+        with tempfile.TemporaryDirectory(dir=target.parent) as tmp_dir:
+            requirement = Path(tmp_dir) / "requirement.txt"
+            requirement.write_text(
+                f"{wheel['name']}=={wheel['version']} --hash=sha256:{wheel['sha256']}\n",
+                encoding="utf-8",
+            )
+            cmd = [
+                sys.executable,
+                "-m",
+                "pip",
+                "download",
+                "--quiet",
+                "--no-deps",
+                "--require-hashes",
+                "--only-binary=:all:",
+                "--python-version",
+                python_version,
+                "-d",
+                tmp_dir,
+                "-r",
+                str(requirement),
+            ]
+            for tag in PLATFORMS.get(platform_tag, [platform_tag]):
+                cmd += ["--platform", tag]
+            result = subprocess.run(cmd, capture_output=True, text=True)
+            if result.returncode != 0:
+                raise RuntimeError(result.stderr.strip() or result.stdout.strip())
+            path = Path(tmp_dir) / wheel["file"]
+            if file_hash(path) != wheel["sha256"]:
+                raise ValueError(f"雜湊不符: {wheel['file']}")
+            os.replace(path, target)
+
+    def place(self, sha256: str, target: Path):
+        """以硬連結放置，不支援時複製；快取中的檔案不會被改寫，可以安全共用"""
+        tmp = target.with_name(target.name + ".tmp")
+        tmp.unlink(missing_ok=True)
+        try:
+            os.link(self.path(sha256), tmp)
+        except OSError:
+            shutil.copyfile(self.path(sha256), tmp)
+        os.replace(tmp, target)
+
+
+### 解析 ###
+
+
+def resolve_platform(
+    platform_tag: str, python_version: str, requirements: Path
+) -> list[dict]:
+    """
+    以 pip 的 dry-run 解析指定平台需要的 wheel，不下載到 deps
+
+    :return: 每個 wheel 的檔名、sha256、套件名稱與版本
+    :raise RuntimeError: pip 找不到符合平台的版本
+    """
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        report_path = Path(tmp_dir) / "report.json"
         cmd = [
             sys.executable,
             "-m",
             "pip",
-            "download",
-            "-r",
-            str(requirements_file),
-            "-d",
-            str(deps_path),
-            "--platform",
-            platform_tag,
+            "install",
+            "--dry-run",
+            "--quiet",
+            "--ignore-installed",
+            "--report",
+            str(report_path),
+            "--target",
+            str(Path(tmp_dir) / "target"),
             "--only-binary=:all:",
+            "--python-version",
+            python_version,
+            "-r",
+            str(requirements),
         ]
+        for tag in PLATFORMS.get(platform_tag, [platform_tag]):
+            cmd += ["--platform", tag]
+        result = subprocess.run(cmd, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.strip() or result.stdout.strip())
+        with open(report_path, encoding="utf-8") as f:
+            report = json.load(f)
+
+    wheels = []
+    for item in report["install"]:
+        info = item["download_info"]
+        hashes = info.get("archive_info", {}).get("hashes", {})
+        if "sha256" not in hashes:
+            raise RuntimeError(f"索引未提供 sha256: {info['url']}")
+        wheels.append(
+            {
+                "file": unquote(urlsplit(info["url"]).path.rsplit("/", 1)[-1]),
+                "sha256": hashes["sha256"],
+                "name": item["metadata"]["name"],
+                "version": item["metadata"]["version"],
+            }
+        )
+    return sorted(wheels, key=lambda wheel: wheel["file"])
+
+
+### 輸出 ###
+
+
+def read_manifest(wheelhouse: Path) -> dict:
+    try:
+        with open(wheelhouse / MANIFEST_NAME, encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+    if manifest.get("version") != MANIFEST_VERSION:
+        return {}
+    return manifest
+
+
+def sync_wheelhouse(
+    wheelhouse: Path,
+    platform_tag: str,
+    python_version: str,
+    wheels: list[dict],
+    cache: WheelCache,
+) -> dict:
+    """
+    依解析結果更新 wheel 目錄，大小與雜湊都沒變的檔案不重新放置，
+    移除上次清單中已不需要的檔案，清單內容相同時不改寫
+
+    :return: 放置、未變動與移除的數量
+    """
+
+    wheelhouse.mkdir(parents=True, exist_ok=True)
+    old = {
+        entry["file"]: entry for entry in read_manifest(wheelhouse).get("wheels", [])
+    }
+    counts = {"placed": 0, "unchanged": 0, "removed": 0}
+
+    entries = []
+    for wheel in wheels:
+        size = cache.path(wheel["sha256"]).stat().st_size
+        target = wheelhouse / wheel["file"]
+        previous = old.get(wheel["file"])
+        if (
+            previous is not None
+            and previous["sha256"] == wheel["sha256"]
+            and target.exists()
+            and target.stat().st_size == size
+        ):
+            counts["unchanged"] += 1
+        else:
+            cache.place(wheel["sha256"], target)
+            counts["placed"] += 1
+        entries.append(
+            {
+                "file": wheel["file"],
+                "sha256": wheel["sha256"],
+                "size": size,
+                "name": wheel["name"],
+                "version": wheel["version"],
+            }
+        )
+
+    current = {entry["file"] for entry in entries}
+    for file in old.keys() - current:
+        (wheelhouse / file).unlink(missing_ok=True)
+        counts["removed"] += 1
+
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "platform": platform_tag,
+        "python_version": python_version,
+        "wheels": entries,
+    }
+    content = json.dumps(manifest, ensure_ascii=False, indent=4)
+    manifest_path = wheelhouse / MANIFEST_NAME
+    if (
+        not manifest_path.exists()
+        or manifest_path.read_text(encoding="utf-8") != content
+    ):
+        tmp = manifest_path.with_name(MANIFEST_NAME + ".tmp")
+        tmp.write_text(content, encoding="utf-8")
+        os.replace(tmp, manifest_path)
+    return counts
+
+
+### 鎖定檔 ###
+
+
+def requirements_hash() -> str:
+    return hashlib.sha256(requirements_file.read_bytes()).hexdigest()
+
+
+def read_lock() -> dict:
+    try:
+        with open(lock_file, encoding="utf-8") as f:
+            lock = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {"version": LOCK_VERSION, "platforms": {}}
+    if lock.get("version") != LOCK_VERSION:
+        return {"version": LOCK_VERSION, "platforms": {}}
+    return lock
+
+
+def write_lock(lock: dict):
+    content = json.dumps(lock, ensure_ascii=False, indent=4) + "\n"
+    if lock_file.exists() and lock_file.read_text(encoding="utf-8") == content:
+        return
+    tmp = lock_file.with_name(lock_file.name + ".tmp")
+    tmp.write_text(content, encoding="utf-8")
+    os.replace(tmp, lock_file)
+
+
+def locked_platform(lock: dict, platform_tag: str) -> dict | None:
+    """:return: 鎖定檔中與目前 requirements.txt 相符的平台，否則回傳 None"""
+    entry = lock["platforms"].get(platform_tag)
+    if entry is None:
+        log(f"[{platform_tag}] 鎖定檔中沒有此平台，請以 --update-lock 產生")
+        return None
+    if lock.get("requirements_sha256") != requirements_hash():
+        log(f"[{platform_tag}] requirements.txt 已變更，請以 --update-lock 更新鎖定檔")
+        return None
+    return entry
+
+
+def write_pip_lock(wheelhouse: Path, wheels: list[dict]):
+    """輸出 pip 可直接使用的鎖定需求，agent 以 --no-deps --require-hashes 安裝"""
+    lines = [f"{w['name']}=={w['version']} --hash=sha256:{w['sha256']}" for w in wheels]
+    content = "\n".join(lines) + "\n"
+    path = wheelhouse / PIP_LOCK_NAME
+    if not path.exists() or path.read_text(encoding="utf-8") != content:
+        path.write_text(content, encoding="utf-8")
+
+
+### 下載 ###
+
+
+def download_dependencies(
+    deps_dir,
+    platform_tags: list[str],
+    python_version: str = None,
+    update_lock: bool = False,
+    cache_dir: Path = default_cache_dir,
+    workers: int = None,
+) -> bool:
+    """
+    依鎖定檔下載各平台的 wheel，快取中已有的不重新下載，再輸出到 deps
+
+    只有一個平台時直接輸出到 deps_dir，多個平台時輸出到 deps_dir/<平台>
+
+    :param python_version: 更新鎖定檔時的目標 Python 版本，
+        預設沿用鎖定檔中的版本，沒有時使用執行本腳本的版本
+    :param update_lock: 平行重新解析各平台的依賴並寫回鎖定檔
+    """
 
-        print(f"執行命令: {' '.join(cmd)}")
-        result = subprocess.run(cmd, check=True, capture_output=True, text=True)
-        print(result.stdout)
+    if not requirements_file.exists():
+        print("錯誤: requirements.txt 檔案不存在")
+        return False
 
-        if result.stderr:
-            print("警告訊息:")
-            print(result.stderr)
+    deps_path = Path(deps_dir)
+    cache = WheelCache(cache_dir)
+    lock = read_lock()
+
+    def resolve(platform_tag: str):
+        old = lock["platforms"].get(platform_tag, {})
+        version = (
+            python_version
+            or old.get("python_version")
+            or f"{sys.version_info.major}.{sys.version_info.minor}"
+        )
+        try:
+            wheels = resolve_platform(platform_tag, version, requirements_file)
+        except Exception as e:
+            log(f"[{platform_tag}] 解析失敗:\n{e}")
+            return None
+        log(f"[{platform_tag}] Python {version} 需要 {len(wheels)} 個 wheel")
+        return {"python_version": version, "wheels": wheels}
+
+    with ThreadPoolExecutor(workers) as executor:
+        if update_lock:
+            print(f"開始解析平台 {', '.join(platform_tags)} 的依賴")
+            locked = dict(zip(platform_tags, executor.map(resolve, platform_tags)))
+            resolved = {tag: entry for tag, entry in locked.items() if entry}
+            if resolved:
+                lock["requirements_sha256"] = requirements_hash()
+                lock["platforms"].update(resolved)
+                lock["platforms"] = dict(sorted(lock["platforms"].items()))
+                write_lock(lock)
+                print(f"已更新鎖定檔: {lock_file}")
+        else:
+            locked = {tag: locked_platform(lock, tag) for tag in platform_tags}
+
+        # 不同平台共用的 wheel 只下載一次
+        missing = {}
+        for platform_tag, entry in locked.items():
+            for wheel in entry["wheels"] if entry else []:
+                if not cache.has(wheel["sha256"]):
+                    missing.setdefault(
+                        wheel["sha256"],
+                        (wheel, platform_tag, entry["python_version"]),
+                    )
+
+        def fetch(item: tuple) -> bool:
+            wheel = item[0]
+            try:
+                cache.fetch(*item)
+            except Exception as e:
+                log(f"下載 {wheel['file']} 失敗: {e}")
+                return False
+            log(f"已下載: {wheel['file']}")
+            return True
 
-        # 列出下載的檔案
-        whl_files = list(deps_path.glob("*.whl"))
-        print(f"\n下載的 wheel 檔案 ({len(whl_files)} 個):")
-        for whl_file in whl_files:
-            print(f"  {whl_file.name}")
+        fetched = dict(zip(missing, executor.map(fetch, missing.values())))
 
-        print(f"依賴已下載到: {deps_path}")
-        return True
+    needed = {w["sha256"] for e in locked.values() if e for w in e["wheels"]}
+    print(
+        f"快取命中 {len(needed) - len(missing)} 個，"
+        f"下載 {sum(fetched.values())}/{len(missing)} 個"
+    )
 
-    except subprocess.CalledProcessError as e:
-        print(f"平台專屬下載失敗: {e}")
-        if e.stderr and (
-            "Could not find a version" in e.stderr
-            or "No matching distribution" in e.stderr
+    success = True
+    for platform_tag, entry in locked.items():
+        if entry is None or not all(
+            fetched.get(w["sha256"], True) for w in entry["wheels"]
         ):
-            print("某些套件可能不支援目前平台，嘗試通用下載策略...")
-
-            # 回退到通用下載策略（不指定平台）
-            try:
-                cmd_fallback = [
-                    sys.executable,
-                    "-m",
-                    "pip",
-                    "download",
-                    "-r",
-                    str(requirements_file),
-                    "-d",
-                    str(deps_path),
-                    "--only-binary=:all:",
-                ]
-
-                print(f"執行回退命令: {' '.join(cmd_fallback)}")
-                result = subprocess.run(
-                    cmd_fallback, check=True, capture_output=True, text=True
-                )
-                print(result.stdout)
-
-                if result.stderr:
-                    print("警告訊息:")
-                    print(result.stderr)
-
-                # 列出下載的檔案
-                whl_files = list(deps_path.glob("*.whl"))
-                print(f"\n下載的 wheel 檔案 ({len(whl_files)} 個):")
-                for whl_file in whl_files:
-                    print(f"  {whl_file.name}")
-
-                print(f"通用策略已下載到: {deps_path}")
-                return True
-
-            except subprocess.CalledProcessError as e2:
-                print(f"通用策略也失敗: {e2}")
-                if e2.stdout:
-                    print("stdout:", e2.stdout)
-                if e2.stderr:
-                    print("stderr:", e2.stderr)
-                return False
-        else:
-            if e.stdout:
-                print("stdout:", e.stdout)
-            if e.stderr:
-                print("stderr:", e.stderr)
-            return False
+            success = False
+            continue
+        wheelhouse = deps_path if len(platform_tags) == 1 else deps_path / platform_tag
+        counts = sync_wheelhouse(
+            wheelhouse, platform_tag, entry["python_version"], entry["wheels"], cache
+        )
+        write_pip_lock(wheelhouse, entry["wheels"])
+        print(
+            f"[{platform_tag}] {wheelhouse}: "
+            + ", ".join(f"{key}: {value}" for key, value in counts.items())
+        )
+    return success
 
 
 def main():
@@ -167,15 +474,48 @@ def main():
     parser.add_argument(
         "--deps-dir", default="assets/deps", help="依賴下載目錄 (預設:assets/deps)"
     )
+    parser.add_argument(
+        "--platforms",
+        nargs="+",
+        help=f"平台名稱 ({', '.join(PLATFORMS)}) 或 all，預設為目前平台",
+    )
+    parser.add_argument(
+        "--update-lock",
+        action="store_true",
+        help="重新解析依賴並更新 assets/requirements.lock.json",
+    )
+    parser.add_argument(
+        "--python-version",
+        help="更新鎖定檔時的目標 Python 版本 (預設:沿用鎖定檔，沒有時使用執行本腳本的版本)",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=Path,
+        default=default_cache_dir,
+        help="wheel 快取目錄 (預設:.cache/wheels)",
+    )
+    parser.add_argument("--workers", type=int, help="平行工作數")
 
     args = parser.parse_args()
 
     try:
-        # 自動檢測平台
-        platform_tag = get_platform_tag()
+        if not args.platforms:
+            # 自動檢測平台
+            platform_tags = [get_platform_tag()]
+        elif "all" in args.platforms:
+            platform_tags = list(PLATFORMS)
+        else:
+            platform_tags = list(dict.fromkeys(args.platforms))
 
         # 下載依賴
-        success = download_dependencies(args.deps_dir, platform_tag)
+        success = download_dependencies(
+            args.deps_dir,
+            platform_tags,
+            args.python_version,
+            args.update_lock,
+            args.cache_dir,
+            args.workers,
+        )
 
         if success:
             print("==== 依賴下載成功 ====")
@@ -4,93 +4,329 @@ import shutil
 import sys
 import json
 import os
+import fnmatch
+import hashlib
+import argparse
+import zipapp
+import tempfile
+import compileall
+import py_compile
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 
 working_dir = Path(__file__).parent.parent
 install_path = working_dir / Path("install")
-version = len(sys.argv) > 1 and sys.argv[1] or "v0.0.1"
 
 current_script_dir = os.path.dirname(__file__)
 if current_script_dir not in sys.path:
     sys.path.insert(0, current_script_dir)
 
 from configure import configure_ocr_model
+from bundle_pipeline import write_bundle, BUNDLE_NAME, TASK_OVERRIDES_NAME
 
 sys.stdout.reconfigure(encoding="utf-8")
 
+MANIFEST_NAME = ".install_manifest.json"
+MANIFEST_VERSION = 1
+# 依序嘗試的放置方式，失敗時退回下一個
+LINK_METHODS = {
+    "auto": ("reflink", "copy"),
+    "hardlink": ("hardlink", "copy"),
+    "copy": ("copy",),
+}
+FICLONE = 0x40049409  # linux/fs.h
+AGENT_ZIPAPP = "agent.pyz"
+# install_pipeline_bundle 產生的檔案
+BUNDLE_OUTPUTS = (
+    f"resource/base/pipeline/{BUNDLE_NAME}",
+    f"agent/{TASK_OVERRIDES_NAME}",
+)
 
-def install_deps():
+
+### 檔案放置 ###
+
+
+def _reflink(src: Path, dst: Path):
+    """寫入時複製，只有 btrfs、xfs、APFS 等檔案系統支援"""
+    if sys.platform.startswith("linux"):
+        import fcntl
+
+        with open(src, "rb") as s, open(dst, "wb") as d:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+    elif sys.platform == "darwin":
+        import ctypes
+
+        libc = ctypes.CDLL(None, use_errno=True)
+        if libc.clonefile(os.fsencode(src), os.fsencode(dst), 0) != 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+    else:
+        raise OSError("reflink is not supported on this platform")
+    shutil.copystat(src, dst)
+
+
+def _hardlink(src: Path, dst: Path):
+    os.link(src, dst)
+
+
+PLACERS = {"reflink": _reflink, "hardlink": _hardlink, "copy": shutil.copy2}
+
+
+def place_file(src: Path, target: Path, link: str) -> str:
+    """
+    先放到暫存檔再取代，不會寫入與原始檔共用的硬連結
+
+    :return: 實際使用的放置方式
+    """
+
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp = target.with_name(target.name + ".tmp")
+    for method in LINK_METHODS[link]:
+        tmp.unlink(missing_ok=True)
+        try:
+            PLACERS[method](src, tmp)
+            break
+        except OSError:
+            if method == "copy":
+                raise
+    os.replace(tmp, target)
+    return method
+
+
+def file_hash(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _stat_key(path: Path) -> list[int] | None:
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        return None
+    return [st.st_size, st.st_mtime_ns]
+
+
+class Installer:
+    """
+    依清單只更新變動過的檔案，清單記錄每個檔案的來源雜湊與安裝後的大小、時間，
+    原始檔大小與時間未變且安裝的檔案未被改動時不重新計算雜湊
+
+    :param link: "auto" | "hardlink" | "copy"
+    :param full: 忽略清單，全部重新複製
+    """
+
+    def __init__(self, root: Path, link: str = "auto", full: bool = False):
+        self.root = root
+        self.manifest_path = root / MANIFEST_NAME
+        self.link = link
+        self.old = {} if full else self._load_manifest()
+        self.plan = {}
+
+    def _load_manifest(self) -> dict:
+        try:
+            with open(self.manifest_path, encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+        if manifest.get("version") != MANIFEST_VERSION:
+            return {}
+        return manifest["files"]
+
+    def add_tree(self, src: Path, dst: str, ignore: tuple[str, ...] = ()):
+        """與 shutil.copytree 相同，ignore 為檔名或目錄名的萬用字元"""
+
+        def ignored(name: str) -> bool:
+            return any(fnmatch.fnmatch(name, pattern) for pattern in ignore)
+
+        for root, dirs, files in os.walk(src, followlinks=True):
+            dirs[:] = [d for d in dirs if not ignored(d)]
+            for name in files:
+                if ignored(name):
+                    continue
+                path = Path(root) / name
+                self.plan[(Path(dst) / path.relative_to(src)).as_posix()] = path
+
+    def add_file(self, src: Path, dst: str = None):
+        self.plan[dst or src.name] = src
+
+    def _sync(self, rel: str, src: Path) -> tuple[dict, str]:
+        old = self.old.get(rel)
+        target = self.root / rel
+        source_key = _stat_key(src)
+        intact = old is not None and _stat_key(target) == old["installed"]
+        if intact and source_key == old["source"]:
+            return old, "unchanged"
+
+        entry = {"sha256": file_hash(src), "source": source_key}
+        if intact and entry["sha256"] == old["sha256"]:
+            entry["installed"] = old["installed"]
+            return entry, "unchanged"
+
+        method = place_file(src, target, self.link)
+        entry["installed"] = _stat_key(target)
+        return entry, method
+
+    def commit(self, workers: int = None):
+        """平行放置檔案，刪除上次安裝但已不存在的檔案，再寫入清單"""
+        with ThreadPoolExecutor(workers) as executor:
+            results = executor.map(lambda item: self._sync(*item), self.plan.items())
+            files = {}
+            counts = Counter()
+            for rel, (entry, method) in zip(self.plan, results):
+                files[rel] = entry
+                counts[method] += 1
+
+        for rel in self.old.keys() - files.keys():
+            target = self.root / rel
+            target.unlink(missing_ok=True)
+            counts["removed"] += 1
+            # 一併移除變空的目錄
+            for parent in target.parents:
+                if parent == self.root:
+                    break
+                try:
+                    parent.rmdir()
+                except OSError:
+                    break
+
+        tmp = self.manifest_path.with_name(MANIFEST_NAME + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": MANIFEST_VERSION, "files": files}, f)
+        os.replace(tmp, self.manifest_path)
+        print(", ".join(f"{method}: {count}" for method, count in counts.items()))
+
+
+### 安裝 ###
+
+
+def install_deps(installer: Installer):
     if not (working_dir / "deps" / "bin").exists():
         print('Please download the MaaFramework to "deps" first.')
         print('請先下載 MaaFramework 到 "deps"。')
         sys.exit(1)
 
-    shutil.copytree(
+    installer.add_tree(
         working_dir / "deps" / "bin",
-        install_path,
-        ignore=shutil.ignore_patterns(
+        ".",
+        ignore=(
             "*MaaDbgControlUnit*",
             "*MaaThriftControlUnit*",
             "*MaaWin32ControlUnit*",
             "*MaaRpc*",
             "*MaaHttp*",
         ),
-        dirs_exist_ok=True,
     )
-    shutil.copytree(
-        working_dir / "deps" / "share" / "MaaAgentBinary",
-        install_path / "MaaAgentBinary",
-        dirs_exist_ok=True,
+    installer.add_tree(
+        working_dir / "deps" / "share" / "MaaAgentBinary", "MaaAgentBinary"
     )
 
 
-def install_resource():
+def install_resource(installer: Installer, split_pipeline: bool = False):
 
     configure_ocr_model()
 
-    shutil.copytree(
+    # 合併的 pipeline 由 install_pipeline_bundle 產生
+    installer.add_tree(
         working_dir / "assets" / "resource",
-        install_path / "resource",
-        dirs_exist_ok=True,
-    )
-    shutil.copy2(
-        working_dir / "assets" / "interface.json",
-        install_path,
-    )
-    shutil.copy2(
-        working_dir / "assets" / "requirements.txt",
-        install_path,
+        "resource",
+        ignore=() if split_pipeline else ("pipeline",),
     )
+    installer.add_file(working_dir / "assets" / "requirements.txt")
+
 
-    with open(install_path / "interface.json", "r", encoding="utf-8") as f:
+def install_pipeline_bundle(installer: Installer, staging: Path):
+    """
+    將 pipeline 合併成單一檔案並檢查，同時展開 interface.json 的任務覆蓋給 agent 使用，
+    產生的檔案先寫入 staging 再交給 installer，記錄在清單中，改用 --split-pipeline 時會被刪除
+
+    :param staging: 暫存目錄，需保留到 installer.commit 之後
+    """
+
+    with open(working_dir / "assets" / "interface.json", "r", encoding="utf-8") as f:
         interface = json.load(f)
+    try:
+        write_bundle(
+            working_dir / "assets" / "resource" / "base",
+            interface,
+            staging / "pipeline",
+            staging / "agent",
+        )
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
+    pipeline_out, overrides_out = BUNDLE_OUTPUTS
+    installer.add_file(staging / "pipeline" / BUNDLE_NAME, pipeline_out)
+    installer.add_file(staging / "agent" / TASK_OVERRIDES_NAME, overrides_out)
 
-    interface["version"] = version
 
-    with open(install_path / "interface.json", "w", encoding="utf-8") as f:
-        json.dump(interface, f, ensure_ascii=False, indent=4)
+def remove_pipeline_bundle():
+    """
+    刪除合併的 pipeline 與任務覆蓋，避免節點與分開的檔案重複載入，
+    以及 agent 優先讀取過期的 task_overrides.json。清單會處理之後的安裝，
+    這裡處理清單記錄這些檔案之前的安裝
+    """
 
+    for rel in BUNDLE_OUTPUTS:
+        (install_path / rel).unlink(missing_ok=True)
 
-def install_chores():
-    shutil.copy2(
-        working_dir / "README.md",
-        install_path,
-    )
-    shutil.copy2(
-        working_dir / "LICENSE",
-        install_path,
-    )
 
+def install_chores(installer: Installer):
+    installer.add_file(working_dir / "README.md")
+    installer.add_file(working_dir / "LICENSE")
 
-def install_agent():
-    shutil.copytree(
+
+def install_agent(installer: Installer):
+    # 位元組碼由 compile_agent 重新產生
+    installer.add_tree(
         working_dir / "assets" / "agent",
-        install_path / "agent",
-        dirs_exist_ok=True,
+        "agent",
+        ignore=("__pycache__", "*.pyc"),
+    )
+
+
+def compile_agent(zipapp_path: Path = None):
+    """
+    以執行本腳本的 Python 預先編譯 agent，使用 checked-hash 的 pyc，
+    依原始碼雜湊而非修改時間驗證，複製或解壓後仍然有效，唯讀目錄也不需要再寫入
+
+    :param zipapp_path: 指定時另外打包成 zipapp，pyc 放在原始碼旁供 zipimport 使用
+    """
+
+    agent_dir = install_path / "agent"
+    compileall.compile_dir(
+        agent_dir,
+        quiet=1,
+        invalidation_mode=py_compile.PycInvalidationMode.CHECKED_HASH,
     )
+    if zipapp_path is None:
+        return
 
-    with open(install_path / "interface.json", "r", encoding="utf-8") as f:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        staging = Path(tmp_dir)
+        for path in agent_dir.glob("*.py"):
+            name = "__main__.py" if path.name == "main.py" else path.name
+            shutil.copy2(path, staging / name)
+        compileall.compile_dir(
+            staging,
+            quiet=1,
+            legacy=True,
+            invalidation_mode=py_compile.PycInvalidationMode.CHECKED_HASH,
+        )
+        tmp = zipapp_path.with_name(zipapp_path.name + ".tmp")
+        zipapp.create_archive(staging, tmp)
+        os.replace(tmp, zipapp_path)
+
+
+def install_interface(version: str, agent_zipapp: bool = False):
+    """一次寫入 interface.json 的版本與 agent 執行檔，內容不變時不改寫"""
+    with open(working_dir / "assets" / "interface.json", "r", encoding="utf-8") as f:
         interface = json.load(f)
 
+    interface["version"] = version
+
     if sys.platform.startswith("win"):
         interface["agent"]["child_exec"] = r"{PROJECT_DIR}/python/python.exe"
     elif sys.platform.startswith("darwin"):
@@ -98,14 +334,72 @@ def install_agent():
     elif sys.platform.startswith("linux"):
         interface["agent"]["child_exec"] = r"python3"
 
-    with open(install_path / "interface.json", "w", encoding="utf-8") as f:
-        json.dump(interface, f, ensure_ascii=False, indent=4)
+    if agent_zipapp:
+        interface["agent"]["child_args"] = [f"{{PROJECT_DIR}}/agent/{AGENT_ZIPAPP}"]
 
+    content = json.dumps(interface, ensure_ascii=False, indent=4)
+    target = install_path / "interface.json"
+    if target.exists() and target.read_text(encoding="utf-8") == content:
+        return
+    tmp = target.with_name("interface.json.tmp")
+    tmp.write_text(content, encoding="utf-8")
+    os.replace(tmp, target)
 
-if __name__ == "__main__":
-    install_deps()
-    install_resource()
-    install_chores()
-    install_agent()
+
+def main():
+    parser = argparse.ArgumentParser(description="Install to the install directory.")
+    parser.add_argument("version", nargs="?", default="v0.0.1")
+    parser.add_argument(
+        "--link",
+        choices=LINK_METHODS,
+        default="auto",
+        help="auto: reflink when supported, otherwise copy; "
+        "hardlink shares files with the source tree, so editing the install "
+        "directory also edits the source",
+    )
+    parser.add_argument(
+        "--full", action="store_true", help="ignore the manifest and copy everything"
+    )
+    parser.add_argument("--workers", type=int, help="number of parallel copies")
+    parser.add_argument(
+        "--split-pipeline",
+        action="store_true",
+        help="copy the pipeline files as they are instead of one merged bundle",
+    )
+    parser.add_argument(
+        "--no-compile", action="store_true", help="do not precompile the agent"
+    )
+    parser.add_argument(
+        "--agent-zipapp",
+        action="store_true",
+        help=f"also bundle the agent into agent/{AGENT_ZIPAPP} and run it from there",
+    )
+    args = parser.parse_args()
+    if args.agent_zipapp and args.no_compile:
+        parser.error("--agent-zipapp cannot be used with --no-compile")
+
+    install_path.mkdir(parents=True, exist_ok=True)
+    installer = Installer(install_path, args.link, args.full)
+    install_deps(installer)
+    install_resource(installer, args.split_pipeline)
+    install_chores(installer)
+    install_agent(installer)
+    with tempfile.TemporaryDirectory() as staging:
+        if args.split_pipeline:
+            remove_pipeline_bundle()
+        else:
+            install_pipeline_bundle(installer, Path(staging))
+        installer.commit(args.workers)
+
+    zipapp_path = install_path / "agent" / AGENT_ZIPAPP
+    if not args.agent_zipapp:
+        zipapp_path.unlink(missing_ok=True)
+    if not args.no_compile:
+        compile_agent(zipapp_path if args.agent_zipapp else None)
+    install_interface(args.version, args.agent_zipapp)
 
     print(f"Install to {install_path} successfully.")
+
+
+if __name__ == "__main__":
+    main()
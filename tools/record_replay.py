@@ -0,0 +1,714 @@
+import sys
+import json
+import time
+import shutil
+import subprocess
+import argparse
+import tempfile
+import threading
+from pathlib import Path
+from datetime import datetime
+
+import numpy
+
+from maa.define import (
+    MaaControllerFeatureEnum,
+    MaaAdbScreencapMethodEnum,
+    MaaAdbInputMethodEnum,
+)
+from maa.controller import AdbController, CustomController
+from maa.resource import Resource
+from maa.tasker import Tasker, LoggingLevelEnum
+from maa.toolkit import Toolkit
+from maa.agent_client import AgentClient
+from maa.context import ContextEventSink
+from maa.event_sink import NotificationType
+
+assets_dir = Path(__file__).parent.parent.resolve() / "assets"
+agent_dir = assets_dir / "agent"
+
+if str(agent_dir) not in sys.path:
+    sys.path.insert(0, str(agent_dir))
+
+from my_frame_store import FrameStore, FrameWriter
+from my_utils import build_task_overrides, resolve_task_override
+
+sys.stdout.reconfigure(encoding="utf-8")
+
+ARCHIVE_VERSION = 2
+# 會與錄製時的點擊比對的動作類型
+ACTION_TYPES = (
+    "click",
+    "swipe",
+    "touch_down",
+    "touch_move",
+    "touch_up",
+    "click_key",
+    "input_text",
+    "key_down",
+    "key_up",
+    "start_app",
+    "stop_app",
+)
+
+
+### 錄製檔相關 ###
+
+
+class FrameArchive:
+    """
+    錄製檔目錄結構：
+        meta.json      錄製資訊
+        events.jsonl   截圖、動作與任務邊界，依時間排序
+        frames/        截圖，FrameStore 格式
+        config/        錄製開始時的 config 快照，回放時還原
+        logs/          框架日誌
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.frames_dir = self.path / "frames"
+        self.events_path = self.path / "events.jsonl"
+        self.meta_path = self.path / "meta.json"
+        self.config_dir = self.path / "config"
+
+    def create(self, meta: dict):
+        if self.path.exists() and any(self.path.iterdir()):
+            raise FileExistsError(f"錄製目錄已存在且不為空: {self.path}")
+        self.path.mkdir(parents=True, exist_ok=True)
+        with open(self.meta_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=4, ensure_ascii=False)
+        self._events = open(self.events_path, "a", encoding="utf-8")
+        # 截圖在背景壓縮寫入，不拖慢錄製中的辨識
+        self._writer = FrameWriter(FrameStore(self.frames_dir, writable=True))
+
+    @property
+    def frame_count(self) -> int:
+        return self._writer.queued
+
+    def close(self):
+        events = getattr(self, "_events", None)
+        if events:
+            self._events = None
+            try:
+                self._writer.close()
+            finally:
+                events.close()
+
+    def snapshot_config(self, config_dir: Path):
+        if config_dir.exists():
+            shutil.copytree(
+                config_dir,
+                self.config_dir,
+                ignore=shutil.ignore_patterns("*.lock", "*.tmp"),
+                dirs_exist_ok=True,
+            )
+
+    def add_event(self, event: dict):
+        self._events.write(json.dumps(event, ensure_ascii=False) + "\n")
+        self._events.flush()
+
+    def add_frame(self, image: numpy.ndarray) -> int:
+        return self._writer.put(image, block=True)
+
+    def load_meta(self) -> dict:
+        with open(self.meta_path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def load_events(self) -> list[dict]:
+        events = []
+        with open(self.events_path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    events.append(json.loads(line))
+        return events
+
+    def open_frames(self) -> FrameStore:
+        return FrameStore(self.frames_dir)
+
+
+### 控制器 ###
+
+
+class RecordingController(CustomController):
+    """包裝真實的 AdbController，轉發所有操作並記錄截圖與動作"""
+
+    def __init__(self, inner: AdbController, archive: FrameArchive):
+        super().__init__()
+        self.inner = inner
+        self.archive = archive
+        self.start = time.perf_counter()
+        self.lock = threading.Lock()
+
+    def _record(self, event_type: str, **kwargs):
+        with self.lock:
+            self.archive.add_event(
+                {"ts": time.perf_counter() - self.start, "type": event_type, **kwargs}
+            )
+
+    def _forward(self, event_type: str, job, **kwargs) -> bool:
+        succeeded = job.wait().succeeded
+        self._record(event_type, **kwargs, succeeded=succeeded)
+        return succeeded
+
+    def mark_task(self, name: str, entry: str, status: str):
+        self._record("task", name=name, entry=entry, status=status)
+
+    def get_features(self) -> int:
+        # 直接轉發 click/swipe，錄製檔中保留原始動作
+        return MaaControllerFeatureEnum.Null
+
+    def connect(self) -> bool:
+        return self.inner.post_connection().wait().succeeded
+
+    def request_uuid(self) -> str:
+        return self.inner.uuid or "recording"
+
+    def start_app(self, intent: str) -> bool:
+        return self._forward(
+            "start_app", self.inner.post_start_app(intent), intent=intent
+        )
+
+    def stop_app(self, intent: str) -> bool:
+        return self._forward(
+            "stop_app", self.inner.post_stop_app(intent), intent=intent
+        )
+
+    def screencap(self) -> numpy.ndarray:
+        image = self.inner.post_screencap().wait().get()
+        with self.lock:
+            frame = self.archive.add_frame(image)
+        self._record("screencap", frame=frame)
+        return image
+
+    def click(self, x: int, y: int) -> bool:
+        return self._forward("click", self.inner.post_click(x, y), x=x, y=y)
+
+    def swipe(self, x1: int, y1: int, x2: int, y2: int, duration: int) -> bool:
+        job = self.inner.post_swipe(x1, y1, x2, y2, duration)
+        return self._forward(
+            "swipe", job, x1=x1, y1=y1, x2=x2, y2=y2, duration=duration
+        )
+
+    def touch_down(self, contact: int, x: int, y: int, pressure: int) -> bool:
+        job = self.inner.post_touch_down(x, y, contact, pressure)
+        return self._forward("touch_down", job, contact=contact, x=x, y=y)
+
+    def touch_move(self, contact: int, x: int, y: int, pressure: int) -> bool:
+        job = self.inner.post_touch_move(x, y, contact, pressure)
+        return self._forward("touch_move", job, contact=contact, x=x, y=y)
+
+    def touch_up(self, contact: int) -> bool:
+        job = self.inner.post_touch_up(contact)
+        return self._forward("touch_up", job, contact=contact)
+
+    def click_key(self, keycode: int) -> bool:
+        job = self.inner.post_click_key(keycode)
+        return self._forward("click_key", job, keycode=keycode)
+
+    def input_text(self, text: str) -> bool:
+        job = self.inner.post_input_text(text)
+        return self._forward("input_text", job, text=text)
+
+    def key_down(self, keycode: int) -> bool:
+        job = self.inner.post_key_down(keycode)
+        return self._forward("key_down", job, keycode=keycode)
+
+    def key_up(self, keycode: int) -> bool:
+        job = self.inner.post_key_up(keycode)
+        return self._forward("key_up", job, keycode=keycode)
+
+
+class ReplayController(CustomController):
+    """
+    代替 ADB 裝置，依 pipeline 的動作推進錄製檔：
+    - 截圖：回傳目前位置之後、下一個動作之前的下一張截圖，沒有則重複上一張
+    - 動作：在前方 lookahead 個動作內尋找同類型的動作並跳過去，找不到則記為分歧
+    """
+
+    def __init__(self, archive: FrameArchive, lookahead: int = 3):
+        super().__init__()
+        self.archive = archive
+        self.lookahead = lookahead
+        self.events = archive.load_events()
+        self.frames = archive.open_frames()
+        self.cursor = -1
+        self.frame = None
+        self.frame_index = None
+        self.last_advance = time.monotonic()
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.stats = {"screencaps": 0, "held": 0, "actions": 0, "divergences": 0}
+
+    def seek_task(self, name: str) -> bool:
+        """跳到錄製檔中該任務開始的位置"""
+        for i, event in enumerate(self.events):
+            if (
+                event["type"] == "task"
+                and event["name"] == name
+                and event["status"] == "start"
+            ):
+                self.cursor = i
+                self.last_advance = time.monotonic()
+                return True
+        return False
+
+    def stalled(self, timeout: float) -> bool:
+        return time.monotonic() - self.last_advance > timeout
+
+    def _advance(self, cursor: int):
+        self.cursor = cursor
+        self.last_advance = time.monotonic()
+
+    def _next_frame(self) -> int | None:
+        for i in range(self.cursor + 1, len(self.events)):
+            event_type = self.events[i]["type"]
+            if event_type == "screencap":
+                return i
+            if event_type in ACTION_TYPES or event_type == "task":
+                return None
+        return None
+
+    def _match_action(self, event_type: str) -> bool:
+        self.stats["actions"] += 1
+        seen = 0
+        for i in range(self.cursor + 1, len(self.events)):
+            event = self.events[i]
+            if event["type"] == "task":
+                break
+            if event["type"] not in ACTION_TYPES:
+                continue
+            if event["type"] == event_type:
+                self._advance(i)
+                return True
+            seen += 1
+            if seen >= self.lookahead:
+                break
+        self.stats["divergences"] += 1
+        return True
+
+    def get_features(self) -> int:
+        return MaaControllerFeatureEnum.Null
+
+    def connect(self) -> bool:
+        return True
+
+    def request_uuid(self) -> str:
+        return f"replay-{self.archive.path.name}"
+
+    def start_app(self, intent: str) -> bool:
+        return self._match_action("start_app")
+
+    def stop_app(self, intent: str) -> bool:
+        return self._match_action("stop_app")
+
+    def screencap(self) -> numpy.ndarray:
+        self.stats["screencaps"] += 1
+        cursor = self._next_frame()
+        if cursor is not None:
+            self._advance(cursor)
+            index = self.events[cursor]["frame"]
+            if index != self.frame_index:
+                self.frame = self.frames.read(index)
+                self.frame_index = index
+        elif self.frame is None:
+            # 任務開始前沒有截圖時，往後找第一張
+            for event in self.events[self.cursor + 1 :]:
+                if event["type"] == "screencap":
+                    self.frame_index = event["frame"]
+                    self.frame = self.frames.read(self.frame_index)
+                    break
+            else:
+                raise RuntimeError("錄製檔中沒有任何截圖")
+        else:
+            self.stats["held"] += 1
+        return self.frame
+
+    def click(self, x: int, y: int) -> bool:
+        return self._match_action("click")
+
+    def swipe(self, x1: int, y1: int, x2: int, y2: int, duration: int) -> bool:
+        return self._match_action("swipe")
+
+    def touch_down(self, contact: int, x: int, y: int, pressure: int) -> bool:
+        return self._match_action("touch_down")
+
+    def touch_move(self, contact: int, x: int, y: int, pressure: int) -> bool:
+        return self._match_action("touch_move")
+
+    def touch_up(self, contact: int) -> bool:
+        return self._match_action("touch_up")
+
+    def click_key(self, keycode: int) -> bool:
+        return self._match_action("click_key")
+
+    def input_text(self, text: str) -> bool:
+        return self._match_action("input_text")
+
+    def key_down(self, keycode: int) -> bool:
+        return self._match_action("key_down")
+
+    def key_up(self, keycode: int) -> bool:
+        return self._match_action("key_up")
+
+
+### 統計 ###
+
+
+class TimingSink(ContextEventSink):
+    """統計每個任務的辨識與動作耗時"""
+
+    def __init__(self):
+        self.pending = {}
+        self.reset()
+
+    def reset(self):
+        self.pending.clear()
+        self.reco_count = 0
+        self.reco_time = 0.0
+        self.action_time = 0.0
+
+    def _measure(self, key, noti_type: NotificationType) -> float:
+        if noti_type == NotificationType.Starting:
+            self.pending[key] = time.perf_counter()
+            return 0.0
+        start = self.pending.pop(key, None)
+        return time.perf_counter() - start if start is not None else 0.0
+
+    def on_node_recognition(self, context, noti_type, detail):
+        elapsed = self._measure(("reco", detail.task_id, detail.name), noti_type)
+        if noti_type != NotificationType.Starting:
+            self.reco_count += 1
+            self.reco_time += elapsed
+
+    def on_node_action(self, context, noti_type, detail):
+        self.action_time += self._measure(
+            ("action", detail.task_id, detail.name), noti_type
+        )
+
+
+### 任務設定 ###
+
+
+def read_task_options(config_dir: Path) -> dict:
+    """從 MFA 或 MaaPiCli 的設定讀取各任務選擇的選項"""
+    config_sources = [
+        (config_dir / "config.json", "TaskItems", "index"),
+        (config_dir / "maa_pi_config.json", "task", "value"),
+    ]
+    for config_path, task_key, option_key in config_sources:
+        if not config_path.exists():
+            continue
+        with open(config_path, encoding="utf-8") as f:
+            config = json.load(f)
+        options = {}
+        for task in config.get(task_key, []):
+            options[task["name"]] = {
+                item["name"]: item[option_key] for item in task.get("option", [])
+            }
+        return options
+    return {}
+
+
+def resolve_task(interface: dict, name: str, selected: dict) -> tuple[str, dict]:
+    """依 interface.json 與選擇的選項組出 entry 與 pipeline_override"""
+    return resolve_task_override(build_task_overrides(interface), name, selected)
+
+
+### 執行 ###
+
+
+def load_resource(resource_dir: Path) -> Resource:
+    if not (resource_dir / "model" / "ocr").exists():
+        print("找不到 OCR 模型，請先執行 tools/configure.py")
+    resource = Resource()
+    if not resource.post_bundle(resource_dir).wait().succeeded:
+        raise RuntimeError(f"載入資源失敗: {resource_dir}")
+    return resource
+
+
+def start_agent(resource: Resource, workdir: Path):
+    """
+    與正常執行相同，以子進程啟動 agent 並透過 AgentClient 連接，
+    agent 的工作目錄為 workdir
+    """
+
+    client = AgentClient()
+    client.bind(resource)
+    process = subprocess.Popen(
+        [sys.executable, str(Path(__file__).resolve()), "agent", client.identifier],
+        cwd=workdir,
+    )
+    if not client.connect():
+        process.kill()
+        raise RuntimeError("連接 agent 失敗")
+    return client, process
+
+
+def stop_agent(client: AgentClient, process: subprocess.Popen):
+    client.disconnect()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def run_agent(args):
+    """agent 子進程，對應 agent/main.py 的 run_agent，但不處理虛擬環境與依賴"""
+    if str(agent_dir) not in sys.path:
+        sys.path.insert(0, str(agent_dir))
+
+    from maa.agent.agent_server import AgentServer
+
+    import my_action
+    import my_reco
+
+    AgentServer.start_up(args.socket_id)
+    AgentServer.join()
+    AgentServer.shut_down()
+
+
+def prepare_workdir(workdir: Path, config_dir: Path):
+    """建立 agent 的工作目錄，避免回放時改動真實的 config"""
+    (workdir / "agent").mkdir(parents=True, exist_ok=True)
+    shutil.copy2(assets_dir / "interface.json", workdir)
+    for path in agent_dir.glob("*.json"):
+        shutil.copy2(path, workdir / "agent")
+    if config_dir.exists():
+        shutil.copytree(config_dir, workdir / "config", dirs_exist_ok=True)
+
+
+def run_task(tasker: Tasker, entry: str, override: dict, replay=None, stall=0.0):
+    """:return: (TaskDetail, 是否因回放停滯而中止)"""
+    job = tasker.post_task(entry, override)
+    while not job.done:
+        if replay is not None and replay.stalled(stall):
+            print(f"回放已 {stall:.0f}s 沒有前進，停止任務")
+            tasker.post_stop().wait()
+            return job.wait().get(), True
+        time.sleep(0.05)
+    return job.wait().get(), False
+
+
+def run_tasks(
+    tasker: Tasker, tasks: list[str], config_dir: Path, replay=None, stall=0.0
+):
+    with open(assets_dir / "interface.json", encoding="utf-8") as f:
+        interface = json.load(f)
+    selected = read_task_options(config_dir)
+
+    sink = TimingSink()
+    tasker.add_context_sink(sink)
+    controller = tasker.controller
+
+    reports = []
+    for name in tasks:
+        entry, override = resolve_task(interface, name, selected.get(name, {}))
+        sink.reset()
+        if replay is not None:
+            replay.reset_stats()
+            if not replay.seek_task(name):
+                print(f"錄製檔中沒有任務 {name}，從目前位置回放")
+        else:
+            controller.mark_task(name, entry, "start")
+
+        print(f"==== {name} ({entry}) ====")
+        start = time.perf_counter()
+        detail, stalled = run_task(tasker, entry, override, replay, stall)
+        wall_time = time.perf_counter() - start
+
+        succeeded = bool(detail and detail.status.succeeded) and not stalled
+        if replay is None:
+            controller.mark_task(name, entry, "done" if succeeded else "failed")
+        report = {
+            "task": name,
+            "entry": entry,
+            "succeeded": succeeded,
+            "wall_time": round(wall_time, 3),
+            "reco_time": round(sink.reco_time, 3),
+            "action_time": round(sink.action_time, 3),
+            "recognitions": sink.reco_count,
+            "nodes": len(detail.nodes) if detail else 0,
+        }
+        if replay is not None:
+            report.update(replay.stats)
+        reports.append(report)
+        print(json.dumps(report, ensure_ascii=False))
+    return reports
+
+
+def print_reports(reports: list[dict], baseline: list[dict] | None = None):
+    base = {r["task"]: r for r in baseline or []}
+    print(
+        f"{'任務':<12}{'結果':<6}{'總耗時':>10}{'辨識耗時':>10}{'辨識次數':>8}{'節點數':>8}"
+    )
+    for r in reports:
+        line = (
+            f"{r['task']:<12}{'OK' if r['succeeded'] else 'FAIL':<6}"
+            f"{r['wall_time']:>10.2f}{r['reco_time']:>10.2f}"
+            f"{r['recognitions']:>8}{r['nodes']:>8}"
+        )
+        if r["task"] in base:
+            b = base[r["task"]]
+            line += (
+                f"  (總耗時 {r['wall_time'] - b['wall_time']:+.2f}s，"
+                f"辨識 {r['reco_time'] - b['reco_time']:+.2f}s，"
+                f"節點 {r['nodes'] - b['nodes']:+d})"
+            )
+        print(line)
+
+
+def find_device(args) -> tuple[str, str, int, int, dict]:
+    if args.adb and args.address:
+        return (
+            args.adb,
+            args.address,
+            MaaAdbScreencapMethodEnum.Default,
+            MaaAdbInputMethodEnum.Default,
+            {},
+        )
+    devices = Toolkit.find_adb_devices()
+    if not devices:
+        raise RuntimeError("找不到 ADB 裝置，請使用 --adb 與 --address 指定")
+    device = devices[0]
+    print(f"使用裝置: {device.name} {device.address}")
+    return (
+        device.adb_path,
+        device.address,
+        device.screencap_methods,
+        device.input_methods,
+        device.config,
+    )
+
+
+def record(args):
+    archive = FrameArchive(args.archive)
+    archive.create(
+        {
+            "version": ARCHIVE_VERSION,
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "tasks": args.tasks,
+        }
+    )
+    archive.snapshot_config(assets_dir / "config")
+
+    Toolkit.init_option(str(assets_dir))
+    adb_path, address, screencap_methods, input_methods, config = find_device(args)
+    inner = AdbController(adb_path, address, screencap_methods, input_methods, config)
+    controller = RecordingController(inner, archive)
+    if not controller.post_connection().wait().succeeded:
+        raise RuntimeError("連接裝置失敗")
+
+    resource = load_resource(assets_dir / "resource" / "base")
+    # 錄製時使用真實的工作目錄，與正常執行相同
+    client, process = start_agent(resource, assets_dir)
+
+    tasker = Tasker()
+    tasker.bind(resource, controller)
+    if not tasker.inited:
+        raise RuntimeError("初始化 Tasker 失敗")
+
+    try:
+        reports = run_tasks(tasker, args.tasks, assets_dir / "config")
+    finally:
+        stop_agent(client, process)
+        archive.close()
+    print(f"共錄製 {archive.frame_count} 張截圖到 {archive.path}")
+    print_reports(reports)
+    return reports
+
+
+def replay(args):
+    archive = FrameArchive(args.archive)
+    meta = archive.load_meta()
+    if meta.get("version") != ARCHIVE_VERSION:
+        raise RuntimeError(f"不支援的錄製檔版本: {meta.get('version')}")
+    tasks = args.tasks or meta["tasks"]
+
+    resource = load_resource(assets_dir / "resource" / "base")
+    controller = ReplayController(archive, args.lookahead)
+    controller.post_connection().wait()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        workdir = Path(tmp_dir)
+        prepare_workdir(workdir, archive.config_dir)
+        client, process = start_agent(resource, workdir)
+
+        tasker = Tasker()
+        tasker.bind(resource, controller)
+        if not tasker.inited:
+            raise RuntimeError("初始化 Tasker 失敗")
+
+        try:
+            reports = run_tasks(
+                tasker, tasks, workdir / "config", controller, args.stall
+            )
+        finally:
+            stop_agent(client, process)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_reports(reports, baseline)
+    return reports
+
+
+def main():
+    parser = argparse.ArgumentParser(description="錄製真實執行的截圖與動作，並離線回放")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    record_parser = subparsers.add_parser("record", help="連接 ADB 裝置執行並錄製")
+    record_parser.add_argument("archive", type=Path, help="錄製檔目錄")
+    record_parser.add_argument("tasks", nargs="+", help="interface.json 中的任務名稱")
+    record_parser.add_argument("--adb", help="adb 路徑")
+    record_parser.add_argument("--address", help="裝置地址，例如 127.0.0.1:5555")
+
+    replay_parser = subparsers.add_parser("replay", help="使用錄製檔離線回放")
+    replay_parser.add_argument("archive", type=Path, help="錄製檔目錄")
+    replay_parser.add_argument("tasks", nargs="*", help="預設回放錄製時的所有任務")
+    replay_parser.add_argument(
+        "--lookahead", type=int, default=3, help="比對動作時最多往前看的動作數"
+    )
+    replay_parser.add_argument(
+        "--stall", type=float, default=30.0, help="回放多少秒沒有前進即停止任務"
+    )
+    replay_parser.add_argument("--baseline", type=Path, help="與先前的報告比較")
+
+    agent_parser = subparsers.add_parser("agent", help="內部使用：啟動 agent 子進程")
+    agent_parser.add_argument("socket_id")
+
+    for sub in (record_parser, replay_parser):
+        sub.add_argument("--output", type=Path, help="將報告寫入 JSON 檔案")
+        sub.add_argument("--verbose", action="store_true", help="顯示框架日誌")
+
+    args = parser.parse_args()
+    if args.command == "agent":
+        run_agent(args)
+        return
+
+    args.archive = args.archive.resolve()
+    if args.output:
+        args.output = args.output.resolve()
+    if getattr(args, "baseline", None):
+        args.baseline = args.baseline.resolve()
+
+    Tasker.set_stdout_level(
+        LoggingLevelEnum.All if args.verbose else LoggingLevelEnum.Error
+    )
+    Tasker.set_log_dir(args.archive / "logs")
+    # 辨識與動作的 context 事件只在除錯模式下發送
+    Tasker.set_debug_mode(True)
+
+    reports = record(args) if args.command == "record" else replay(args)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(reports, f, indent=4, ensure_ascii=False)
+
+    sys.exit(0 if all(r["succeeded"] for r in reports) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+import os
+import sys
+import json
+import time
+import argparse
+from pathlib import Path
+from datetime import datetime, timedelta
+
+current_script_dir = os.path.dirname(os.path.abspath(__file__))
+if current_script_dir not in sys.path:
+    sys.path.insert(0, current_script_dir)
+
+from record_replay import (
+    assets_dir,
+    load_resource,
+    start_agent,
+    stop_agent,
+    run_task,
+    find_device,
+    read_task_options,
+)
+from bundle_pipeline import load_split_pipeline, _names
+
+# agent 模組需在含有 interface.json 的目錄下執行
+os.chdir(assets_dir)
+
+from my_utils import GAME_TIMEZONE, build_task_overrides, resolve_task_override
+from my_period import PeriodEngine, next_boundary_ms
+from my_state import RECORD_PATH, read_json, update_json
+
+sys.stdout.reconfigure(encoding="utf-8")
+
+SCHEDULER_STATE_PATH = Path("config/scheduler_state.json")
+# 每次執行前都會先執行的任務，不參與排程
+PRELUDE_ENTRIES = ("StartUp",)
+# 沒有週期紀錄的任務視為每日任務，由排程器自行記錄
+UNTRACKED_PERIOD = "day"
+
+
+### 排程 ###
+
+
+def action_period_keys(action: str, overrides: dict, selected: dict) -> list:
+    """
+    自行判斷週期的自定義動作所使用的紀錄
+
+    :return: [(minos_data.json 中的路徑, period_type)]
+    """
+
+    if action == "BuySupplyOfficeProduct":
+        with open("agent/supplyoffice_products.json", encoding="utf-8") as f:
+            products = json.load(f)
+        keys = []
+        for key, item in products.items():
+            option = overrides["option"].get(key, {})
+            value = selected.get(key, option.get("default_case"))
+            if value == "Yes" or value == 0:
+                keys.append((("採購部", key), item["period_type"]))
+        return keys
+    if action == "RaidStormyMemories":
+        return [(("記憶風暴",), "day")]
+    return []
+
+
+def task_period_keys(
+    pipeline: dict, overrides: dict, name: str, selected: dict
+) -> list:
+    """
+    從任務 entry 沿著 next、interrupt、on_error 找出任務會檢查的週期紀錄
+
+    :return: [(minos_data.json 中的路徑, period_type)]
+    """
+
+    entry, override = resolve_task_override(overrides, name, selected)
+    keys, seen, stack = [], set(), [entry]
+    while stack:
+        node_name = stack.pop()
+        if node_name in seen:
+            continue
+        seen.add(node_name)
+        node = {**pipeline.get(node_name, {}), **override.get(node_name, {})}
+        if node.get("custom_recognition") == "VerifyTime":
+            param = node["custom_recognition_param"]
+            keys.append(((param["key"],), param["period_type"]))
+        if node.get("action") == "Custom":
+            keys += action_period_keys(node["custom_action"], overrides, selected)
+        for field in ("next", "interrupt", "on_error"):
+            stack += _names(node.get(field, []))
+    return list(dict.fromkeys(keys))
+
+
+def build_plan(tasks: list[str], selected: dict) -> dict:
+    """:return: {任務: [(路徑, period_type)]}，沒有週期紀錄的任務路徑為 None"""
+    with open("interface.json", encoding="utf-8") as f:
+        overrides = build_task_overrides(json.load(f))
+    pipeline, _ = load_split_pipeline(assets_dir / "resource" / "base" / "pipeline")
+
+    plan = {}
+    for name in tasks:
+        if overrides["task"][name]["entry"] in PRELUDE_ENTRIES:
+            continue
+        keys = task_period_keys(pipeline, overrides, name, selected.get(name, {}))
+        plan[name] = keys or [(None, UNTRACKED_PERIOD)]
+    return plan
+
+
+def period_key(name: str, path) -> str:
+    """:return: 週期引擎中使用的紀錄名稱"""
+    return "/".join(path) if path else f"(排程器)/{name}"
+
+
+def build_engine(plan: dict) -> PeriodEngine:
+    """:return: 已載入 minos_data.json 與排程器紀錄的週期引擎"""
+    record = read_json(RECORD_PATH) if RECORD_PATH.exists() else {}
+    state = read_json(SCHEDULER_STATE_PATH) if SCHEDULER_STATE_PATH.exists() else {}
+    engine = PeriodEngine(
+        {
+            period_key(name, path): period_type
+            for name, keys in plan.items()
+            for path, period_type in keys
+        }
+    )
+    engine.update(
+        {
+            period_key(name, path): last_time(record, state, name, path)
+            for name, keys in plan.items()
+            for path, _ in keys
+        }
+    )
+    return engine
+
+
+def last_time(record: dict, state: dict, name: str, path) -> int:
+    if path is None:
+        return state.get(name, 0)
+    for part in path:
+        record = record.get(part, {})
+    return record.get("last_purchased_time", 0)
+
+
+def due_tasks(plan: dict, engine: PeriodEngine, now: int) -> list[str]:
+    """:return: 任一週期紀錄已進入新週期的任務"""
+    due = set(engine.due_keys(now))
+    return [
+        name
+        for name, keys in plan.items()
+        if any(period_key(name, path) in due for path, _ in keys)
+    ]
+
+
+def next_wake(plan: dict, engine: PeriodEngine, now: int) -> int:
+    """:return: 下一次有紀錄到期的時間，全部已到期時為最早的下一次重置時間"""
+    wake = engine.next_wake(now)
+    if wake is not None:
+        return wake
+    period_types = {period_type for keys in plan.values() for _, period_type in keys}
+    return min(int(next_boundary_ms(now, period_type)) for period_type in period_types)
+
+
+def to_datetime(ts: int) -> datetime:
+    return datetime.fromtimestamp(ts / 1000, GAME_TIMEZONE)
+
+
+### 執行 ###
+
+
+def run_batch(args, tasks: list[str], due: list[str]) -> list[str]:
+    """
+    連接裝置並依任務清單的順序執行前置任務與到期的任務
+
+    :return: 失敗的任務
+    """
+
+    from maa.controller import AdbController
+    from maa.tasker import Tasker
+    from maa.toolkit import Toolkit
+
+    with open("interface.json", encoding="utf-8") as f:
+        overrides = build_task_overrides(json.load(f))
+    selected = read_task_options(assets_dir / "config")
+
+    Toolkit.init_option(str(assets_dir))
+    controller = AdbController(*find_device(args))
+    if not controller.post_connection().wait().succeeded:
+        raise RuntimeError("連接裝置失敗")
+    resource = load_resource(assets_dir / "resource" / "base")
+    client, process = start_agent(resource, assets_dir)
+
+    failed = []
+    try:
+        tasker = Tasker()
+        tasker.bind(resource, controller)
+        if not tasker.inited:
+            raise RuntimeError("初始化 Tasker 失敗")
+        for name in tasks:
+            entry, override = resolve_task_override(
+                overrides, name, selected.get(name, {})
+            )
+            if name not in due and entry not in PRELUDE_ENTRIES:
+                continue
+            print(f"==== {name} ({entry}) ====")
+            detail, _ = run_task(tasker, entry, override)
+            if not (detail and detail.status.succeeded):
+                print(f"{name} 執行失敗")
+                failed.append(name)
+            elif entry not in PRELUDE_ENTRIES:
+                with update_json(SCHEDULER_STATE_PATH) as state:
+                    state[name] = int(time.time() * 1000)
+    finally:
+        stop_agent(client, process)
+    return failed
+
+
+def sleep_until(target: datetime):
+    """分段等待，系統休眠或調整時間後仍會在正確的時間醒來"""
+    while True:
+        remaining = (target - datetime.now(GAME_TIMEZONE)).total_seconds()
+        if remaining <= 0:
+            return
+        time.sleep(min(remaining, 60))
+
+
+def print_plan(plan: dict, engine: PeriodEngine, now: int):
+    due = set(due_tasks(plan, engine, now))
+    print(f"{'任務':<12}{'狀態':<6}{'下次到期':<20}週期紀錄")
+    for name, keys in plan.items():
+        next_due = max(engine.next_due(period_key(name, path)) for path, _ in keys)
+        labels = ", ".join(
+            f"{period_key(name, path)}:{period_type}" for path, period_type in keys
+        )
+        print(
+            f"{name:<12}{'到期' if name in due else '-':<6}"
+            f"{to_datetime(max(next_due, now)):%Y-%m-%d %H:%M}    {labels}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="常駐執行，在遊戲重置時間醒來並只執行到期的任務"
+    )
+    parser.add_argument(
+        "tasks", nargs="*", help="interface.json 中的任務名稱，預設使用設定檔中的任務"
+    )
+    parser.add_argument("--adb", help="adb 路徑")
+    parser.add_argument("--address", help="裝置地址，例如 127.0.0.1:5555")
+    parser.add_argument(
+        "--grace", type=float, default=60.0, help="重置後延遲幾秒再執行"
+    )
+    parser.add_argument("--retry", type=float, default=600.0, help="任務失敗後幾秒重試")
+    parser.add_argument("--once", action="store_true", help="只執行一次到期的任務")
+    parser.add_argument("--dry-run", action="store_true", help="只顯示排程，不連接裝置")
+    args = parser.parse_args()
+
+    while True:
+        selected = read_task_options(assets_dir / "config")
+        tasks = args.tasks or list(selected)
+        if not tasks:
+            print("沒有要排程的任務，請指定任務或先在 MFA/MaaPiCli 中設定")
+            sys.exit(1)
+        plan = build_plan(tasks, selected)
+        engine = build_engine(plan)
+        now = engine.clock()
+
+        if args.dry_run:
+            print_plan(plan, engine, now)
+            print(
+                f"下次喚醒: {to_datetime(next_wake(plan, engine, now)):%Y-%m-%d %H:%M:%S}"
+            )
+            return
+
+        failed = []
+        due = due_tasks(plan, engine, now)
+        if due:
+            print(f"{to_datetime(now):%Y-%m-%d %H:%M:%S} 到期的任務: {', '.join(due)}")
+            try:
+                failed = run_batch(args, tasks, due)
+            except Exception as e:
+                print(f"執行失敗: {e}")
+                failed = due
+        if args.once:
+            sys.exit(1 if failed else 0)
+
+        # 執行後紀錄已更新，重新載入才能算出下一次到期的時間
+        engine = build_engine(plan)
+        now = engine.clock()
+        wake = to_datetime(next_wake(plan, engine, now)) + timedelta(seconds=args.grace)
+        if failed:
+            wake = min(wake, to_datetime(now) + timedelta(seconds=args.retry))
+        print(f"下次喚醒: {wake:%Y-%m-%d %H:%M:%S}")
+        sleep_until(wake)
+
+
+if __name__ == "__main__":
+    main()
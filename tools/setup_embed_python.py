@@ -1,11 +1,17 @@
 import os
+import re
 import sys
+import json
+import time
+import hashlib
 import platform
 import shutil
 import subprocess
+import urllib.error
 import urllib.request
 import zipfile
 import tarfile
+from urllib.parse import urlsplit
 import stat  # 用於在 macOS/Linux 上設定檔案權限
 
 sys.stdout.reconfigure(encoding="utf-8")
@@ -15,46 +21,190 @@ PYTHON_VERSION_TARGET = "3.13.7"  # 目標 Python 版本
 # python-build-standalone 的發佈標籤，需要與 PYTHON_VERSION_TARGET 相容
 # 前往 https://github.com/indygreg/python-build-standalone/releases 查看最新標籤和可用版本
 PYTHON_BUILD_STANDALONE_RELEASE_TAG = "20250828"
+PBS_RELEASE_URL = f"https://github.com/indygreg/python-build-standalone/releases/download/{PYTHON_BUILD_STANDALONE_RELEASE_TAG}"
 DEST_DIR = os.path.join("install", "python")  # Python 安裝的目標目錄
+# 下載快取，重新建置時直接使用已下載的封存檔
+CACHE_DIR = os.environ.get("MAA_DOWNLOAD_CACHE", os.path.join(".cache", "downloads"))
+DOWNLOAD_RETRIES = 5
+DOWNLOAD_TIMEOUT = 30
+# python-build-standalone 中 agent 用不到的標準函式庫目錄
+PBS_EXCLUDE = re.compile(r"^lib/python3\.\d+/(test|idlelib|turtledemo)/")
 
 
-def download_file(url, dest_path):
-    """下載檔案到指定路徑"""
-    print(f"正在下載: {url}")
-    print(f"儲存到: {dest_path}")
-    # 確保目標目錄存在
-    os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+def _cache_key(url, sha256=None):
+    """以網址與預期雜湊作為快取鍵，雜湊不同的同一網址不會互相覆蓋"""
+    return hashlib.sha256(f"{url}\n{sha256 or ''}".encode()).hexdigest()[:16]
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _fetch(url, part_path):
+    """
+    下載到 .part 檔，已有部分內容時以 Range 從中斷處繼續
+
+    :return: 是否從中斷處繼續
+    """
+
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    request = urllib.request.Request(url)
+    if offset:
+        request.add_header("Range", f"bytes={offset}-")
     try:
-        with urllib.request.urlopen(url) as response, open(dest_path, "wb") as out_file:
-            shutil.copyfileobj(response, out_file)
-        print("下載完成")
+        response = urllib.request.urlopen(request, timeout=DOWNLOAD_TIMEOUT)
     except urllib.error.HTTPError as e:
-        print(f"HTTP 錯誤 {e.code}: {e.reason} (URL: {url})")
-        raise
-    except urllib.error.URLError as e:
-        print(f"URL 錯誤: {e.reason} (URL: {url})")
-        raise
-    except Exception as e:
-        print(f"下載過程中發生錯誤: {e}")
-        raise
+        # 416: .part 已不符合伺服器上的檔案，從頭下載
+        if e.code != 416:
+            raise
+        os.remove(part_path)
+        return _fetch(url, part_path)
+
+    with response:
+        # 伺服器不支援 Range 時回傳 200 與完整內容
+        resumed = offset > 0 and response.status == 206
+        length = response.headers.get("Content-Length")
+        received = 0
+        with open(part_path, "ab" if resumed else "wb") as out_file:
+            for chunk in iter(lambda: response.read(1 << 20), b""):
+                out_file.write(chunk)
+                received += len(chunk)
+    # 連線提早關閉時 read 不會拋出例外，需要自行比對長度
+    if length is not None and received != int(length):
+        raise OSError(f"只收到 {received}/{length} bytes")
+    return resumed
+
+
+def download_file(url, sha256=None, cache_dir=CACHE_DIR):
+    """
+    下載檔案到快取目錄並回傳路徑，快取中已有且雜湊相符時不重新下載，
+    連線中斷時以 Range 從中斷處重試
+
+    :param sha256: 預期的雜湊，未指定時只檢查快取檔案沒有損壞
+    :return: 快取中的檔案路徑
+    """
+
+    entry_dir = os.path.join(cache_dir, _cache_key(url, sha256))
+    dest_path = os.path.join(entry_dir, os.path.basename(urlsplit(url).path))
+    meta_path = dest_path + ".json"
+    part_path = dest_path + ".part"
+
+    if os.path.exists(dest_path) and os.path.exists(meta_path):
+        with open(meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+        if _file_sha256(dest_path) == meta["sha256"]:
+            print(f"使用快取: {dest_path}")
+            return dest_path
+        print(f"快取檔案已損壞，重新下載: {dest_path}")
+        os.remove(dest_path)
 
+    print(f"正在下載: {url}")
+    print(f"儲存到: {dest_path}")
+    os.makedirs(entry_dir, exist_ok=True)
+    for attempt in range(1, DOWNLOAD_RETRIES + 1):
+        try:
+            if _fetch(url, part_path):
+                print("已從中斷處繼續下載")
+            break
+        except urllib.error.HTTPError as e:
+            print(f"HTTP 錯誤 {e.code}: {e.reason} (URL: {url})")
+            # 用戶端錯誤重試也不會成功
+            if e.code < 500 or attempt == DOWNLOAD_RETRIES:
+                raise
+        except (urllib.error.URLError, OSError) as e:
+            print(f"下載中斷: {e} (URL: {url})")
+            if attempt == DOWNLOAD_RETRIES:
+                raise
+        delay = 2 ** (attempt - 1)
+        print(f"{delay} 秒後重試 ({attempt}/{DOWNLOAD_RETRIES})")
+        time.sleep(delay)
+
+    actual = _file_sha256(part_path)
+    if sha256 and actual != sha256:
+        os.remove(part_path)
+        raise ValueError(f"雜湊不符: {actual}，預期 {sha256} (URL: {url})")
+    os.replace(part_path, dest_path)
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump({"url": url, "sha256": actual}, f)
+    print("下載完成")
+    return dest_path
+
+
+def _member_path(name, strip_prefix, exclude):
+    """
+    :return: 解壓後的相對路徑，不需要解壓時回傳 None
+    """
+
+    name = name.replace("\\", "/")
+    if strip_prefix:
+        if not name.startswith(strip_prefix):
+            return None
+        name = name[len(strip_prefix) :]
+    if not name or name.startswith("/") or ".." in name.split("/"):
+        return None
+    if exclude and exclude.search(name):
+        return None
+    return name
+
+
+def extract_zip(zip_path, dest_dir, strip_prefix="", exclude=None):
+    """
+    逐一解壓 ZIP 中需要的檔案
+
+    :param strip_prefix: 只解壓此前綴下的檔案並移除前綴
+    :param exclude: 符合此正規表示式的路徑不解壓
+    """
 
-def extract_zip(zip_path, dest_dir):
-    """解壓 ZIP 檔案"""
     print(f"正在解壓 ZIP: {zip_path} 到 {dest_dir}")
+    count = 0
     with zipfile.ZipFile(zip_path, "r") as zip_ref:
-        zip_ref.extractall(dest_dir)
-    print("ZIP 解壓完成")
-
+        for info in zip_ref.infolist():
+            name = _member_path(info.filename, strip_prefix, exclude)
+            if name is None or info.is_dir():
+                continue
+            target = os.path.join(dest_dir, name)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with zip_ref.open(info) as src, open(target, "wb") as dst:
+                shutil.copyfileobj(src, dst, 1 << 20)
+            count += 1
+    print(f"ZIP 解壓完成，共 {count} 個檔案")
+
+
+def extract_tar(tar_path, dest_dir, strip_prefix="", exclude=None):
+    """
+    以串流方式解壓 TAR (tar.gz, tar.xz, tar.bz2)，讀取時略過不需要的成員，
+    不需要先列出整個封存檔
+
+    :param strip_prefix: 只解壓此前綴下的檔案並移除前綴
+    :param exclude: 符合此正規表示式的路徑不解壓
+    """
 
-def extract_tar(tar_path, dest_dir):
-    """解壓 TAR (tar.gz, tar.xz, tar.bz2) 檔案"""
     print(f"正在解壓 TAR: {tar_path} 到 {dest_dir}")
+    count = 0
     try:
-        # 'r:*' 會自動檢測壓縮格式
-        with tarfile.open(tar_path, "r:*") as tar_ref:
-            tar_ref.extractall(path=dest_dir)
-        print("TAR 解壓完成")
+        # 'r|*' 以串流方式讀取並自動檢測壓縮格式
+        with tarfile.open(tar_path, "r|*") as tar_ref:
+            for member in tar_ref:
+                name = _member_path(member.name, strip_prefix, exclude)
+                if name is None:
+                    continue
+                member.name = name
+                if member.islnk():
+                    # 硬連結指向封存檔內的路徑，需要同樣移除前綴
+                    linkname = _member_path(member.linkname, strip_prefix, None)
+                    if linkname is None:
+                        continue
+                    member.linkname = linkname
+                if hasattr(tarfile, "data_filter"):
+                    tar_ref.extract(member, dest_dir, filter="data")
+                else:
+                    tar_ref.extract(member, dest_dir)
+                count += 1
+        print(f"TAR 解壓完成，共 {count} 個成員")
     except tarfile.ReadError as e:
         print(f"Tarfile 讀取錯誤: {e}，檔案可能已損壞或不是有效的 TAR 封存檔")
         raise
@@ -63,6 +213,27 @@ def extract_tar(tar_path, dest_dir):
         raise
 
 
+def fetch_pbs_sha256(filename):
+    """
+    從 python-build-standalone 發佈的 SHA256SUMS 取得檔案的雜湊
+
+    :return: 雜湊，無法取得時回傳 None，只檢查快取檔案沒有損壞
+    """
+
+    url = f"{PBS_RELEASE_URL}/SHA256SUMS"
+    try:
+        with open(download_file(url), encoding="utf-8") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 2 and parts[1] == filename:
+                    return parts[0]
+    except Exception as e:
+        print(f"無法取得 SHA256SUMS: {e}")
+        return None
+    print(f"SHA256SUMS 中沒有 {filename}")
+    return None
+
+
 def get_python_executable_path(base_dir, os_type):
     """取得已安裝 Python 環境中的可執行檔路徑"""
     if os_type == "Windows":
@@ -88,28 +259,22 @@ def ensure_pip(python_executable, python_install_dir):
         return False
 
     get_pip_url = "https://bootstrap.pypa.io/get-pip.py"
-    # 將 get-pip.py 下載到 Python 安裝目錄下，執行後再刪除
-    get_pip_script_path = os.path.join(python_install_dir, "get-pip.py")
 
     print(f"正在下載 get-pip.py 從 {get_pip_url}")
     try:
-        download_file(get_pip_url, get_pip_script_path)
+        get_pip_script_path = download_file(get_pip_url)
     except Exception as e:
         print(f"下載 get-pip.py 失敗: {e}")
         return False
 
     print("正在使用 get-pip.py 安裝 pip...")
     try:
-        # 在 Python 安裝目錄下執行 get-pip.py
         subprocess.run([python_executable, get_pip_script_path], check=True)
         print("pip 安裝成功")
         return True
     except (subprocess.CalledProcessError, OSError) as e:
         print(f"pip 安裝失敗: {e}")
         return False
-    finally:
-        if os.path.exists(get_pip_script_path):
-            os.remove(get_pip_script_path)  # 清理下載的腳本
 
 
 def main():
@@ -169,18 +334,13 @@ def main():
         print(f"使用 Windows 架構: {os_arch} -> {win_arch_suffix}")
 
         download_url = f"https://www.python.org/ftp/python/{PYTHON_VERSION_TARGET}/python-{PYTHON_VERSION_TARGET}-embed-{win_arch_suffix}.zip"
-        zip_filename = f"python-{PYTHON_VERSION_TARGET}-embed-{win_arch_suffix}.zip"
-        zip_filepath = os.path.join(DEST_DIR, zip_filename)  # 下載到目標目錄內再解壓
 
         try:
-            download_file(download_url, zip_filepath)
+            zip_filepath = download_file(download_url)
             extract_zip(zip_filepath, DEST_DIR)
         except Exception as e:
             print(f"Windows Python 下載或解壓失敗: {e}")
             return
-        finally:
-            if os.path.exists(zip_filepath):
-                os.remove(zip_filepath)
 
         # 修改 ._pth 檔
         # pth 檔名格式如: python312._pth for Python 3.12.x
@@ -237,38 +397,16 @@ def main():
 
         # 檔名格式: cpython-{PYTHON_VERSION}+{RELEASE_TAG_DATE}-{ARCH}-apple-darwin-install_only.tar.gz
         pbs_filename = f"cpython-{PYTHON_VERSION_TARGET}+{PYTHON_BUILD_STANDALONE_RELEASE_TAG}-{pbs_arch}-apple-darwin-install_only.tar.gz"
-        download_url = f"https://github.com/indygreg/python-build-standalone/releases/download/{PYTHON_BUILD_STANDALONE_RELEASE_TAG}/{pbs_filename}"
-        tar_filename = pbs_filename  # 使用原始檔名
-        tar_filepath = os.path.join(DEST_DIR, tar_filename)  # 下載到目標目錄內
+        download_url = f"{PBS_RELEASE_URL}/{pbs_filename}"
 
         try:
-            download_file(download_url, tar_filepath)
-            # python-build-standalone 的套件解壓后通常包含一个名為 'python' 的頂層目錄
-            # 需要將這個 'python' 目錄的內容移動到 DEST_DIR
-            temp_extract_dir = os.path.join(DEST_DIR, "_temp_extract")
-            os.makedirs(temp_extract_dir, exist_ok=True)
-            extract_tar(tar_filepath, temp_extract_dir)
-
-            extracted_python_root = os.path.join(temp_extract_dir, "python")
-            if os.path.isdir(extracted_python_root):
-                print(f"正在移動 {extracted_python_root} 的內容到 {DEST_DIR}")
-                for item_name in os.listdir(extracted_python_root):
-                    s = os.path.join(extracted_python_root, item_name)
-                    d = os.path.join(DEST_DIR, item_name)
-                    shutil.move(s, d)
-                shutil.rmtree(temp_extract_dir)  # 清理臨時解壓目錄
-            else:
-                print(f"錯誤: 解壓後未找到預期的 'python' 子目錄於 {temp_extract_dir}")
-                shutil.rmtree(temp_extract_dir)
-                return
+            tar_filepath = download_file(download_url, fetch_pbs_sha256(pbs_filename))
+            # python-build-standalone 的套件包含一個名為 'python' 的頂層目錄，
+            # 解壓時直接移除這層目錄並略過用不到的標準函式庫
+            extract_tar(tar_filepath, DEST_DIR, "python/", PBS_EXCLUDE)
         except Exception as e:
             print(f"macOS Python 下載或解壓失敗: {e}")
-            if os.path.exists(temp_extract_dir):
-                shutil.rmtree(temp_extract_dir)
             return
-        finally:
-            if os.path.exists(tar_filepath):
-                os.remove(tar_filepath)
 
         # 為 bin 目錄下的可執行檔設定執行權限
         bin_dir = os.path.join(DEST_DIR, "bin")
@@ -0,0 +1,190 @@
+import os
+import sys
+import json
+import time
+import argparse
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+
+import numpy
+
+current_script_dir = os.path.dirname(os.path.abspath(__file__))
+if current_script_dir not in sys.path:
+    sys.path.insert(0, current_script_dir)
+
+# 匯入時會切換到 assets 目錄
+from scheduler import (
+    build_plan,
+    period_key,
+    due_tasks,
+    next_wake,
+    to_datetime,
+    read_task_options,
+    assets_dir,
+)
+
+from my_utils import GAME_TIMEZONE, PERIOD_BOUNDARIES, is_new_period
+from my_period import HOUR_MS, PeriodEngine, next_boundary_ms
+
+sys.stdout.reconfigure(encoding="utf-8")
+
+# 記憶風暴以 05:00 作為一天的開始
+GAME_DAY_OFFSET = timedelta(hours=5)
+WEEK_DAYS = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+
+
+def game_day(ts: int):
+    """:return: ts 所屬的遊戲日，05:00 前視為前一天"""
+    return (to_datetime(ts) - GAME_DAY_OFFSET).date()
+
+
+def to_ms(dt: datetime) -> int:
+    return int(dt.timestamp() * 1000)
+
+
+### 模擬 ###
+
+
+def simulate(plan: dict, start: int, end: int, grace_ms: int) -> dict:
+    """
+    以虛擬時鐘重播排程器，只在有紀錄到期時醒來
+
+    :return: {遊戲日: Counter(wakes, tasks, keys, raids)}
+    """
+
+    with open("agent/stormymemories_level.json", encoding="utf-8") as f:
+        levels = json.load(f)
+
+    now = start
+    engine = PeriodEngine(
+        {
+            period_key(name, path): period_type
+            for name, keys in plan.items()
+            for path, period_type in keys
+        },
+        clock=lambda: now,
+    )
+    load = defaultdict(Counter)
+    while now < end:
+        due_keys = engine.due_keys()
+        tasks = due_tasks(plan, engine, now)
+        day = game_day(now)
+        load[day]["wakes"] += 1
+        load[day]["tasks"] += len(tasks)
+        load[day]["keys"] += len(due_keys)
+        if "記憶風暴" in due_keys:
+            week_day = WEEK_DAYS[day.weekday()]
+            load[day]["raids"] += sum(
+                week_day in item["week_days"] for item in levels.values()
+            )
+        engine.update({key: now for key in due_keys})
+        now = next_wake(plan, engine, now) + grace_ms
+    return load
+
+
+def print_load(load: dict):
+    print(f"{'日期':<12}{'星期':<6}{'喚醒':>6}{'任務':>6}{'紀錄':>6}{'掃蕩':>6}")
+    for day, count in sorted(load.items()):
+        print(
+            f"{day}  {WEEK_DAYS[day.weekday()]:<6}{count['wakes']:>6}"
+            f"{count['tasks']:>6}{count['keys']:>6}{count['raids']:>6}"
+        )
+
+    print("\n各星期平均")
+    by_week_day = defaultdict(list)
+    for day, count in load.items():
+        by_week_day[day.weekday()].append(count)
+    for week_day, counts in sorted(by_week_day.items()):
+        averages = "".join(
+            f"{sum(c[field] for c in counts) / len(counts):>8.2f}"
+            for field in ("wakes", "tasks", "keys", "raids")
+        )
+        print(f"{WEEK_DAYS[week_day]:<6}{averages}")
+
+    peak = sorted(load.items(), key=lambda item: -item[1]["keys"])[:5]
+    print("\n負載最高的日期")
+    for day, count in peak:
+        print(f"{day} {WEEK_DAYS[day.weekday()]}: {count['keys']} 筆紀錄到期")
+
+
+### 邊界檢查 ###
+
+
+def check_boundaries(start: int, end: int) -> int:
+    """
+    在每個重置時間前後比較陣列運算與 is_new_period 的結果
+
+    :return: 不一致的數量
+    """
+
+    offsets = numpy.array([-1000, -1, 0, 1, 1000])
+    elapsed = (0, 1, 1000, 6 * HOUR_MS, 24 * HOUR_MS, 7 * 24 * HOUR_MS)
+    mismatches = checked = 0
+    for period_type in PERIOD_BOUNDARIES:
+        boundaries, ts = [], start
+        while ts < end:
+            ts = int(next_boundary_ms(ts, period_type))
+            boundaries.append(ts)
+        samples = (numpy.array(boundaries)[:, None] + offsets).ravel()
+        following = next_boundary_ms(samples, period_type)
+        for last, boundary in zip(samples.tolist(), following.tolist()):
+            for delta in elapsed:
+                now = last + delta
+                expected = is_new_period(last, period_type, to_datetime(now))
+                checked += 1
+                if (boundary <= now) != expected:
+                    mismatches += 1
+                    print(
+                        f"不一致: {period_type} last={to_datetime(last)} "
+                        f"now={to_datetime(now)} is_new_period={expected}"
+                    )
+    print(f"檢查 {checked} 組重置邊界，{mismatches} 組不一致")
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="以虛擬時間模擬排程器，預估每天的執行負載並檢查重置邊界"
+    )
+    parser.add_argument(
+        "tasks", nargs="*", help="interface.json 中的任務名稱，預設使用全部任務"
+    )
+    parser.add_argument(
+        "--start",
+        type=datetime.fromisoformat,
+        default=None,
+        help="模擬開始時間，例如 2028-01-01T00:00，預設為現在",
+    )
+    parser.add_argument("--days", type=int, default=90, help="模擬天數")
+    parser.add_argument(
+        "--grace", type=float, default=60.0, help="重置後延遲幾秒再執行"
+    )
+    parser.add_argument(
+        "--check", action="store_true", help="只檢查重置邊界的判斷是否一致"
+    )
+    args = parser.parse_args()
+
+    start_time = args.start or datetime.now(GAME_TIMEZONE)
+    if start_time.tzinfo is None:
+        start_time = start_time.replace(tzinfo=GAME_TIMEZONE)
+    start = to_ms(start_time)
+    end = to_ms(start_time + timedelta(days=args.days))
+
+    if args.check:
+        sys.exit(1 if check_boundaries(start, end) else 0)
+
+    with open("interface.json", encoding="utf-8") as f:
+        interface = json.load(f)
+    selected = read_task_options(assets_dir / "config")
+    tasks = args.tasks or [task["name"] for task in interface["task"]]
+    plan = build_plan(tasks, selected)
+
+    begin = time.perf_counter()
+    load = simulate(plan, start, end, int(args.grace * 1000))
+    elapsed = (time.perf_counter() - begin) * 1000
+    print_load(load)
+    print(f"\n模擬 {args.days} 天共 {len(load)} 個遊戲日，耗時 {elapsed:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import multiprocessing
+from pathlib import Path
+
+assets_dir = Path(__file__).parent.parent.resolve() / "assets"
+agent_dir = assets_dir / "agent"
+
+# agent 模組需在含有 interface.json 的目錄下執行
+os.chdir(assets_dir)
+if str(agent_dir) not in sys.path:
+    sys.path.insert(0, str(agent_dir))
+
+from my_state import read_json, write_json, update_json
+
+sys.stdout.reconfigure(encoding="utf-8")
+
+
+def increment_worker(state_path, rounds):
+    """每輪在鎖內將 counter 加一"""
+    for _ in range(rounds):
+        with update_json(state_path) as data:
+            data["counter"] = data.get("counter", 0) + 1
+
+
+def crash_worker(state_path, payload_size):
+    """持續寫入較大的內容，等待被強制終止"""
+    payload = "x" * payload_size
+    while True:
+        with update_json(state_path) as data:
+            data["generation"] = data.get("generation", 0) + 1
+            data["payload"] = payload
+
+
+def check_concurrency(state_path, workers, rounds):
+    print(f"併發測試: {workers} 個進程，各 {rounds} 次更新")
+    start = time.perf_counter()
+    procs = [
+        multiprocessing.Process(target=increment_worker, args=(state_path, rounds))
+        for _ in range(workers)
+    ]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+    elapsed = time.perf_counter() - start
+
+    counter = read_json(state_path).get("counter", 0)
+    expected = workers * rounds
+    print(f"counter = {counter}，預期 {expected}，耗時 {elapsed:.2f}s")
+    return counter == expected
+
+
+def check_crash_safety(state_path, kills, payload_size):
+    print(f"崩潰測試: 強制終止寫入進程 {kills} 次")
+    write_json(state_path, {"generation": 0})
+    for i in range(kills):
+        p = multiprocessing.Process(
+            target=crash_worker, args=(state_path, payload_size)
+        )
+        p.start()
+        time.sleep(random.uniform(0.01, 0.2))
+        p.terminate()
+        p.join()
+
+        data = read_json(state_path, default=None)
+        if "generation" not in data:
+            print(f"第 {i + 1} 次終止後無法讀取有效資料")
+            return False
+    print(f"最終 generation = {read_json(state_path)['generation']}")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="狀態檔跨進程鎖與崩潰安全壓力測試")
+    parser.add_argument("--workers", type=int, default=8, help="併發進程數")
+    parser.add_argument("--rounds", type=int, default=200, help="每個進程的更新次數")
+    parser.add_argument("--kills", type=int, default=20, help="強制終止寫入進程的次數")
+    parser.add_argument(
+        "--payload-size", type=int, default=1 << 20, help="崩潰測試的寫入大小 (bytes)"
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        state_path = Path(tmp_dir) / "minos_data.json"
+        ok = check_concurrency(state_path, args.workers, args.rounds)
+        ok = check_crash_safety(state_path, args.kills, args.payload_size) and ok
+
+    if ok:
+        print("==== 壓力測試通過 ====")
+        sys.exit(0)
+    else:
+        print("==== 壓力測試失敗 ====")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
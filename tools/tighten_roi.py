@@ -0,0 +1,472 @@
+import re
+import sys
+import json
+import time
+import hashlib
+import argparse
+import statistics
+from pathlib import Path
+
+import numpy
+
+from maa.define import MaaControllerFeatureEnum
+from maa.controller import CustomController
+from maa.custom_action import CustomAction
+from maa.resource import Resource
+from maa.tasker import Tasker, LoggingLevelEnum
+
+from record_replay import assets_dir, agent_dir, load_resource
+from my_frame_store import FrameStore
+
+pipeline_dir = assets_dir / "resource" / "base" / "pipeline"
+
+# 只處理以 roi 範圍為成本的辨識演算法
+SUPPORTED_RECOGNITIONS = ("OCR", "TemplateMatch", "FeatureMatch", "ColorMatch")
+# 覆蓋時可合併的欄位，不同任務的 pipeline_override 只會改這些
+VARIANT_FIELDS = ("expected", "template")
+SCREEN_SIZE = (1280, 720)
+PROBE_NODE = "TightenRoiProbe"
+
+
+### 截圖來源 ###
+
+
+def find_stores(sources: list[Path]) -> list[Path]:
+    """錄製檔、FrameStore 目錄或 debug/postmortem 皆可，往下尋找所有 frames.idx"""
+    stores = []
+    for source in sources:
+        if (source / "frames.idx").exists():
+            stores.append(source)
+        else:
+            stores.extend(sorted(p.parent for p in source.rglob("frames.idx")))
+    return stores
+
+
+def load_frames(sources: list[Path], max_frames: int) -> list[numpy.ndarray]:
+    """讀取所有截圖，去除重複畫面後平均取樣至 max_frames 張"""
+    frames = []
+    seen = set()
+    skipped = 0
+    for path in find_stores(sources):
+        with FrameStore(path) as store:
+            for i in range(len(store)):
+                height, width = store.shape(i)[:2]
+                if (width, height) != SCREEN_SIZE:
+                    skipped += 1
+                    continue
+                image = store.read(i)
+                digest = hashlib.blake2b(image[::4, ::4].tobytes(), digest_size=16)
+                if digest.digest() in seen:
+                    continue
+                seen.add(digest.digest())
+                frames.append(image)
+    if skipped:
+        print(f"略過 {skipped} 張非 {SCREEN_SIZE[0]}x{SCREEN_SIZE[1]} 的截圖")
+    if max_frames and len(frames) > max_frames:
+        step = len(frames) / max_frames
+        frames = [frames[int(i * step)] for i in range(max_frames)]
+    return frames
+
+
+### 節點 ###
+
+
+def load_pipeline() -> dict[str, tuple[Path, dict]]:
+    nodes = {}
+    for path in sorted(pipeline_dir.rglob("*.json")):
+        with open(path, encoding="utf-8") as f:
+            for name, node in json.load(f).items():
+                nodes[name] = (path, node)
+    return nodes
+
+
+def collect_overrides(data, found: list[dict]):
+    """遞迴收集所有 pipeline_override"""
+    if isinstance(data, dict):
+        for key, value in data.items():
+            if key == "pipeline_override" and isinstance(value, dict):
+                found.append(value)
+            else:
+                collect_overrides(value, found)
+    elif isinstance(data, list):
+        for value in data:
+            collect_overrides(value, found)
+
+
+def load_variants() -> tuple[dict[str, dict], set[str]]:
+    """
+    :return: (各節點在 interface.json 與 agent 設定中出現過的 expected / template，
+        會被覆蓋 roi 的節點)
+    """
+
+    overrides = []
+    for path in [assets_dir / "interface.json", *sorted(agent_dir.glob("*.json"))]:
+        with open(path, encoding="utf-8") as f:
+            collect_overrides(json.load(f), overrides)
+
+    variants = {}
+    roi_overridden = set()
+    for override in overrides:
+        for name, fields in override.items():
+            if not isinstance(fields, dict):
+                continue
+            if "roi" in fields:
+                roi_overridden.add(name)
+            for field in VARIANT_FIELDS:
+                if field in fields:
+                    variants.setdefault(name, {}).setdefault(field, []).append(
+                        fields[field]
+                    )
+
+    # agent 程式中以 {"節點": {"roi": ...}} 動態覆蓋的節點
+    for path in agent_dir.glob("*.py"):
+        source = path.read_text(encoding="utf-8")
+        roi_overridden.update(re.findall(r'"(\w+)":\s*\{\s*"roi"', source))
+    return variants, roi_overridden
+
+
+def as_list(value) -> list:
+    return value if isinstance(value, list) else [value]
+
+
+def probe_override(node: dict, variants: dict) -> dict:
+    """合併所有任務的 expected / template，一次辨識即可涵蓋所有變體"""
+    override = {}
+    for field, values in variants.items():
+        merged = []
+        for value in [node.get(field), *values]:
+            for item in as_list(value) if value is not None else []:
+                if item not in merged:
+                    merged.append(item)
+        override[field] = merged
+    return override
+
+
+def select_nodes(pipeline: dict, names: list[str] | None, roi_overridden: set[str]):
+    """:return: (可處理的節點名稱, {略過的節點: 原因})"""
+    selected, skipped = [], {}
+    for name in names or pipeline:
+        if name not in pipeline:
+            skipped[name] = "找不到節點"
+            continue
+        node = pipeline[name][1]
+        if node.get("recognition", "DirectHit") not in SUPPORTED_RECOGNITIONS:
+            continue
+        roi = node.get("roi")
+        if not (isinstance(roi, list) and len(roi) == 4):
+            skipped[name] = "roi 不是固定範圍"
+        elif "roi_offset" in node:
+            skipped[name] = "使用 roi_offset"
+        elif node.get("only_rec"):
+            skipped[name] = "only_rec 需要精確的 roi"
+        elif name in roi_overridden:
+            skipped[name] = "roi 會被動態覆蓋"
+        else:
+            selected.append(name)
+    return selected, skipped
+
+
+### ROI 計算 ###
+
+
+def union_box(boxes: list[list[int]]) -> list[int]:
+    x1 = min(b[0] for b in boxes)
+    y1 = min(b[1] for b in boxes)
+    x2 = max(b[0] + b[2] for b in boxes)
+    y2 = max(b[1] + b[3] for b in boxes)
+    return [x1, y1, x2 - x1, y2 - y1]
+
+
+def expand_roi(box: list[int], margin: int, limit: list[int]) -> list[int]:
+    """向外擴張 margin，且不超出原本的 roi"""
+    x1 = max(box[0] - margin, limit[0])
+    y1 = max(box[1] - margin, limit[1])
+    x2 = min(box[0] + box[2] + margin, limit[0] + limit[2])
+    y2 = min(box[1] + box[3] + margin, limit[1] + limit[3])
+    return [x1, y1, x2 - x1, y2 - y1]
+
+
+def area(roi: list[int]) -> int:
+    return roi[2] * roi[3]
+
+
+### 在任務中執行辨識 ###
+
+
+class StillController(CustomController):
+    """只提供黑色畫面，辨識使用的截圖由 run_recognition 直接傳入"""
+
+    def get_features(self) -> int:
+        return MaaControllerFeatureEnum.Null
+
+    def connect(self) -> bool:
+        return True
+
+    def request_uuid(self) -> str:
+        return "tighten-roi"
+
+    def start_app(self, intent: str) -> bool:
+        return True
+
+    def stop_app(self, intent: str) -> bool:
+        return True
+
+    def screencap(self) -> numpy.ndarray:
+        return numpy.zeros((SCREEN_SIZE[1], SCREEN_SIZE[0], 3), numpy.uint8)
+
+    def click(self, x: int, y: int) -> bool:
+        return True
+
+    def swipe(self, x1: int, y1: int, x2: int, y2: int, duration: int) -> bool:
+        return True
+
+    def touch_down(self, contact: int, x: int, y: int, pressure: int) -> bool:
+        return True
+
+    def touch_move(self, contact: int, x: int, y: int, pressure: int) -> bool:
+        return True
+
+    def touch_up(self, contact: int) -> bool:
+        return True
+
+    def click_key(self, keycode: int) -> bool:
+        return True
+
+    def input_text(self, text: str) -> bool:
+        return True
+
+    def key_down(self, keycode: int) -> bool:
+        return True
+
+    def key_up(self, keycode: int) -> bool:
+        return True
+
+
+class ProbeAction(CustomAction):
+    """Context 只能在任務中取得，以自定義動作執行 job(context)"""
+
+    def __init__(self, job):
+        super().__init__()
+        self.job = job
+        self.error = None
+
+    def run(self, context, argv) -> bool:
+        try:
+            self.job(context)
+        except Exception as e:
+            # 框架會吞掉動作中的例外，留給 run_in_context 重新拋出
+            self.error = e
+            return False
+        return True
+
+
+def run_in_context(resource: Resource, job):
+    """以只有黑色畫面的控制器建立 Tasker，在任務中執行 job(context)"""
+    controller = StillController()
+    controller.post_connection().wait()
+    tasker = Tasker()
+    tasker.bind(resource, controller)
+    if not tasker.inited:
+        raise RuntimeError("初始化 Tasker 失敗")
+
+    action = ProbeAction(job)
+    resource.register_custom_action(PROBE_NODE, action)
+    task = tasker.post_task(
+        PROBE_NODE,
+        {
+            PROBE_NODE: {
+                "recognition": "DirectHit",
+                "action": "Custom",
+                "custom_action": PROBE_NODE,
+            }
+        },
+    )
+    succeeded = task.wait().succeeded
+    resource.unregister_custom_action(PROBE_NODE)
+    if action.error:
+        raise action.error
+    if not succeeded:
+        raise RuntimeError("執行辨識失敗")
+
+
+def probe(context, name: str, frames, override: dict) -> tuple[list, list, float]:
+    """
+    :return: (每張截圖的命中框列表，未命中為 None, 命中的截圖編號, 每次辨識耗時中位數 ms)
+    """
+
+    boxes, hits, samples = [], [], []
+    for i, image in enumerate(frames):
+        start = time.perf_counter()
+        detail = context.run_recognition(name, image, {name: override})
+        samples.append((time.perf_counter() - start) * 1000)
+        if detail and detail.hit:
+            results = detail.filtered_results or [detail]
+            boxes.append([list(r.box) for r in results if r.box])
+            hits.append(i)
+        else:
+            boxes.append(None)
+    return boxes, hits, statistics.median(samples) if samples else 0.0
+
+
+def tighten(context, pipeline, names, variants, frames, args) -> list[dict]:
+    reports = []
+    for name in names:
+        node = pipeline[name][1]
+        roi = node["roi"]
+        override = {"roi": roi, **probe_override(node, variants.get(name, {}))}
+        report = {"node": name, "roi": roi, "new_roi": None, "hits": 0}
+        reports.append(report)
+
+        # 收緊前後都以全部截圖計時，耗時的差異才只來自 roi
+        boxes, hits, before_ms = probe(context, name, frames, override)
+        report.update(hits=len(hits), timed=len(frames), before_ms=before_ms)
+        if len(hits) < args.min_hits:
+            report["reason"] = "命中次數不足"
+            continue
+
+        union = union_box([b for i in hits for b in boxes[i]])
+        margin = args.margin
+        # 收緊後需在所有原本命中的截圖上仍然命中，否則加大邊界重試
+        for _ in range(args.retries + 1):
+            new_roi = expand_roi(union, margin, roi)
+            if area(new_roi) >= area(roi) * args.min_gain:
+                report["reason"] = "縮小幅度不足"
+                break
+            new_boxes, new_hits, after_ms = probe(
+                context, name, frames, {**override, "roi": new_roi}
+            )
+            missed = set(hits) - set(new_hits)
+            if not missed:
+                report.update(new_roi=new_roi, after_ms=after_ms, margin=margin)
+                report.pop("reason", None)
+                break
+            report["reason"] = f"收緊後有 {len(missed)} 張未命中"
+            margin *= 2
+    return reports
+
+
+def run_probe(frames, names, pipeline, variants, args) -> list[dict]:
+    resource = load_resource(assets_dir / "resource" / "base")
+    reports = []
+    run_in_context(
+        resource,
+        lambda context: reports.extend(
+            tighten(context, pipeline, names, variants, frames, args)
+        ),
+    )
+    return reports
+
+
+### 輸出 ###
+
+
+def print_reports(reports: list[dict], skipped: dict[str, str]):
+    print(
+        f"{'節點':<36}{'命中':>6}{'原 roi':>22}{'新 roi':>22}"
+        f"{'面積':>8}{'計時張數':>10}{'原耗時':>10}{'新耗時':>10}"
+    )
+    total_before = total_after = 0.0
+    for r in reports:
+        before = r.get("before_ms", 0.0)
+        after = r.get("after_ms", before)
+        total_before += before
+        total_after += after
+        new_roi = r["new_roi"]
+        ratio = f"{area(new_roi) / area(r['roi']):.0%}" if new_roi else "-"
+        line = (
+            f"{r['node']:<36}{r['hits']:>6}{str(r['roi']):>22}"
+            f"{str(new_roi) if new_roi else '-':>22}{ratio:>8}"
+            f"{r.get('timed', 0):>10}{before:>10.2f}{after:>10.2f}"
+        )
+        if r.get("reason"):
+            line += f"  ({r['reason']})"
+        print(line)
+    for name, reason in skipped.items():
+        print(f"{name:<36}  略過：{reason}")
+    if total_before:
+        print(
+            f"每個節點各辨識一次的總耗時：{total_before:.2f} ms -> {total_after:.2f} ms "
+            f"({(total_after - total_before) / total_before:+.1%})，"
+            f"收緊前後皆以同樣 {max(r.get('timed', 0) for r in reports)} 張截圖計時"
+        )
+
+
+def build_patch(reports: list[dict]) -> dict:
+    return {r["node"]: {"roi": r["new_roi"]} for r in reports if r["new_roi"]}
+
+
+def apply_patch(patch: dict, pipeline: dict):
+    """只替換節點中的 roi 欄位，保留原檔案其餘的格式"""
+    by_file = {}
+    for name, fields in patch.items():
+        by_file.setdefault(pipeline[name][0], {})[name] = fields["roi"]
+
+    for path, rois in by_file.items():
+        text = path.read_text(encoding="utf-8")
+        for name, roi in rois.items():
+            start = text.index(f'"{name}": {{')
+            match = re.compile(r'"roi":\s*\[[^\]]*\]').search(text, start)
+            text = (
+                text[: match.start()]
+                + f'"roi": [{", ".join(map(str, roi))}]'
+                + text[match.end() :]
+            )
+        data = json.loads(text)
+        for name, roi in rois.items():
+            if data[name]["roi"] != roi:
+                raise RuntimeError(f"替換 {path.name} 的 {name} 失敗")
+        path.write_text(text, encoding="utf-8")
+        print(f"已更新 {path.relative_to(assets_dir)}：{', '.join(rois)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="以錄製的截圖找出節點實際命中的位置，收緊辨識範圍"
+    )
+    parser.add_argument(
+        "sources", nargs="+", type=Path, help="錄製檔、FrameStore 或其上層目錄"
+    )
+    parser.add_argument("--nodes", nargs="+", help="只處理指定節點，預設為全部")
+    parser.add_argument("--margin", type=int, default=8, help="命中範圍外保留的邊界")
+    parser.add_argument(
+        "--min-hits", type=int, default=3, help="命中少於此次數的節點不收緊"
+    )
+    parser.add_argument(
+        "--min-gain", type=float, default=0.8, help="新面積需小於原面積的比例"
+    )
+    parser.add_argument(
+        "--retries", type=int, default=2, help="驗證失敗時加倍邊界重試的次數"
+    )
+    parser.add_argument(
+        "--max-frames", type=int, default=300, help="去除重複後最多使用的截圖數"
+    )
+    parser.add_argument(
+        "--output", type=Path, default=Path("roi_patch.json"), help="輸出的覆蓋檔"
+    )
+    parser.add_argument("--apply", action="store_true", help="直接寫回 pipeline")
+    args = parser.parse_args()
+
+    Tasker.set_stdout_level(LoggingLevelEnum.Error)
+
+    frames = load_frames(args.sources, args.max_frames)
+    if not frames:
+        print("找不到可用的截圖")
+        sys.exit(1)
+    pipeline = load_pipeline()
+    variants, roi_overridden = load_variants()
+    names, skipped = select_nodes(pipeline, args.nodes, roi_overridden)
+    print(f"使用 {len(frames)} 張截圖檢查 {len(names)} 個節點")
+
+    reports = run_probe(frames, names, pipeline, variants, args)
+    print_reports(reports, skipped)
+
+    patch = build_patch(reports)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(patch, f, indent=4, ensure_ascii=False)
+    print(f"已將 {len(patch)} 個節點的新 roi 寫入 {args.output}")
+    if args.apply and patch:
+        apply_patch(patch, pipeline)
+
+
+if __name__ == "__main__":
+    main()